@@ -1,6 +1,9 @@
 """Endpoints and functions concerning commands run in external processes."""
 import redis
-from flask import jsonify, Blueprint
+from flask import jsonify, Blueprint, current_app
+
+from gn3.commands import compute_job_queue
+from gn3.job_queue import queue_stats
 
 async_commands = Blueprint("async_commands", __name__)
 
@@ -14,3 +17,10 @@ def command_state(command_id):
                 error="The command id provided does not exist.",
                 status="error"), 404
         return jsonify(dict(state.items()))
+
+@async_commands.route("/stats")
+def command_queue_stats():
+    """Respond with the depth of the queue, the number of running commands and
+    the wait times, per job class (see `gn3.job_queue`)."""
+    with redis.Redis(decode_responses=True) as rconn:
+        return jsonify(queue_stats(rconn, compute_job_queue(current_app)))
@@ -4,20 +4,29 @@ import sys
 import logging
 from functools import reduce
 
+import lmdb
+
 import redis
 from flask import jsonify
 from flask import Blueprint
 from flask import request
 from flask import current_app
 
+from gn3 import phenodb
+from gn3 import dataset_matrices
+from gn3 import correlation_cache
 from gn3.db_utils import database_connection
 from gn3.commands import run_sample_corr_cmd
 from gn3.responses.pcorrs_responses import build_response
 from gn3.computations.correlations import map_shared_keys_to_values
 from gn3.computations.correlations import compute_tissue_correlation
 from gn3.computations.correlations import compute_all_lit_correlation
+from gn3.computations.correlations import VECTORISED_METHODS
+from gn3.computations.matrix_correlations import (
+    compute_dataset_sample_correlation)
 from gn3.commands import (
-    run_async_cmd, compute_job_queue, compose_pcorrs_command)
+    run_async_cmd, compute_job_queue, compose_pcorrs_command,
+    async_job_dedup_ttl)
 
 correlation = Blueprint("correlation", __name__)
 
@@ -39,6 +48,25 @@ def compute_sample_integration(corr_method="pearson"):
     return jsonify(correlation_results)
 
 
+def __top_n__():
+    """Retrieve the optional `top_n` argument, which limits the number of
+    correlation results returned, from the request's query string."""
+    return request.args.get("top_n", default=None, type=int)
+
+
+def __cached__(kind, method, primary_hash, dataset_identity, compute):
+    """Get the `kind` of correlation results of the primary trait with
+    `primary_hash` against the dataset with `dataset_identity` from the shared
+    cache, or `compute` them. See `gn3.correlation_cache`."""
+    ttl = current_app.config.get("CORRELATION_CACHE_TTL", 0)
+    if not ttl:
+        return compute()
+    with redis.Redis.from_url(current_app.config["REDIS_URI"]) as conn:
+        return correlation_cache.cached(
+            conn, (kind, method, primary_hash, dataset_identity, __top_n__()),
+            compute, ttl, current_app.config["CORRELATION_CACHE_MAX_BYTES"])
+
+
 @correlation.route("/sample_r/<string:corr_method>", methods=["POST"])
 def compute_sample_r(corr_method="pearson"):
     """Correlation endpoint for computing sample r correlations\
@@ -51,8 +79,114 @@ def compute_sample_r(corr_method="pearson"):
     this_trait_data = correlation_input.get("this_trait")
     target_dataset_data = correlation_input.get("target_dataset")
 
-    correlation_results = run_sample_corr_cmd(
-        corr_method, this_trait_data, target_dataset_data)
+    correlation_results = __cached__(
+        "sample", corr_method,
+        correlation_cache.values_hash(this_trait_data),
+        correlation_cache.content_hash(request.get_data()),
+        lambda: run_sample_corr_cmd(
+            corr_method, this_trait_data, target_dataset_data, __top_n__()))
+
+    return jsonify({
+        "corr_results": correlation_results
+    })
+
+
+def __build_dataset_matrix__(dataset_name: str, version: str):
+    """Queue the (re)building of the dataset's matrix, at its data `version`.
+    Identical builds are only run once (see `gn3.commands.queue_cmd`)."""
+    with redis.Redis.from_url(current_app.config["REDIS_URI"]) as conn:
+        run_async_cmd(
+            conn=conn,
+            cmd=(sys.executable, "-m", "scripts.dataset_matrices",
+                 current_app.config["SQL_URI"],
+                 current_app.config["DATASET_MATRICES_DIR"], dataset_name,
+                 "--redis-uri", current_app.config["REDIS_URI"]),
+            job_queue=compute_job_queue(current_app),
+            options={
+                "env": {**os.environ, "PYTHONPATH": ":".join(sys.path)},
+                "dedup_ttl": async_job_dedup_ttl(current_app),
+                "dedup_extra": (version,)},
+            log_level=logging.getLevelName(
+                current_app.logger.getEffectiveLevel()).lower())
+
+
+def __dataset_matrix__(dataset_name: str):
+    """Get the dataset's precomputed matrix (see `gn3.dataset_matrices`), if
+    the matrices are enabled, the dataset exists and its matrix is up to date.
+
+    A missing or out of date matrix is not built in the request: its building
+    is queued, and the matrix used once it is built."""
+    if not current_app.config["DATASET_MATRICES_DIR"]:
+        return None
+    try:
+        with database_connection(
+                current_app.config["SQL_URI"], logger=current_app.logger) as conn:
+            version, pheno = dataset_matrices.current_matrix(
+                conn, current_app.config["DATASET_MATRICES_DIR"], dataset_name,
+                redis_uri=current_app.config["REDIS_URI"])
+        if version is not None and pheno is None:
+            __build_dataset_matrix__(dataset_name, version)
+        return pheno
+    except (OSError, lmdb.Error, KeyError, redis.RedisError) as _err:
+        current_app.logger.warning(
+            "Could not get the matrix for '%s': %s", dataset_name, _err)
+        return None
+
+
+@correlation.route("/sample_r/lmdb/<string:corr_method>", methods=["POST"])
+def compute_sample_r_against_lmdb(corr_method="pearson"):
+    """Compute the sample r correlations of a trait against a whole dataset,
+    reading the dataset from the LMDB phenotype store (`LMDB_DATA_PATH`) on the
+    server, rather than receiving it in the request. Datasets that are not in
+    the store are read from their precomputed matrices (see
+    `gn3.dataset_matrices`), if those are enabled.
+
+    The api expects the trait data and the name of the target dataset, i.e.
+
+        {"this_trait": {"trait_id": …, "trait_sample_data": {…}},
+         "target_dataset": "BXDPublish"}
+
+    and responds with the same structure as the `/sample_r` endpoint. Pass
+    `top_n` in the query string to only get that many of the strongest
+    correlations.
+    """
+    correlation_input = request.get_json(silent=True) or {}
+    this_trait_data = correlation_input.get("this_trait")
+    target_dataset = correlation_input.get("target_dataset")
+    if corr_method not in VECTORISED_METHODS or not (
+            isinstance(this_trait_data, dict)
+            and isinstance(this_trait_data.get("trait_sample_data"), dict)
+            and isinstance(target_dataset, str)):
+        return jsonify({
+            "error": "Invalid request",
+            "error_description": (
+                f"Expected one of the methods {', '.join(VECTORISED_METHODS)}"
+                ", and a JSON object with the keys 'this_trait' and "
+                "'target_dataset'.")
+        }), 400
+
+    try:
+        pheno = phenodb.reader(os.path.join(
+            current_app.config["LMDB_DATA_PATH"], target_dataset))
+    except (OSError, lmdb.Error, KeyError):
+        pheno = __dataset_matrix__(target_dataset)
+    if pheno is None:
+        return jsonify({
+            "error": "NotFound",
+            "error_description": (
+                f"Dataset '{target_dataset}' was not found in the LMDB "
+                "phenotype store, or its precomputed matrix is not built yet.")
+        }), 404
+
+    def __compute__():
+        with pheno.matrix() as matrix:
+            return compute_dataset_sample_correlation(
+                this_trait_data, pheno.strains, pheno.traits, matrix,
+                corr_method, __top_n__())
+
+    correlation_results = __cached__(
+        "sample", corr_method, correlation_cache.values_hash(this_trait_data),
+        {"lmdb": target_dataset, "version": pheno.version}, __compute__)
 
     return jsonify({
         "corr_results": correlation_results
@@ -70,9 +204,12 @@ def compute_lit_corr(species=None, gene_id=None):
         target_traits_gene_ids = request.get_json()
         target_trait_gene_list = list(target_traits_gene_ids.items())
 
-        lit_corr_results = compute_all_lit_correlation(
-            conn=conn, trait_lists=target_trait_gene_list,
-            species=species, gene_id=gene_id)
+        lit_corr_results = __cached__(
+            "lit", species, correlation_cache.values_hash(gene_id),
+            correlation_cache.content_hash(request.get_data()),
+            lambda: compute_all_lit_correlation(
+                conn=conn, trait_lists=target_trait_gene_list,
+                species=species, gene_id=gene_id, top_n=__top_n__()))
 
         return jsonify(lit_corr_results)
 
@@ -84,13 +221,25 @@ def compute_tissue_corr(corr_method="pearson"):
     primary_tissue_dict = tissue_input_data["primary_tissue"]
     target_tissues_dict = tissue_input_data["target_tissues_dict"]
 
-    results = compute_tissue_correlation(primary_tissue_dict=primary_tissue_dict,
-                                         target_tissues_data=target_tissues_dict,
-                                         corr_method=corr_method)
+    results = __cached__(
+        "tissue", corr_method, correlation_cache.values_hash(primary_tissue_dict),
+        correlation_cache.content_hash(request.get_data()),
+        lambda: compute_tissue_correlation(
+            primary_tissue_dict=primary_tissue_dict,
+            target_tissues_data=target_tissues_dict,
+            corr_method=corr_method,
+            top_n=__top_n__()))
 
     return jsonify(results)
 
 
+@correlation.route("/cache/metrics", methods=["GET"])
+def cache_metrics():
+    """Get the hit/miss metrics of the shared correlation results cache."""
+    with redis.Redis.from_url(current_app.config["REDIS_URI"]) as conn:
+        return jsonify(correlation_cache.metrics(conn))
+
+
 @correlation.route("/partial", methods=["POST"])
 def partial_correlation():
     """API endpoint for partial correlations."""
@@ -144,11 +293,16 @@ def partial_correlation():
             cmd=command,
             job_queue=compute_job_queue(current_app),
             options={
+                "user": args.get("user", request.remote_addr),
                 "env": {
                     **os.environ,
                     "PYTHONPATH": ":".join(sys.path),
                     "SQL_URI": current_app.config["SQL_URI"]
                 },
+                "dedup_ttl": async_job_dedup_ttl(current_app),
+                # Sample-data edits bump the correlation cache's generation
+                "dedup_extra": (correlation_cache.current_generation(
+                    current_app.config["REDIS_URI"]),),
             },
             log_level=logging.getLevelName(
                 current_app.logger.getEffectiveLevel()).lower())
@@ -8,6 +8,7 @@ from flask import jsonify
 from flask import request
 
 from gn3.commands import queue_cmd
+from gn3.commands import async_job_dedup_ttl
 from gn3.commands import run_cmd
 from gn3.fs_helpers import cache_ipfs_file
 from gn3.fs_helpers import jsonfile_to_dict, assert_paths_exist
@@ -67,6 +68,7 @@ traitfile, and snpsfile are extracted from a metadata.json file.
                 conn=redis.Redis(),
                 email=(request.get_json() or {}).get('email'),
                 job_queue=current_app.config.get("REDIS_JOB_QUEUE"),
+                dedup_ttl=async_job_dedup_ttl(current_app),
                 cmd=results.get("gemma_cmd")),
             status="queued",
             output_file=results.get("output_file"))
@@ -109,6 +111,7 @@ values.
                 conn=redis.Redis(),
                 email=(request.get_json() or {}).get('email'),
                 job_queue=current_app.config.get("REDIS_JOB_QUEUE"),
+                dedup_ttl=async_job_dedup_ttl(current_app),
                 cmd=results.get("gemma_cmd")),
             status="queued",
             output_file=results.get("output_file"))
@@ -156,6 +159,7 @@ def compute_gwa(k_filename, token):
                 conn=redis.Redis(),
                 email=(request.get_json() or {}).get('email'),
                 job_queue=current_app.config.get("REDIS_JOB_QUEUE"),
+                dedup_ttl=async_job_dedup_ttl(current_app),
                 cmd=results.get("gemma_cmd")),
             status="queued",
             output_file=results.get("output_file"))
@@ -204,6 +208,7 @@ def compute_gwa_with_covar(k_filename, token):
                 conn=redis.Redis(),
                 email=(request.get_json() or {}).get('email'),
                 job_queue=current_app.config.get("REDIS_JOB_QUEUE"),
+                dedup_ttl=async_job_dedup_ttl(current_app),
                 cmd=results.get("gemma_cmd")),
             status="queued",
             output_file=results.get("output_file"))
@@ -254,6 +259,7 @@ def compute_gwa_with_loco_maf(k_filename, maf, token):
                 conn=redis.Redis(),
                 email=(request.get_json() or {}).get('email'),
                 job_queue=current_app.config.get("REDIS_JOB_QUEUE"),
+                dedup_ttl=async_job_dedup_ttl(current_app),
                 cmd=results.get("gemma_cmd")),
             status="queued",
             output_file=results.get("output_file"))
@@ -305,6 +311,7 @@ def compute_gwa_with_loco_covar(k_filename, maf, token):
                 conn=redis.Redis(),
                 email=(request.get_json() or {}).get('email'),
                 job_queue=current_app.config.get("REDIS_JOB_QUEUE"),
+                dedup_ttl=async_job_dedup_ttl(current_app),
                 cmd=results.get("gemma_cmd")),
             status="queued",
             output_file=results.get("output_file"))
@@ -359,6 +366,7 @@ covars; lmm defaults to 9!
                 conn=redis.Redis(),
                 email=(request.get_json() or {}).get('email'),
                 job_queue=current_app.config.get("REDIS_JOB_QUEUE"),
+                dedup_ttl=async_job_dedup_ttl(current_app),
                 cmd=(f"{gemma_k_cmd.get('gemma_cmd')} && "
                      f"{gemma_gwa_cmd.get('gemma_cmd')}")),
             status="queued",
@@ -415,6 +423,7 @@ covars; lmm defaults to 9!
                 conn=redis.Redis(),
                 email=(request.get_json() or {}).get('email'),
                 job_queue=current_app.config.get("REDIS_JOB_QUEUE"),
+                dedup_ttl=async_job_dedup_ttl(current_app),
                 cmd=(f"{gemma_k_cmd.get('gemma_cmd')} && "
                      f"{gemma_gwa_cmd.get('gemma_cmd')}")),
             status="queued",
@@ -472,6 +481,7 @@ def compute_k_gwa_with_loco_only(chromosomes, maf, token):
                 conn=redis.Redis(),
                 email=(request.get_json() or {}).get('email'),
                 job_queue=current_app.config.get("REDIS_JOB_QUEUE"),
+                dedup_ttl=async_job_dedup_ttl(current_app),
                 cmd=(f"{gemma_k_cmd.get('gemma_cmd')} && "
                      f"{gemma_gwa_cmd.get('gemma_cmd')}")),
             status="queued",
@@ -530,6 +540,7 @@ def compute_k_gwa_with_loco_and_cavar(chromosomes, maf, token):
                 conn=redis.Redis(),
                 email=(request.get_json() or {}).get('email'),
                 job_queue=current_app.config.get("REDIS_JOB_QUEUE"),
+                dedup_ttl=async_job_dedup_ttl(current_app),
                 cmd=(f"{gemma_k_cmd.get('gemma_cmd')} && "
                      f"{gemma_gwa_cmd.get('gemma_cmd')}")),
             status="queued",
@@ -3,14 +3,26 @@ Module to hold the entrypoint functions that generate heatmaps
 """
 
 import io
+import os
+import sys
+from uuid import uuid4
+
+import redis
 from flask import jsonify
 from flask import request
 from flask import Blueprint, current_app
-from gn3.heatmaps import build_heatmap
+from gn3 import jobs
+from gn3.heatmaps import HEATMAP_STAGES, build_heatmap
 from gn3.db_utils import database_connection
 
 heatmaps = Blueprint("heatmaps", __name__)
 
+def parse_trait_fullname(trait):
+    """Convert a trait's name from the `<TRAIT-NAME>:<DATASET-NAME>` format of
+    the requests to the `<DATASET-NAME>::<TRAIT-NAME>` format."""
+    name_parts = trait.split(":")
+    return f"{name_parts[1]}::{name_parts[0]}"
+
 @heatmaps.route("/clustered", methods=("POST",))
 def clustered_heatmaps():
     """
@@ -25,9 +37,6 @@ def clustered_heatmaps():
             "message": "You need to provide at least two trait names."
         }), 400
     with database_connection(current_app.config["SQL_URI"], logger=current_app.logger) as conn:
-        def parse_trait_fullname(trait):
-            name_parts = trait.split(":")
-            return f"{name_parts[1]}::{name_parts[0]}"
         traits_fullnames = [parse_trait_fullname(trait) for trait in traits_names]
 
         with io.StringIO() as io_str:
@@ -39,3 +48,80 @@ def clustered_heatmaps():
             figure.write_json(io_str)
             fig_json = io_str.getvalue()
         return fig_json, 200
+
+@heatmaps.route("/clustered/jobs", methods=("POST",))
+def clustered_heatmap_job():
+    """
+    Start building the clustered heatmap in a background job, responding with
+    the job's ID at once. The request is the same as that of
+    `clustered_heatmaps`.
+    """
+    heatmap_request = request.get_json()
+    traits_names = heatmap_request.get("traits_names", tuple())
+    if len(traits_names) < 2:
+        return jsonify({
+            "message": "You need to provide at least two trait names."
+        }), 400
+    job_id = uuid4()
+    command = [
+        sys.executable, "-m", "scripts.clustered_heatmap", str(job_id),
+        *(parse_trait_fullname(trait) for trait in traits_names),
+        "--genotype-files",
+        f'{current_app.config["GENOTYPE_FILES"]}/genotype',
+        "--tmpdir", current_app.config["TMPDIR"],
+        "--reaper-command", current_app.config["REAPER_COMMAND"],
+        "--workers", str(current_app.config["MULTIPROCESSOR_PROCS"]),
+        "--redis-uri", current_app.config["REDIS_URI"]
+    ] + (["--vertical"] if heatmap_request.get("vertical", False) else [])
+    with redis.Redis.from_url(current_app.config["REDIS_URI"]) as rconn:
+        jobs.create_job(rconn, {
+            "job_id": job_id,
+            "command": command,
+            "stages": HEATMAP_STAGES,
+            "stage": None
+        })
+        # Expire the job even if its process fails before it can record that
+        rconn.expire(jobs.job_key(job_id), jobs.JOB_TTL)
+        jobs.launch_job({"command": command}, env={
+            **os.environ,
+            "PYTHONPATH": ":".join(sys.path),
+            "SQL_URI": current_app.config["SQL_URI"]
+        })
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+@heatmaps.route("/clustered/jobs/<uuid:job_id>", methods=("GET",))
+def clustered_heatmap_job_status(job_id):
+    """
+    Respond with the status of the heatmap job, and the progress of its current
+    stage (one of `gn3.heatmaps.HEATMAP_STAGES`).
+    """
+    with redis.Redis.from_url(
+            current_app.config["REDIS_URI"], decode_responses=True) as rconn:
+        return jobs.job(rconn, job_id).either(
+            lambda error: (jsonify(error), 404),
+            lambda the_job: jsonify({
+                key: value for key, value in the_job.items()
+                if key != "command"}))
+
+@heatmaps.route("/clustered/jobs/<uuid:job_id>/figure", methods=("GET",))
+def clustered_heatmap_job_figure(job_id):
+    """
+    Respond with the JSON-serialized plotly figure built by the heatmap job,
+    once the job has completed successfully.
+    """
+    with redis.Redis.from_url(
+            current_app.config["REDIS_URI"], decode_responses=True) as rconn:
+        def __figure__(the_job):
+            figure = rconn.get(jobs.job_output_key(job_id))
+            if the_job["status"] != "success" or figure is None:
+                return jsonify({
+                    "error": "NotReady",
+                    "error_description": (
+                        f"Job '{job_id}' has no figure: its status is "
+                        f"'{the_job['status']}'."),
+                    "status": the_job["status"]
+                }), 409
+            return current_app.response_class(
+                figure, status=200, mimetype="application/json")
+        return jobs.job(rconn, job_id).either(
+            lambda error: (jsonify(error), 404), __figure__)
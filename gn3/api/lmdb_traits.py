@@ -3,19 +3,32 @@ Api endpoints for lmdb traits
 """
 
 
+import io
 import os
-import json
 import re
+from collections import defaultdict
 from typing import Optional
 
 import lmdb
 import numpy as np
-from flask import Blueprint, current_app, jsonify
+from flask import Blueprint, current_app, jsonify, request, send_file
+
+from gn3 import phenodb
 
 
 lmdb_traits = Blueprint("lmdb_traits", __name__)
 
 
+def parse_trait_spec(trait_spec: str) -> Optional[tuple[str, str]]:
+    """Parse a trait specification of the form <dataset>_<trait_id>, e.g.
+    BXDPublish_12315, into the dataset name and the normalised trait id."""
+    match = re.match(r"^(.+?)_(\d+)$", trait_spec)
+    if not match:
+        return None
+    dataset, trait_id = match.groups()
+    return dataset, str(int(trait_id))  # Normalize: "00123" -> "123"
+
+
 @lmdb_traits.route("/traits/<path:trait_spec>.json", methods=["GET"])
 def get_phenotype(trait_spec: str):  # pylint: disable=too-many-locals
     """Fetch phenotype data.
@@ -35,127 +48,153 @@ def get_phenotype(trait_spec: str):  # pylint: disable=too-many-locals
         GET /dataset/phenotype/BXDPublish_12315
     """
     # Parse the trait specification
-    match = re.match(r"^(.+?)_(\d+)$", trait_spec)
-    if not match:
+    parsed = parse_trait_spec(trait_spec)
+    if parsed is None:
         return jsonify({
             "error": "Invalid trait specification",
             "message": "Format should be <dataset>_<trait_id>, e.g., BXDPublish_12315",
         }), 400
 
-    dataset, trait_id = match.groups()
-    trait_id = str(int(trait_id))  # Normalize: "00123" -> "123"
-    lmdb_path = os.path.join(
-        current_app.config["LMDB_DATA_PATH"], dataset)
-    with open_lmdb(lmdb_path) as env:
-        with env.begin() as txn:
-            metadata = read_metadata(txn)
-            # Fetch values
-            values = fetch_trait_row(
-                txn, trait_id, metadata, b"pheno_matrix")
-
-            # Try to fetch SE values
-            se_values = None
-            try:
-                se_values = fetch_trait_row(
-                    txn, trait_id, metadata, b"pheno_se_matrix")
-            except KeyError:
-                pass
-
-            # Build response with both value and SE
-            strains = metadata["strains"]
-            data = {}
-
-            for idx, strain in enumerate(strains):
-                entry = {}
-
-                value = values[idx]
-                if not np.isnan(value):
-                    entry["value"] = float(value)
-                    # you cannot have SE without a value enforcing this here
-                    if se_values is not None:
-                        se_val = se_values[idx]
-                        if not np.isnan(se_val):
-                            entry["SE"] = float(se_val)
-
-                if entry:
-                    data[strain] = entry
-            return jsonify(data)
-
-
-def open_lmdb(db_path: str) -> lmdb.Environment:
-    """Open an LMDB environment for reading."""
-    return lmdb.open(db_path, readonly=True, lock=False)
-
-
-def read_metadata(txn: lmdb.Transaction) -> dict:
-    """Read and decode the metadata JSON from an open transaction."""
-    raw = txn.get(b"pheno_metadata")
-    if raw is None:
-        raise KeyError("Metadata not found in LMDB")
-    return json.loads(raw.decode("utf-8"))
-
-
-def fetch_trait_row(
-    txn: lmdb.Transaction,
-    trait_name: str,
-    metadata: dict,
-    matrix_key: bytes = b"pheno_matrix",
-) -> np.ndarray:
-    """Fetch a single trait row from the matrix by slicing the raw bytes.
-
-    Args:
-        txn: Open LMDB transaction
-        trait_name: Name/ID of the trait to fetch
-        metadata: Decoded metadata dict
-        matrix_key: Key for the matrix in LMDB (pheno_matrix or pheno_se_matrix)
+    dataset, trait_id = parsed
+    pheno = phenodb.reader(os.path.join(
+        current_app.config["LMDB_DATA_PATH"], dataset))
+    # Fetch values
+    values = pheno.row(trait_id)
 
-    Returns:
-        1D numpy array of values for this trait across all strains
-    """
-    traits = metadata["traits"]
+    # Try to fetch SE values
+    se_values = None
+    try:
+        se_values = pheno.row(trait_id, phenodb.SE_KEY)
+    except KeyError:
+        pass
+
+    # Build response with both value and SE
+    data = {}
+    for idx, strain in enumerate(pheno.strains):
+        entry = {}
+
+        value = values[idx]
+        if not np.isnan(value):
+            entry["value"] = float(value)
+            # you cannot have SE without a value enforcing this here
+            if se_values is not None:
+                se_val = se_values[idx]
+                if not np.isnan(se_val):
+                    entry["SE"] = float(se_val)
 
-    if trait_name not in traits:
-        raise KeyError(f"Trait '{trait_name}' not found")
+        if entry:
+            data[strain] = entry
+    return jsonify(data)
 
-    row_idx = traits.index(trait_name)
-    dtype = np.dtype(metadata["dtype"])
-    bytes_per_row = metadata["columns"] * dtype.itemsize
-    start = row_idx * bytes_per_row
 
-    raw = txn.get(matrix_key)
-    if raw is None:
-        raise KeyError(f"Matrix '{matrix_key.decode()}' not found in LMDB")
+def __nan_to_none__(matrix: np.ndarray) -> list:
+    """Convert a matrix to nested lists, with NaN values replaced by `None`."""
+    values = matrix.astype(object)
+    values[np.isnan(matrix)] = None
+    return values.tolist()
 
-    return np.frombuffer(raw, dtype=dtype, count=metadata["columns"], offset=start)
 
+@lmdb_traits.route("/traits", methods=["POST"])
+def get_phenotypes():  # pylint: disable=too-many-locals
+    """Fetch the data for many traits, possibly from different datasets, in a
+    single request.
 
-def build_trait_response(
-    strains: list[str],
-    values: np.ndarray,
-    se_values: Optional[np.ndarray] = None,
-) -> dict:
-    """Build the JSON response for a trait query.
+    Request body (JSON):
+        {"traits": ["BXDPublish_12315", "BXDPublish_10001", …],
+         "format": "json"}
 
-    Returns a dict with strain names as keys and value/SE pairs as values.
-    NaN values are converted to null in JSON.
+        `format` is optional and is one of "json" (the default) or "npz".
+
+    Returns:
+        With the "json" format, an object with the data for each dataset, laid
+        out column-wise, with missing values as null:
+        {
+            "datasets": {
+                "BXDPublish": {
+                    "traits": ["12315", "10001"],
+                    "strains": ["BXD1", "BXD2", …],
+                    "values": [[5.67, null, …], [4.32, 1.2, …]],
+                    "se": [[0.12, null, …], [null, 0.1, …]]
+                }
+            },
+            "missing": ["BXDPublish_99999"]
+        }
+        `se` is null for datasets without standard errors.
+
+        With the "npz" format, a NumPy `.npz` archive with, for each dataset,
+        the arrays "<dataset>/traits", "<dataset>/strains", "<dataset>/values"
+        and, if available, "<dataset>/se". The missing trait specifications
+        are in the "missing" array.
     """
-    result = {}
+    args = request.get_json(silent=True) or {}
+    trait_specs = args.get("traits")
+    response_format = args.get("format", "json")
+    if not isinstance(trait_specs, list) or response_format not in (
+            "json", "npz"):
+        return jsonify({
+            "error": "Invalid request",
+            "message": ('Expected a JSON object with a "traits" list and an '
+                        'optional "format" of "json" or "npz".'),
+        }), 400
 
-    for idx, strain in enumerate(strains):
-        value = values[idx]
+    invalid = [spec for spec in trait_specs
+               if not isinstance(spec, str) or parse_trait_spec(spec) is None]
+    if invalid:
+        return jsonify({
+            "error": "Invalid trait specification",
+            "message": ("Format should be <dataset>_<trait_id>, e.g., "
+                        "BXDPublish_12315. Invalid: "
+                        f"{', '.join(map(str, invalid))}"),
+        }), 400
+
+    by_dataset: dict[str, dict[str, str]] = defaultdict(dict)
+    for spec in trait_specs:
+        dataset, trait_id = parse_trait_spec(spec)  # type: ignore[misc]
+        by_dataset[dataset].setdefault(trait_id, spec)
+
+    missing: list[str] = []
+    datasets = {}
+    for dataset, specs in by_dataset.items():
+        try:
+            pheno = phenodb.reader(os.path.join(
+                current_app.config["LMDB_DATA_PATH"], dataset))
+        except (OSError, lmdb.Error, KeyError):
+            missing.extend(specs.values())
+            continue
+        found = [trait for trait in specs if trait in pheno.trait_index]
+        missing.extend(spec for trait, spec in specs.items()
+                       if trait not in pheno.trait_index)
+        matrices = pheno.read(
+            found, ((phenodb.VALUES_KEY, phenodb.SE_KEY) if pheno.has_se
+                    else (phenodb.VALUES_KEY,)))
+        datasets[dataset] = {
+            "traits": found,
+            "strains": pheno.strains,
+            "values": matrices[phenodb.VALUES_KEY],
+            "se": matrices.get(phenodb.SE_KEY)
+        }
 
-        # Convert numpy types to Python native types
-        # Convert NaN to None (which becomes null in JSON)
-        if np.isnan(value):
-            py_value = None
-        else:
-            py_value = float(value)
-
-        if se_values is not None:
-            se_val = se_values[idx]
-            py_se = None if np.isnan(se_val) else float(se_val)
-            result[strain] = {"value": py_value, "se": py_se}
-        else:
-            result[strain] = {"value": py_value, "se": None}
-
-    return result
+    if response_format == "npz":
+        arrays = {"missing": np.array(missing, dtype=str)}
+        for dataset, data in datasets.items():
+            arrays[f"{dataset}/traits"] = np.array(data["traits"], dtype=str)
+            arrays[f"{dataset}/strains"] = np.array(data["strains"], dtype=str)
+            arrays[f"{dataset}/values"] = data["values"]
+            if data["se"] is not None:
+                arrays[f"{dataset}/se"] = data["se"]
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        buffer.seek(0)
+        return send_file(buffer, mimetype="application/octet-stream",
+                         as_attachment=True, download_name="traits.npz")
+
+    return jsonify({
+        "datasets": {
+            dataset: {
+                **data,
+                "values": __nan_to_none__(data["values"]),
+                "se": (None if data["se"] is None
+                       else __nan_to_none__(data["se"]))
+            } for dataset, data in datasets.items()},
+        "missing": missing
+    })
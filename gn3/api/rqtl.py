@@ -1,21 +1,28 @@
 """Endpoints for running the rqtl cmd"""
 
 import os
-import uuid
+import re
+import logging
 from pathlib import Path
 
+import redis
+
 from flask import Blueprint
 from flask import current_app
 from flask import jsonify
 from flask import request
 
+from gn3.commands import (
+    run_async_cmd, compute_job_queue, async_job_dedup_ttl)
 from gn3.computations.rqtl import (
     generate_rqtl_cmd,
-    process_rqtl_mapping,
-    process_rqtl_pairscan,
-    process_perm_output,
+    rqtl_job_file,
+    read_rqtl_job,
+    rqtl_results,
+    rqtl_result_files,
+    write_rqtl_job,
 )
-from gn3.computations.streaming import run_process, enable_streaming
+from gn3.computations.streaming import enable_streaming, mark_done
 from gn3.fs_helpers import assert_path_exists, get_tmpdir
 
 rqtl = Blueprint("rqtl", __name__)
@@ -23,9 +30,13 @@ rqtl = Blueprint("rqtl", __name__)
 
 @rqtl.route("/compute", methods=["POST"])
 @enable_streaming
-def compute(stream_output_file):
-    """Given at least a geno_file and pheno_file, generate and
-    run the rqtl_wrapper script and return the results as JSON
+def compute(stream_output_file):# pylint: disable=[too-many-locals]
+    """Given at least a geno_file and pheno_file, generate the rqtl_wrapper
+    command and queue it, responding with the id of its results, to fetch from
+    the `results` endpoint once it completes, and the id of its output stream.
+
+    The results of an earlier run with the same inputs are reused, if they
+    are still there.
 
     """
     genofile = request.form["geno_file"]
@@ -64,29 +75,69 @@ def compute(stream_output_file):
         rqtl_wrapper_bool_kwargs=rqtl_bool_kwargs,
     )
 
-    rqtl_output = {}
-    run_id = request.args.get("id", str(uuid.uuid4()))
-    if not os.path.isfile(
-        os.path.join(
-            current_app.config.get("TMPDIR"), "gn3", rqtl_cmd.get("output_file")
-        )
-    ):
-        pass
-    run_process(rqtl_cmd.get("rqtl_cmd").split(), stream_output_file, run_id)
-
-    if "pairscan" in rqtl_bool_kwargs:
-        rqtl_output["results"] = process_rqtl_pairscan(
-            rqtl_cmd.get("output_file"), genofile
-        )
-    else:
-        rqtl_output["results"] = process_rqtl_mapping(rqtl_cmd.get("output_file"))
-
-    if int(rqtl_kwargs["nperm"]) > 0:
-        # pylint: disable=C0301
-        perm_output_file = f"PERM_{rqtl_cmd.get('output_file')}"
-        (
-            rqtl_output["perm_results"],
-            rqtl_output["suggestive"],
-            rqtl_output["significant"],
-        ) = process_perm_output(perm_output_file)
-    return jsonify(rqtl_output)
+    job = {
+        "geno_file": genofile,
+        "pairscan": "pairscan" in rqtl_bool_kwargs,
+        "nperm": int(rqtl_kwargs.get("nperm", 0)),
+    }
+    output_file = rqtl_cmd.get("output_file")
+    if all(os.path.isfile(result_file) for result_file in rqtl_result_files(
+            output_file, job["pairscan"], job["nperm"])):
+        # The same inputs were mapped before: reuse the results
+        with open(stream_output_file, "a", encoding="utf-8") as file_handler:
+            file_handler.write("Reusing the results of an earlier run\n")
+        mark_done(stream_output_file)
+        return jsonify({
+            "status": "success",
+            "result_id": write_rqtl_job(output_file, job),
+            "run_id": request.args.get("id"),
+        })
+
+    with redis.Redis() as conn:
+        cmd_id = run_async_cmd(
+            conn=conn,
+            cmd=rqtl_cmd.get("rqtl_cmd").split(),
+            job_queue=compute_job_queue(current_app),
+            options={
+                "user": request.form.get("user", request.remote_addr),
+                "env": dict(os.environ),
+                "log_file": stream_output_file,
+                "dedup_ttl": async_job_dedup_ttl(current_app),
+            },
+            log_level=logging.getLevelName(
+                current_app.logger.getEffectiveLevel()).lower())
+        # An identical run could already be queued, with its own log
+        log_file = conn.hget(cmd_id, "log_file")
+    return jsonify({
+        "status": "queued",
+        "result_id": write_rqtl_job(output_file, {**job, "cmd_id": cmd_id}),
+        "command_id": cmd_id,
+        "run_id": (Path(log_file.decode("utf-8")).stem if log_file
+                   else request.args.get("id")),
+    }), 202
+
+
+@rqtl.route("/results/<result_id>", methods=["GET"])
+def results(result_id):
+    """Respond with the results identified by `result_id`, as returned by the
+    `compute` endpoint: the mapping or pair-scan results, and the permutation
+    results and thresholds, once the run is complete."""
+    if not re.fullmatch(r"[\w+-]+", result_id) or not os.path.isfile(
+            rqtl_job_file(result_id)):
+        return jsonify(
+            status="error", error=f"No results with the id '{result_id}'."), 404
+    job = read_rqtl_job(result_id)
+    if job.get("cmd_id"):
+        with redis.Redis(decode_responses=True) as conn:
+            state = conn.hgetall(job["cmd_id"])
+        if state.get("status") == "error":
+            return jsonify(status="error", result_id=result_id,
+                           error=state.get("stderr", "")), 400
+        if state.get("status") in ("queued", "running"):
+            return jsonify(status=state["status"], result_id=result_id), 202
+    if not all(os.path.isfile(result_file) for result_file in rqtl_result_files(
+            job["output_file"], job["pairscan"], job["nperm"])):
+        return jsonify(
+            status="error", result_id=result_id,
+            error="The results are no longer available."), 404
+    return jsonify({"status": "success", **rqtl_results(job)})
@@ -13,6 +13,7 @@ from gn3.computations.rqtl2 import (compose_rqtl2_cmd,
                                     )
 from gn3.computations.streaming import run_process
 from gn3.computations.streaming import enable_streaming
+from gn3.computations.streaming import mark_done
 
 rqtl2 = Blueprint("rqtl2", __name__)
 
@@ -46,10 +47,10 @@ def compute(log_file):
     process_output = run_process(rqtl2_cmd.split(),log_file, run_id)
     if process_output["code"] != 0:
         # Err out for any non-zero status code
+        mark_done(log_file)
         return jsonify(process_output), 400
     results = process_qtl2_results(output_file)
     shutil.rmtree(workspace_dir, ignore_errors=True, onerror=None)
     # append this at end of computation to the log file to mark end of gn3 computation
-    with open(log_file, "ab+") as file_handler:
-        file_handler.write("Done with GN3 Computation".encode("utf-8"))
+    mark_done(log_file)
     return jsonify(results)
@@ -4,6 +4,10 @@ from flask import current_app
 from flask import jsonify
 from flask import Blueprint
 from flask import request
+from flask import Response
+from flask import stream_with_context
+
+from gn3.computations.streaming import log_events
 
 streaming = Blueprint("stream", __name__)
 
@@ -24,3 +28,26 @@ def stream(identifier):
                    "run_id": identifier,
                    "pointer": file_handler.tell()}
         return jsonify(results)
+
+
+@streaming.route("/<identifier>/events", methods=["GET"])
+def stream_events(identifier):
+    """Push the stdout in the file of the computation `identifier` as
+    Server-Sent Events, as it is written. Each event's id is the offset to
+    resume from: it is read from the `Last-Event-ID` header that browsers send
+    on reconnecting, or else from the `peak` parameter."""
+    output_file = os.path.join(current_app.config.get("TMPDIR"),
+                               f"{identifier}.txt")
+    if not os.path.isfile(output_file):
+        return jsonify({"error": f"No output for '{identifier}'."}), 404
+    offset = request.headers.get("Last-Event-ID", request.args.get("peak", "0"))
+    if not str(offset).isdigit():
+        return jsonify({
+            "error": f"Invalid offset '{offset}': expected a non-negative "
+            "integer."}), 400
+    return Response(
+        stream_with_context(log_events(
+            output_file, int(offset),
+            idle_timeout=current_app.config.get("STREAM_IDLE_TIMEOUT", 600))),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
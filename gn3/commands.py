@@ -3,6 +3,7 @@ commands"""
 import os
 import sys
 import json
+import time
 import shlex
 import pickle
 import logging
@@ -10,6 +11,7 @@ import tempfile
 import subprocess
 
 from datetime import datetime
+from multiprocessing.connection import Client
 from typing import Any
 from typing import Dict
 from typing import List
@@ -25,8 +27,11 @@ from redis.client import Redis  # Used only in type hinting
 from pymonad.either import Either, Left, Right
 
 from gn3.debug import __pk__
+from gn3.job_queue import (
+    ANONYMOUS_USER, enqueue, live_daemons, command_class, claim_fingerprint,
+    command_fingerprint)
 from gn3.chancy import random_string
-from gn3.exceptions import RedisConnectionError
+from gn3.exceptions import ServiceBusy, RedisConnectionError
 
 logger = logging.getLogger(__name__)
 
@@ -80,7 +85,9 @@ def compose_pcorrs_command_for_database(
     """Build command for partial correlations against an entire dataset."""
     return prefix_cmd + (
         "against-db", f"{target_database}", "--criteria", str(criteria),
-        "--textdir", current_app.config["TEXTDIR"])
+        "--textdir", current_app.config["TEXTDIR"],
+        "--matrices-dir", current_app.config["DATASET_MATRICES_DIR"],
+        "--redis-uri", current_app.config["REDIS_URI"])
 
 
 def compose_pcorrs_command(
@@ -114,11 +121,15 @@ def compose_pcorrs_command(
         "Invalid state: I don't know what command to generate!")
 
 
-def queue_cmd(conn: Redis,
+def queue_cmd(conn: Redis,# pylint: disable=[too-many-arguments, too-many-positional-arguments]
               job_queue: str,
               cmd: Union[str, Sequence[str]],
               email: Optional[str] = None,
-              env: Optional[dict] = None) -> str:
+              env: Optional[dict] = None,
+              user: Optional[str] = None,
+              dedup_ttl: int = 0,
+              log_file: Optional[str] = None,
+              dedup_extra: Sequence[Any] = tuple()) -> str:
     """Given a command CMD; (optional) EMAIL; and a redis connection CONN, queue
 it in Redis with an initial status of 'queued'.  The following status codes
 are supported:
@@ -128,6 +139,21 @@ are supported:
     success: Successful completion
     error:   Erroneous completion
 
+The command is queued in its job class (see `gn3.job_queue`) for USER, who
+defaults to EMAIL if given. If LOG_FILE is given, the output of the command is
+appended to it as the command runs, for streaming (see
+`gn3.computations.streaming`).
+
+If the same command, with the same input files, is already queued or running,
+or completed successfully less than DEDUP_TTL seconds ago, it is not queued
+again: the id of the existing command is returned instead, and USER and EMAIL
+recorded on its list of attached submitters (see
+`gn3.job_queue.claim_fingerprint`). DEDUP_TTL defaults to 0, which disables
+this: the API endpoints pass the `ASYNC_JOB_DEDUP_TTL` setting (see
+`async_job_dedup_ttl`). DEDUP_EXTRA are any values, other than the command and
+its input files, that its results depend on, e.g. the generation of the
+correlation cache for the correlations.
+
 Returns the name of the specific redis hash for the specific task.
 
     """
@@ -136,19 +162,81 @@ Returns the name of the specific redis hash for the specific task.
     unique_id = ("cmd::"
                  f"{datetime.now().strftime('%Y-%m-%d%H-%M%S-%M%S-')}"
                  f"{str(uuid4())}")
-    conn.rpush(job_queue, unique_id)
+    dedup: dict[str, str] = {}
+    if dedup_ttl > 0:
+        dedup = {
+            "fingerprint": command_fingerprint(cmd, dedup_extra),
+            "dedup_ttl": str(dedup_ttl)}
+    job_class = command_class(cmd)
+    user = user or email or ANONYMOUS_USER
     for key, value in {
-            "cmd": json.dumps(cmd), "result": "", "status": "queued"}.items():
+            "cmd": json.dumps(cmd), "result": "", "status": "queued",
+            "class": job_class, "user": user,
+            "queued_at": str(time.time()), **dedup}.items():
         conn.hset(name=unique_id, key=key, value=value)
     if email:
         conn.hset(name=unique_id, key="email", value=email)
     if env:
         conn.hset(name=unique_id, key="env", value=json.dumps(env))
+    if log_file:
+        conn.hset(name=unique_id, key="log_file", value=log_file)
+    if dedup:
+        cmd_id = claim_fingerprint(
+            conn, job_queue, dedup["fingerprint"], unique_id, dedup_ttl,
+            {"user": user, "email": email})
+        if cmd_id != unique_id:
+            logger.debug("Attached to the identical command '%s'.", cmd_id)
+            conn.delete(unique_id)
+            return cmd_id
+    enqueue(conn, job_queue, unique_id, job_class, user)
     return unique_id
 
 
-def run_sample_corr_cmd(method, this_trait_data, target_dataset_data):
-    "Run the sample correlations in an external process, returning the results."
+def request_sample_corrs(# pylint: disable=[too-many-arguments, too-many-positional-arguments]
+        socket_path: str, method, this_trait_data, target_dataset_data,
+        top_n: Optional[int] = None, authkey: Optional[str] = None):
+    """Have the long-running correlation service (see
+    `sheepdog.correlation_service`) listening on `socket_path` compute the
+    sample correlations, returning the results."""
+    with Client(socket_path, family="AF_UNIX", authkey=(
+            authkey.encode("utf-8") if authkey else None)) as conn:
+        conn.send({
+            "method": method,
+            "this_trait": this_trait_data,
+            "target_dataset": target_dataset_data,
+            "top_n": top_n
+        })
+        response = conn.recv()
+
+    if response["status"] == "busy":
+        raise ServiceBusy(response["message"])
+    if response["status"] != "success":
+        # pylint: disable=[broad-exception-raised]
+        raise Exception(
+            f"Computing sample correlations failed: {response['message']}")
+    return response["results"]
+
+
+def run_sample_corr_cmd(method, this_trait_data, target_dataset_data,
+                        top_n: Optional[int] = None):
+    """Run the sample correlations outside of the web application's process,
+    returning the results.
+
+    If the `SAMPLE_CORRELATIONS_SOCKET` setting points to a running correlation
+    service, the correlations are computed by that service, otherwise, they are
+    computed in a new external process."""
+    socket_path = current_app.config.get("SAMPLE_CORRELATIONS_SOCKET")
+    if socket_path and os.path.exists(socket_path):
+        try:
+            return request_sample_corrs(
+                socket_path, method, this_trait_data, target_dataset_data,
+                top_n, current_app.config.get("SAMPLE_CORRELATIONS_AUTHKEY"))
+        except (ConnectionError, EOFError) as _conn_err:
+            logger.warning(
+                "Could not reach the correlation service at '%s': falling "
+                "back to running an external process.", socket_path,
+                exc_info=True)
+
     with tempfile.TemporaryDirectory() as tempdir:
         traitfile = f"{tempdir}/traitfile_{random_string(10)}"
         targetfile = f"{tempdir}/targetdb_{random_string(10)}"
@@ -161,7 +249,8 @@ def run_sample_corr_cmd(method, this_trait_data, target_dataset_data):
 
             subprocess.run(
                 ["python3", "-m", "scripts.sample_correlations", method,
-                 traitfile, targetfile, destfile],
+                 traitfile, targetfile, destfile] + (
+                     ["--top-n", str(top_n)] if top_n is not None else []),
                 check=True)
 
             with open(destfile, "rb") as dstfl:
@@ -198,15 +287,34 @@ def compute_job_queue(app: Flask) -> str:
     return job_queue
 
 
+def async_job_dedup_ttl(app: Flask) -> int:
+    """Use the app configurations to get the seconds for which identical
+    asynchronous commands are deduplicated (see `queue_cmd`)."""
+    return int(app.config.get("ASYNC_JOB_DEDUP_TTL", 0))
+
+
 def run_async_cmd(
         conn: Redis, job_queue: str, cmd: Union[str, Sequence[str]],
         options: Optional[Dict[str, Any]] = None,
         log_level: str = "info") -> str:
-    """A utility function to call `gn3.commands.queue_cmd` function and run the
-    worker in the `one-shot` mode."""
-    email = options.get("email") if options else None
-    env = options.get("env") if options else None
-    cmd_id = queue_cmd(conn, job_queue, cmd, email, env)
+    """A utility function to call `gn3.commands.queue_cmd` function and have
+    the command run.
+
+    Besides the command's `email`, `env`, `user` and `log_file`, the `options`
+    can hold the `dedup_ttl` and `dedup_extra` of `queue_cmd`.
+
+    The command is left to the pool of workers serving `job_queue`, if one is
+    running in daemon mode (see `sheepdog.worker`), otherwise, a worker is
+    started in the `one-shot` mode to run it."""
+    options = options or {}
+    cmd_id = queue_cmd(conn, job_queue, cmd, options.get("email"),
+                       options.get("env"), options.get("user"),
+                       dedup_ttl=options.get("dedup_ttl", 0),
+                       log_file=options.get("log_file"),
+                       dedup_extra=options.get("dedup_extra", tuple()))
+    if live_daemons(conn, job_queue):
+        logger.debug("Queued '%s' for the running worker pool.", cmd_id)
+        return cmd_id
     worker_command = [
         sys.executable,
         "-m", "sheepdog.worker",
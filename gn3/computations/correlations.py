@@ -14,6 +14,13 @@ from typing import Generator
 import scipy.stats
 import pingouin as pg
 
+from gn3.computations.top_n import top_n_items
+from gn3.computations.matrix_correlations import (
+    compute_matrix_sample_correlation, compute_matrix_tissue_correlation)
+
+# Methods that `compute_matrix_sample_correlation` can compute directly
+VECTORISED_METHODS = ("pearson", "spearman")
+
 
 def map_shared_keys_to_values(target_sample_keys: List,
                               target_sample_vals: dict) -> List:
@@ -123,7 +130,8 @@ def filter_shared_sample_keys(this_samplelist,
 
 def fast_compute_all_sample_correlation(this_trait,
                                         target_dataset,
-                                        corr_method="pearson") -> List:
+                                        corr_method="pearson",
+                                        top_n: Optional[int] = None) -> List:
     """Given a trait data sample-list and target__datasets compute all sample
     correlation
     this functions uses multiprocessing if not use the normal fun
@@ -131,6 +139,9 @@ def fast_compute_all_sample_correlation(this_trait,
     """
     # xtodo fix trait_name currently returning single one
     # pylint: disable-msg=too-many-locals
+    if corr_method in VECTORISED_METHODS:
+        return compute_matrix_sample_correlation(
+            this_trait, target_dataset, corr_method, top_n)
     this_trait_samples = this_trait["trait_sample_data"]
     corr_results = []
     processed_values = []
@@ -161,9 +172,10 @@ def fast_compute_all_sample_correlation(this_trait,
                 }
 
                 corr_results.append({trait_name: corr_result})
-    return sorted(
+    return top_n_items(
         corr_results,
-        key=lambda trait_name: -abs(list(trait_name.values())[0]["corr_coefficient"]))
+        key=lambda trait_name: -abs(list(trait_name.values())[0]["corr_coefficient"]),
+        top_n=top_n)
 
 def compute_one_sample_correlation(trait_samples, target_trait, corr_method):
     """Compute sample correlation against a single trait."""
@@ -193,14 +205,24 @@ def compute_one_sample_correlation(trait_samples, target_trait, corr_method):
 
 def compute_all_sample_correlation(this_trait,
                                    target_dataset,
-                                   corr_method="pearson") -> List:
-    """Temp function to benchmark with compute_all_sample_r alternative to
-    compute_all_sample_r where we use multiprocessing
+                                   corr_method="pearson",
+                                   top_n: Optional[int] = None) -> List:
+    """Compute the sample correlations of `this_trait` against every trait in
+    `target_dataset`.
+
+    Pearson and Spearman correlations are computed for all the target traits
+    at once with `compute_matrix_sample_correlation`; the remaining methods
+    (bicor) are computed one target trait at a time with multiprocessing.
+
+    If `top_n` is given, only the `top_n` strongest correlations are returned.
 
     """
+    if corr_method in VECTORISED_METHODS:
+        return compute_matrix_sample_correlation(
+            this_trait, target_dataset, corr_method, top_n)
     this_trait_samples = this_trait["trait_sample_data"]
     with Pool(processes=cpu_count() - 1) as pool:
-        return sorted(
+        return top_n_items(
             (
                 corr for corr in
                 pool.starmap(
@@ -208,7 +230,8 @@ def compute_all_sample_correlation(this_trait,
                     ((this_trait_samples, trait, corr_method) for trait in target_dataset))
                 if corr is not None),
             key=lambda trait_name: -abs(
-                list(trait_name.values())[0]["corr_coefficient"]))
+                list(trait_name.values())[0]["corr_coefficient"]),
+            top_n=top_n)
 
 
 def tissue_correlation_for_trait(
@@ -307,6 +330,80 @@ def lit_correlation_for_trait(
     return fetched_lit_corr_results
 
 
+def fetch_mouse_gene_ids(
+        conn, species: Optional[str], gene_ids: Sequence) -> dict[str, str]:
+    """Map many of a species' gene ids to mouse gene ids, in a single query,
+    returning a dict keyed by the (string) gene id. Gene ids with no mouse
+    equivalent are left out."""
+    species = (species or "").lower()
+    gene_ids = tuple({str(gene_id) for gene_id in gene_ids if gene_id})
+    if species == "mouse":
+        return {gene_id: gene_id for gene_id in gene_ids}
+    if species not in ("rat", "human") or len(gene_ids) == 0:
+        return {}
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {species}, mouse FROM GeneIDXRef "
+            f"WHERE {species} IN ({', '.join(['%s'] * len(gene_ids))})",
+            gene_ids)
+        mouse_gene_ids: dict[str, str] = {}
+        for gene_id, mouse_gene_id in cursor.fetchall():
+            if mouse_gene_id is not None:
+                mouse_gene_ids.setdefault(str(gene_id), str(mouse_gene_id))
+        return mouse_gene_ids
+
+
+def fetch_lit_correlations(conn, mouse_gene_id: str) -> dict[str, float]:
+    """Fetch all the literature correlations of the gene with `mouse_gene_id`,
+    whichever column of `LCorrRamin3` it is in, keyed by the (string) mouse
+    gene id of the other gene."""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT GeneId2, value, 0 FROM LCorrRamin3 WHERE GeneId1 = %s "
+            "UNION ALL "
+            "SELECT GeneId1, value, 1 FROM LCorrRamin3 WHERE GeneId2 = %s",
+            (mouse_gene_id, mouse_gene_id))
+        # Where both directions exist, the (other gene, this gene) pair takes
+        # precedence, as in `fetch_lit_correlation_data`.
+        return {
+            str(other_gene_id): value
+            for other_gene_id, value, _order in sorted(
+                cursor.fetchall(), key=lambda row: row[2])}
+
+
+def bulk_lit_correlation_for_trait(
+        conn,
+        target_trait_lists: List,
+        species: Optional[str] = None,
+        trait_gene_id: Optional[str] = None) -> List:
+    """Bulk alternative to `lit_correlation_for_trait`, with the same input and
+    output.
+
+    Rather than querying the database for each target trait, all the target
+    gene ids are mapped to mouse gene ids in one query, and all the literature
+    correlations of the trait's gene are fetched in another; they are then
+    joined in memory."""
+    mouse_gene_ids = fetch_mouse_gene_ids(
+        conn, species,
+        [trait_gene_id] + [gene_id for _name, gene_id in target_trait_lists])
+    this_trait_mouse_gene_id = mouse_gene_ids.get(str(trait_gene_id))
+    lit_corrs = (
+        fetch_lit_correlations(conn, this_trait_mouse_gene_id)
+        if this_trait_mouse_gene_id is not None else {})
+
+    def __lit_corr__(target_trait_gene_id):
+        target_mouse_gene_id = mouse_gene_ids.get(str(target_trait_gene_id))
+        if target_mouse_gene_id is None or ";" in target_mouse_gene_id:
+            return None
+        return lit_corrs.get(target_mouse_gene_id)
+
+    return [
+        {trait_name: {"gene_id": target_trait_gene_id,
+                      "lit_corr": __lit_corr__(target_trait_gene_id)}}
+        for (trait_name, target_trait_gene_id) in target_trait_lists
+        if target_trait_gene_id]
+
+
 def query_formatter(query_string: str, *query_values):
     """Formatter query string given the unformatted query string and the
     respectibe values.Assumes number of placeholders is equal to the number of
@@ -338,9 +435,11 @@ def map_to_mouse_gene_id(conn, species: Optional[str],
 
 
 def compute_all_lit_correlation(conn, trait_lists: List,
-                                species: str, gene_id):
+                                species: str, gene_id,
+                                top_n: Optional[int] = None):
     """Function that acts as an abstraction for
-    lit_correlation_for_trait"""
+    lit_correlation_for_trait; if `top_n` is given, only the `top_n` strongest
+    correlations are returned"""
 
     def __sorter__(trait_name):
         val = list(trait_name.values())[0]["lit_corr"]
@@ -349,23 +448,31 @@ def compute_all_lit_correlation(conn, trait_lists: List,
         except TypeError:
             return (1, val)
 
-    lit_results = lit_correlation_for_trait(
+    lit_results = bulk_lit_correlation_for_trait(
         conn=conn,
         target_trait_lists=trait_lists,
         species=species,
         trait_gene_id=gene_id)
-    sorted_lit_results = sorted(lit_results, key=__sorter__)
+    sorted_lit_results = top_n_items(lit_results, key=__sorter__, top_n=top_n)
 
     return sorted_lit_results
 
 
 def compute_tissue_correlation(primary_tissue_dict: dict,
                                target_tissues_data: dict,
-                               corr_method: str):
+                               corr_method: str,
+                               top_n: Optional[int] = None):
     """Function acts as an abstraction for tissue_correlation_for_trait\
     required input are target tissue object and primary tissue trait\
-    target tissues data contains the trait_symbol_dict and symbol_tissue_vals
+    target tissues data contains the trait_symbol_dict and symbol_tissue_vals\
+    Pearson and Spearman correlations are computed for all the symbols at\
+    once with `compute_matrix_tissue_correlation`\
+    if `top_n` is given, only the `top_n` strongest correlations are returned
     """
+    if corr_method in VECTORISED_METHODS:
+        return compute_matrix_tissue_correlation(
+            primary_tissue_dict, target_tissues_data, corr_method, top_n)
+
     tissues_results = []
     primary_tissue_vals = primary_tissue_dict["tissue_values"]
     traits_symbol_dict = target_tissues_data["trait_symbol_dict"]
@@ -382,9 +489,10 @@ def compute_tissue_correlation(primary_tissue_dict: dict,
             trait_id=trait_id,
             corr_method=corr_method)
         tissues_results.append(tissue_result)
-    return sorted(
+    return top_n_items(
         tissues_results,
-        key=lambda trait_name: -abs(list(trait_name.values())[0]["tissue_corr"]))
+        key=lambda trait_name: -abs(list(trait_name.values())[0]["tissue_corr"]),
+        top_n=top_n)
 
 
 def process_trait_symbol_dict(trait_symbol_dict, symbol_tissue_vals_dict) -> List:
@@ -408,9 +516,13 @@ def fast_compute_tissue_correlation(primary_tissue_dict: dict,
                                     target_tissues_data: dict,
                                     corr_method: str):
     """Experimental function that uses multiprocessing for computing tissue
-    correlation
+    correlation; Pearson and Spearman correlations are vectorised instead
 
     """
+    if corr_method in VECTORISED_METHODS:
+        return compute_matrix_tissue_correlation(
+            primary_tissue_dict, target_tissues_data, corr_method)
+
     tissues_results = []
     primary_tissue_vals = primary_tissue_dict["tissue_values"]
     traits_symbol_dict = target_tissues_data["trait_symbol_dict"]
@@ -426,7 +538,7 @@ def fast_compute_tissue_correlation(primary_tissue_dict: dict,
         processed_values.append(
             (primary_tissue_vals, target_tissue_vals, corr_method, trait_id))
 
-    with multiprocessing.Pool(4) as pool:
+    with multiprocessing.Pool(max(cpu_count() - 1, 1)) as pool:
         results = pool.starmap(
             tissue_correlation_for_trait, processed_values)
         for result in results:
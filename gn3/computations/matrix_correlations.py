@@ -0,0 +1,358 @@
+"""Vectorised (matrix-based) sample correlations.
+
+Rather than calling `scipy.stats.pearsonr`/`scipy.stats.spearmanr` once for
+each target trait, the functions in this module correlate a primary vector
+against a 2-D array of target traits (one trait per row) in a handful of NumPy
+operations. Missing values are represented with `NaN`, and each row is
+correlated over the samples that are present in both the primary trait and
+that row (pairwise-complete observations)."""
+from typing import Any, Optional, Sequence
+
+import numpy as np
+from scipy import stats
+
+from gn3.computations.top_n import top_n_indices
+
+# The minimum number of shared samples needed for a correlation to be reported
+# -- this mirrors `gn3.computations.correlations.compute_sample_r_correlation`
+MIN_OVERLAP = 6
+
+# Number of target rows to process at a time: bounds the size of the
+# intermediate (rows x samples) arrays
+CHUNK_SIZE = 5000
+
+
+def __masked_pearson__(
+        xvals: np.ndarray, yvals: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Compute row-wise Pearson's r between `xvals` and `yvals`, only
+    considering the positions where `mask` is `True`."""
+    counts = mask.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        xmean = np.where(mask, xvals, 0).sum(axis=1) / counts
+        ymean = np.where(mask, yvals, 0).sum(axis=1) / counts
+        xdev = np.where(mask, xvals - xmean[:, None], 0)
+        ydev = np.where(mask, yvals - ymean[:, None], 0)
+        coeffs = (xdev * ydev).sum(axis=1) / np.sqrt(
+            (xdev * xdev).sum(axis=1) * (ydev * ydev).sum(axis=1))
+    return np.clip(coeffs, -1.0, 1.0)
+
+
+def __masked_ranks__(
+        primary: np.ndarray, targets: np.ndarray,
+        mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Rank `primary` and each row of `targets` over the samples selected by
+    the corresponding row of `mask`. Ties are given the average rank, as in
+    `scipy.stats.rankdata`."""
+    fmask = mask.astype(np.float64)
+    # The rank of the primary trait's j-th value in row i is the count of the
+    # (masked) values less than it, plus half of the count of the (masked)
+    # values equal to it -- computed for all rows with two matrix products.
+    less = (primary[:, None] < primary[None, :]).astype(np.float64)
+    equal = (primary[:, None] == primary[None, :]).astype(np.float64)
+    primary_ranks = fmask @ less + (fmask @ equal + 1) / 2
+    # Masked-out values are pushed past every valid value, so that they do not
+    # affect the ranks of the valid values.
+    target_ranks = stats.rankdata(
+        np.where(mask, targets, np.inf), axis=1)
+    return primary_ranks, target_ranks
+
+
+def correlation_p_values(
+        coeffs: np.ndarray, num_overlap: np.ndarray) -> np.ndarray:
+    """Compute the two-sided p-values of the correlation coefficients `coeffs`
+    from the t-distribution with `num_overlap - 2` degrees of freedom."""
+    dof = num_overlap - 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        tstat = coeffs * np.sqrt(dof / ((1.0 - coeffs) * (1.0 + coeffs)))
+        return 2 * stats.t.sf(np.abs(tstat), dof)
+
+
+def correlate_matrix(
+        primary: np.ndarray, targets: np.ndarray, method: str = "pearson",
+        chunk_size: int = CHUNK_SIZE) -> tuple[
+            np.ndarray, np.ndarray, np.ndarray]:
+    """Correlate the `primary` vector against every row of `targets`.
+
+    Missing values in either input should be `NaN`. Each row is correlated
+    over the samples present in both it and the primary vector.
+
+    Parameters:
+        primary: 1-D array of the primary trait's values (n samples)
+        targets: 2-D array (m traits x n samples) of the target traits' values
+        method: One of "pearson" or "spearman"
+        chunk_size: Maximum number of target rows processed at a time
+
+    Returns:
+        A tuple of three 1-D arrays of length m: the correlation coefficients,
+        the p-values and the number of overlapping samples for each row.
+    """
+    if method not in ("pearson", "spearman"):
+        raise ValueError(f"Unsupported correlation method '{method}'.")
+    primary = np.asarray(primary, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64).reshape(
+        -1, primary.shape[0])
+    present = ~np.isnan(primary)
+    primary, targets = primary[present], targets[:, present]
+
+    coeffs = np.full(targets.shape[0], np.nan)
+    num_overlap = np.zeros(targets.shape[0], dtype=np.int64)
+    for start in range(0, targets.shape[0], chunk_size):
+        chunk = targets[start:start + chunk_size]
+        mask = ~np.isnan(chunk)
+        num_overlap[start:start + chunk_size] = mask.sum(axis=1)
+        if method == "spearman":
+            xvals, yvals = __masked_ranks__(primary, chunk, mask)
+        else:
+            xvals, yvals = np.broadcast_to(primary, chunk.shape), chunk
+        coeffs[start:start + chunk_size] = __masked_pearson__(
+            xvals, yvals, mask)
+
+    return coeffs, correlation_p_values(coeffs, num_overlap), num_overlap
+
+
+def pairwise_correlation_matrix(
+        values: np.ndarray, min_overlap: int = MIN_OVERLAP,
+        chunk_size: int = CHUNK_SIZE) -> np.ndarray:
+    """Compute Pearson's r between every pair of rows of `values`, a (traits x
+    samples) array with NaN for missing values. Each pair is correlated over the
+    samples present in both rows; pairs with fewer than `min_overlap` such
+    samples are given a correlation of 0, as in
+    `gn3.computations.correlations2.compute_correlation`.
+
+    The sums of each pair's overlapping values are computed with matrix
+    products, `chunk_size` rows at a time. Only the lower triangle is computed;
+    the upper one is its mirror image."""
+    values = np.asarray(values, dtype=np.float64)
+    mask = ~np.isnan(values)
+    fmask = mask.astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Centring each row does not change r, but avoids the loss of precision
+        # of the raw sums of squares.
+        centred = np.where(mask, values - np.where(mask, values, 0).sum(
+            axis=1, keepdims=True) / fmask.sum(axis=1, keepdims=True), 0)
+    squares = centred * centred
+
+    coeffs = np.zeros((values.shape[0], values.shape[0]))
+    for start in range(0, values.shape[0], chunk_size):
+        end = min(start + chunk_size, values.shape[0])
+        rows = slice(start, end)
+        counts = fmask[rows] @ fmask[:end].T
+        sum_x = centred[rows] @ fmask[:end].T
+        sum_y = fmask[rows] @ centred[:end].T
+        with np.errstate(invalid="ignore", divide="ignore"):
+            block = (
+                counts * (centred[rows] @ centred[:end].T) - sum_x * sum_y) / (
+                    np.sqrt(counts * (squares[rows] @ fmask[:end].T)
+                            - sum_x * sum_x)
+                    * np.sqrt(counts * (fmask[rows] @ squares[:end].T)
+                              - sum_y * sum_y))
+        block = np.where(counts >= min_overlap, np.clip(block, -1.0, 1.0), 0)
+        coeffs[rows, :end] = block
+        coeffs[:end, rows] = block.T
+    return coeffs
+
+
+def __column_correlations__(
+        xvals: np.ndarray, yvals: np.ndarray) -> np.ndarray:
+    """Compute Pearson's r between the centred vector `xvals` and each column of
+    the centred (samples x columns) array `yvals`."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.clip(xvals @ yvals / np.sqrt(
+            (xvals @ xvals) * (yvals * yvals).sum(axis=0)), -1.0, 1.0)
+
+
+def __partial_correlate_group__(
+        xvals: np.ndarray, zvals: np.ndarray, yvals: np.ndarray,
+        method: str) -> tuple[np.ndarray, np.ndarray]:
+    """Compute the partial correlations of `xvals` with each row of `yvals`,
+    controlling for the rows of `zvals`, and their zero-order correlations.
+    There are no missing values: all the rows are over the same samples."""
+    if method == "spearman":
+        xvals, zvals, yvals = (
+            stats.rankdata(xvals), stats.rankdata(zvals, axis=1),
+            stats.rankdata(yvals, axis=1))
+    design = np.column_stack([np.ones(xvals.shape[0]), zvals.T])
+    observed = np.column_stack([xvals, yvals.T])
+    # Residualise the primary trait and all the targets in a single solve.
+    residuals = observed - design @ np.linalg.lstsq(
+        design, observed, rcond=None)[0]
+    centred = observed - observed.mean(axis=0)
+    partial = __column_correlations__(residuals[:, 0], residuals[:, 1:])
+    # As in `pingouin.partial_corr`, the partial correlation is undefined if
+    # any of the variables is constant. It is also left undefined, rather than
+    # computed from rounding errors, for variables explained by the controls.
+    undefined = (np.ptp(observed, axis=0) == 0) | (
+        (residuals * residuals).sum(axis=0)
+        <= 1e-12 * (centred * centred).sum(axis=0))
+    if undefined[0] or np.any(np.ptp(zvals, axis=1) == 0):
+        partial[:] = np.nan
+    partial[undefined[1:]] = np.nan
+    return partial, __column_correlations__(centred[:, 0], centred[:, 1:])
+
+
+def partial_correlate_matrix(
+        primary: np.ndarray, controls: np.ndarray, targets: np.ndarray,
+        method: str = "pearson") -> tuple[np.ndarray, ...]:
+    """Compute the partial correlation of the `primary` vector with every row of
+    `targets`, controlling for each row of `controls`, and their zero-order
+    correlations.
+
+    Missing values should be `NaN`. Each target is correlated over the samples
+    present in it, the primary vector and all the controls. The targets are
+    grouped by their pattern of missing values, and the primary vector and the
+    targets of each group are residualised on the controls with a single
+    least-squares solve. The results match those of `pingouin.partial_corr` and
+    `pingouin.corr`.
+
+    Returns:
+        A tuple of five 1-D arrays, with an item for each target: the partial
+        correlation coefficients and their p-values, the zero-order correlation
+        coefficients and their p-values, and the number of samples used.
+    """
+    if method not in ("pearson", "spearman"):
+        raise ValueError(f"Unsupported correlation method '{method}'.")
+    primary = np.asarray(primary, dtype=np.float64)
+    controls = np.asarray(controls, dtype=np.float64).reshape(
+        -1, primary.shape[0])
+    targets = np.asarray(targets, dtype=np.float64).reshape(
+        -1, primary.shape[0])
+    mask = ~(np.isnan(targets) | np.isnan(primary)
+             | np.isnan(controls).any(axis=0))
+    num_overlap = mask.sum(axis=1)
+    partial, zero_order = (np.full(targets.shape[0], np.nan) for _ in range(2))
+
+    patterns, groups = np.unique(mask, axis=0, return_inverse=True)
+    order = np.argsort(groups.ravel(), kind="stable")
+    for samples, members in zip(patterns, np.split(
+            order, np.cumsum(np.bincount(groups.ravel()))[:-1])):
+        if samples.sum() < 3:
+            continue
+        partial[members], zero_order[members] = __partial_correlate_group__(
+            primary[samples], controls[:, samples],
+            targets[np.ix_(members, samples)], method)
+
+    return (
+        partial,
+        correlation_p_values(partial, num_overlap - controls.shape[0]),
+        zero_order, correlation_p_values(zero_order, num_overlap),
+        num_overlap)
+
+
+def sample_values_matrix(
+        samples: Sequence[str],
+        target_dataset: Sequence[dict]) -> tuple[list, np.ndarray]:
+    """Build a (traits x samples) array of the target traits' values, for the
+    given samples, from the GN2-style list of target traits, i.e.
+
+        [{"trait_id": …, "trait_sample_data": {sample: value, …}}, …]
+
+    Samples missing from a trait, or with a `None` value, are set to `NaN`."""
+    trait_ids = [trait["trait_id"] for trait in target_dataset]
+    matrix = np.array(
+        [[trait["trait_sample_data"].get(sample) for sample in samples]
+         for trait in target_dataset],
+        dtype=np.float64).reshape(len(trait_ids), len(samples))
+    return trait_ids, matrix
+
+
+def __sample_correlation_results__(# pylint: disable=[too-many-arguments, too-many-positional-arguments]
+        trait_ids: Sequence, coeffs: np.ndarray, p_values: np.ndarray,
+        num_overlap: np.ndarray, top_n: Optional[int]) -> list[dict[str, Any]]:
+    """Select the correlations to report, strongest first, and only build the
+    result dicts for those."""
+    keep = np.flatnonzero((num_overlap >= MIN_OVERLAP) & ~np.isnan(coeffs))
+    order = keep[top_n_indices(np.abs(coeffs[keep]), top_n)]
+    return [{trait_ids[idx]: {
+        "corr_coefficient": float(coeffs[idx]),
+        "p_value": float(p_values[idx]),
+        "num_overlap": int(num_overlap[idx])
+    }} for idx in order]
+
+
+def compute_matrix_sample_correlation(
+        this_trait: dict, target_dataset: Sequence[dict],
+        corr_method: str = "pearson",
+        top_n: Optional[int] = None) -> list[dict[str, Any]]:
+    """Vectorised alternative to
+    `gn3.computations.correlations.compute_all_sample_correlation`.
+
+    Takes the same input and returns the same structure: a list of
+    `{trait_id: {"corr_coefficient": …, "p_value": …, "num_overlap": …}}`
+    items sorted by the absolute value of the correlation coefficient, in
+    descending order. If `top_n` is given, only the first `top_n` of those
+    items are returned."""
+    samples = list(this_trait["trait_sample_data"].keys())
+    primary = np.array(
+        [this_trait["trait_sample_data"][sample] for sample in samples],
+        dtype=np.float64)
+    trait_ids, targets = sample_values_matrix(samples, target_dataset)
+    return __sample_correlation_results__(
+        trait_ids, *correlate_matrix(primary, targets, corr_method), top_n)
+
+
+def compute_dataset_sample_correlation(# pylint: disable=[too-many-arguments, too-many-positional-arguments]
+        this_trait: dict, strains: Sequence[str], trait_ids: Sequence[str],
+        matrix: np.ndarray, corr_method: str = "pearson",
+        top_n: Optional[int] = None) -> list[dict[str, Any]]:
+    """Correlate `this_trait` against every trait of a whole dataset, given as
+    a (traits x strains) `matrix` with NaN for missing values, e.g. one read
+    from `gn3.phenodb`.
+
+    The primary trait's samples are aligned to the dataset's `strains` by name.
+    The results have the same structure as those of
+    `compute_matrix_sample_correlation`."""
+    samples = this_trait["trait_sample_data"]
+    primary = np.array(
+        [samples.get(strain) for strain in strains], dtype=np.float64)
+    return __sample_correlation_results__(
+        trait_ids, *correlate_matrix(primary, matrix, corr_method), top_n)
+
+
+def tissue_values_matrix(
+        trait_symbol_dict: dict,
+        symbol_tissue_vals_dict: dict) -> tuple[list, np.ndarray, np.ndarray]:
+    """Build a (symbols x tissues) array of the tissue values of the traits'
+    gene symbols, with one row per distinct symbol.
+
+    Returns the ids of the traits that have tissue values, the index of each
+    such trait's row in the array, and the array. Symbols are matched
+    case-insensitively, as in
+    `gn3.computations.correlations.process_trait_symbol_dict`."""
+    symbol_index: dict[str, int] = {}
+    trait_ids, rows = [], []
+    for trait_id, symbol in trait_symbol_dict.items():
+        if symbol is None or symbol.lower() not in symbol_tissue_vals_dict:
+            continue
+        trait_ids.append(trait_id)
+        rows.append(symbol_index.setdefault(symbol.lower(), len(symbol_index)))
+    matrix = np.array(
+        [symbol_tissue_vals_dict[symbol] for symbol in symbol_index],
+        dtype=np.float64)
+    return trait_ids, np.array(rows, dtype=np.intp), matrix
+
+
+def compute_matrix_tissue_correlation(
+        primary_tissue_dict: dict, target_tissues_data: dict,
+        corr_method: str = "pearson",
+        top_n: Optional[int] = None) -> list[dict[str, Any]]:
+    """Vectorised alternative to
+    `gn3.computations.correlations.compute_tissue_correlation`, with the same
+    input and output.
+
+    The primary tissue vector is correlated against the values of each
+    distinct gene symbol at once, and the results mapped back to the traits
+    through the symbol index."""
+    primary = np.asarray(primary_tissue_dict["tissue_values"], dtype=np.float64)
+    trait_ids, rows, matrix = tissue_values_matrix(
+        target_tissues_data["trait_symbol_dict"],
+        target_tissues_data["symbol_tissue_vals_dict"])
+    coeffs, p_values, _num_overlap = correlate_matrix(
+        primary, matrix.reshape(-1, primary.shape[0]), corr_method)
+    coeffs, p_values = coeffs[rows], p_values[rows]
+    # e.g. the symbols whose tissue values are constant
+    keep = np.flatnonzero(~np.isnan(coeffs))
+    return [{trait_ids[idx]: {
+        "tissue_corr": float(coeffs[idx]),
+        "tissue_number": primary.shape[0],
+        "tissue_p_val": float(p_values[idx])
+    }} for idx in keep[top_n_indices(np.abs(coeffs[keep]), top_n)]]
@@ -7,9 +7,9 @@ GeneNetwork1.
 
 import math
 import warnings
-from multiprocessing import Pool, cpu_count
 from functools import reduce, partial
-from typing import Any, Tuple, Union, Sequence, Generator
+from typing import (
+    Any, Tuple, Union, Iterable, Iterator, Optional, Sequence, Generator)
 
 import numpy
 import pandas
@@ -17,10 +17,14 @@ import pingouin
 from scipy.stats import pearsonr, spearmanr
 
 from gn3.chancy import random_string
+from gn3.phenodb import PhenotypeReader
+from gn3.dataset_matrices import dataset_matrix
 from gn3.function_helpers import  compose
+from gn3.computations.top_n import top_n_items
+from gn3.computations.matrix_correlations import partial_correlate_matrix
 from gn3.data_helpers import parse_csv_line
 from gn3.db.datasets import retrieve_trait_dataset
-from gn3.db.traits import export_trait_data, export_informative
+from gn3.db.traits import TraitData, export_trait_data, export_informative
 from gn3.db.partial_correlations import traits_info, traits_data
 from gn3.db.species import species_name, translate_to_mouse_gene_id
 from gn3.db.correlations import (
@@ -32,6 +36,9 @@ from gn3.db.correlations import (
     check_symbol_for_tissue_correlation,
     fetch_gene_symbol_tissue_value_dict_for_trait)
 
+# Number of traits read from a dataset's text file at a time
+TEXT_DATABASE_CHUNK_SIZE = 1000
+
 def control_samples(controls: Sequence[dict], sampleslist: Sequence[str]):
     """
     Fetches data for the control traits.
@@ -208,7 +215,63 @@ def good_dataset_samples_indexes(
         samples_from_file.index(good) for good in
         set(samples).intersection(set(samples_from_file))))
 
-def partial_correlations_fast(# pylint: disable=[R0913, R0914, too-many-positional-arguments]
+def __float_or_nan__(value) -> float:
+    """Convert a sample's value to a float, with missing values as NaN."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return numpy.nan
+
+def __values_matrix__(rows, num_samples: int) -> numpy.ndarray:
+    """Build a (rows x samples) float array of the values in `rows`, truncating
+    or padding (with NaN) each row to `num_samples` values."""
+    matrix = numpy.full((len(rows), num_samples), numpy.nan)
+    for idx, row in enumerate(rows):
+        values = tuple(__float_or_nan__(val) for val in row[:num_samples])
+        matrix[idx, :len(values)] = values
+    return matrix
+
+def read_text_database(
+        database_filename: str, samples: Sequence[str],
+        trait_names: Iterable[str],
+        chunk_size: int = TEXT_DATABASE_CHUNK_SIZE) -> Iterator[
+            Tuple[Tuple[str, ...], numpy.ndarray]]:
+    """
+    Read the values of the traits named in `trait_names` from a dataset's text
+    file (see `gn3.db.correlations.get_filename`), in chunks of up to
+    `chunk_size` traits.
+
+    The file is read a line at a time, and only the lines of the wanted traits
+    are parsed. Each chunk is yielded as the tuple of the traits' names, and a
+    (traits x samples) float array of their values, with a column for each of
+    `samples` in order, and NaN for missing values.
+    """
+    wanted = set(trait_names)
+    with open(database_filename, "r", encoding="utf-8") as dataset_file:
+        file_samples = parse_csv_line(dataset_file.readline())[1:]
+        positions = {sample: idx for idx, sample in enumerate(file_samples)}
+        columns = numpy.array(
+            [positions.get(sample, -1) for sample in samples], dtype=int)
+        present = columns >= 0
+        names: list = []
+        chunk = numpy.full((chunk_size, len(samples)), numpy.nan)
+        for line in dataset_file:
+            if line.split(",", maxsplit=1)[0].strip('" \t\n') not in wanted:
+                continue
+            trait_line = parse_csv_line(line)
+            values = numpy.array(
+                [__float_or_nan__(val) for val in trait_line[1:]] + [numpy.nan])
+            chunk[len(names), present] = values[
+                numpy.minimum(columns[present], len(values) - 1)]
+            names.append(trait_line[0])
+            if len(names) == chunk_size:
+                yield tuple(names), chunk
+                names, chunk = [], numpy.full(
+                    (chunk_size, len(samples)), numpy.nan)
+        if len(names) > 0:
+            yield tuple(names), chunk[:len(names)]
+
+def partial_correlations_fast(# pylint: disable=[R0913, too-many-positional-arguments]
         samples, primary_vals, control_vals, database_filename,
         fetched_correlations, method: str, correlation_type: str) -> Generator:
     """
@@ -217,29 +280,82 @@ def partial_correlations_fast(# pylint: disable=[R0913, R0914, too-many-position
     This is a partial migration of the
     `web.webqtl.correlation.PartialCorrDBPage.getPartialCorrelationsFast`
     function in GeneNetwork1.
+
+    The file is streamed in chunks (see `read_text_database`), each chunk being
+    correlated as it is read.
     """
     assert method in ("spearman", "pearson")
-    with open(database_filename, "r", encoding="utf-8") as dataset_file: # pytest: disable=[W1514]
-        dataset = tuple(dataset_file.readlines())
-
-    good_dataset_samples = good_dataset_samples_indexes(
-        samples, parse_csv_line(dataset[0])[1:])
-
-    def __process_trait_names_and_values__(acc, line):
-        trait_line = parse_csv_line(line)
-        trait_name = trait_line[0]
-        trait_data = trait_line[1:]
-        if trait_name in fetched_correlations.keys():
-            yield acc + ((trait_name,) + tuple(
-                trait_data[i] if i in good_dataset_samples else None
-                for i in range(len(trait_data))))
-        yield acc
-
-    processed_target_traits: tuple = reduce(
-        __process_trait_names_and_values__, dataset[1:], tuple())
-
-    all_correlations = compute_partial(
-        primary_vals, control_vals, processed_target_traits, 1, method)
+    return __correlate_chunks__(
+        read_text_database(
+            database_filename, samples, fetched_correlations.keys()),
+        primary_vals, control_vals, len(samples), fetched_correlations,
+        method, correlation_type)
+
+def read_dataset_matrix(
+        pheno: PhenotypeReader, samples: Sequence[str],
+        trait_names: Optional[Iterable[str]] = None,
+        chunk_size: int = TEXT_DATABASE_CHUNK_SIZE) -> Iterator[
+            Tuple[Tuple[str, ...], numpy.ndarray]]:
+    """
+    Read the values of the traits named in `trait_names`, or of all the
+    traits, from a dataset's memory-mapped matrix (see
+    `gn3.dataset_matrices`), in chunks of up to `chunk_size` traits.
+
+    The chunks are the same as those of `read_text_database`.
+    """
+    positions = {sample: idx for idx, sample in enumerate(pheno.strains)}
+    columns = numpy.array(
+        [positions.get(sample, -1) for sample in samples], dtype=int)
+    present = columns >= 0
+    rows = numpy.arange(len(pheno.traits)) if trait_names is None else (
+        numpy.array(sorted(
+            pheno.trait_index[name] for name in set(trait_names)
+            if name in pheno.trait_index), dtype=int))
+    with pheno.matrix() as matrix:
+        for start in range(0, len(rows), chunk_size):
+            chunk_rows = rows[start:start + chunk_size]
+            chunk = numpy.full((len(chunk_rows), len(samples)), numpy.nan)
+            chunk[:, present] = matrix[numpy.ix_(chunk_rows, columns[present])]
+            yield tuple(pheno.traits[row] for row in chunk_rows), chunk
+
+def partial_correlations_from_matrix(# pylint: disable=[R0913, too-many-positional-arguments]
+        samples, primary_vals, control_vals, pheno: PhenotypeReader,
+        fetched_correlations: Optional[dict], method: str,
+        correlation_type: str) -> Generator:
+    """
+    Computes partial correlation coefficients using a dataset's precomputed
+    matrix (see `gn3.dataset_matrices`).
+
+    With `fetched_correlations`, only the traits that have literature or tissue
+    correlations are correlated, and those correlations are added to the
+    results, as in `partial_correlations_fast`. Otherwise, all the traits in the
+    dataset are correlated.
+    """
+    return __correlate_chunks__(
+        read_dataset_matrix(
+            pheno, samples,
+            None if fetched_correlations is None
+            else fetched_correlations.keys()),
+        primary_vals, control_vals, len(samples), fetched_correlations,
+        method, correlation_type)
+
+def __correlate_chunks__(# pylint: disable=[R0913, too-many-positional-arguments]
+        chunks, primary_vals, control_vals, num_samples: int,
+        fetched_correlations: Optional[dict], method: str,
+        correlation_type: str) -> Generator:
+    """
+    Correlate each chunk of target traits as it is read, adding the fetched
+    literature or tissue correlations, if any, to the results.
+    """
+    primary = __values_matrix__((primary_vals,), num_samples)[0]
+    controls = __values_matrix__(control_vals, num_samples)
+    all_correlations = (
+        corr
+        for names, values in chunks
+        for corr in __partial_correlations__(
+                names, primary, controls, values, method))
+    if fetched_correlations is None:
+        return all_correlations
     ## Line 772 to 779 in GN1 are the cause of the weird complexity in the
     ## return below. Once the surrounding code is successfully migrated and
     ## reworked, this complexity might go away, by getting rid of the
@@ -272,53 +388,35 @@ def compute_trait_info(primary_vals, control_vals, target, method):
     """
     Compute the correlation values for the given arguments.
     """
-    targ_vals = target[0]
-    targ_name = target[1]
-    def __remove_nones__(acc, items):
-        prim, targ, *conts = items
-        if targ is None:
-            return acc
-        old_conts = acc["controls"]
-        return {
-            "primary": acc["primary"] + [prim],
-            "targets": acc["targets"] + [targ],
-            "controls": [
-                old_conts[idx] + [cont]
-                for idx, cont in enumerate(conts)
-            ]
-        }
-    processed = reduce(
-        __remove_nones__, zip(primary_vals, targ_vals, *control_vals),
-        {
-            "primary":[], "targets": [],
-            "controls": [[] for idx in range(0, len(control_vals))]
-        })
-
-    if len(processed["primary"]) < 4:
-        return None
-
-    datafrm = build_data_frame(
-        processed["primary"], processed["targets"], processed["controls"])
-    covariates = "z" if datafrm.shape[1] == 3 else [
-        col for col in datafrm.columns if col not in ("x", "y")]
-    ppc = pingouin.partial_corr(
-        data=datafrm, x="x", y="y", covar=covariates, method=(
-            "pearson" if "pearson" in method.lower() else "spearman"))
-    pc_coeff = ppc["r"][0]
-
-    zero_order_corr = pingouin.corr(
-        datafrm["x"], datafrm["y"], method=(
-            "pearson" if "pearson" in method.lower() else "spearman"))
-
-    if math.isnan(pc_coeff):
-        return (
-            targ_name, len(processed["primary"]), pc_coeff, 1,
-            zero_order_corr["r"][0], zero_order_corr["p-val"][0])
+    return next(compute_partial(
+        primary_vals, control_vals, ((target[1], *target[0]),), 1, method),
+                None)
+
+def __partial_correlations__(
+        names: Sequence[str], primary: numpy.ndarray, controls: numpy.ndarray,
+        targets: numpy.ndarray, method: str) -> Generator:
+    """
+    Compute the partial correlations of the `primary` values with each row of
+    the `targets` array, named by `names`, skipping the targets with fewer than
+    4 samples that have values.
+    """
+    partial_r, partial_p, zero_r, zero_p, num_overlap = partial_correlate_matrix(
+        primary, controls, targets,
+        "pearson" if "pearson" in method.lower() else "spearman")
+
+    def __p_value__(coeff, p_value):
+        if math.isnan(coeff):
+            return 1
+        if math.isnan(p_value):
+            return 0 if (abs(coeff - 1) < 0.0000001) else 1
+        return float(p_value)
+
     return (
-        targ_name, len(processed["primary"]), pc_coeff,
-        (ppc["p-val"][0] if not math.isnan(ppc["p-val"][0]) else (
-            0 if (abs(pc_coeff - 1) < 0.0000001) else 1)),
-        zero_order_corr["r"][0], zero_order_corr["p-val"][0])
+        (name, int(num), float(pcoeff), __p_value__(pcoeff, pval),
+         float(zcoeff), float(zpval))
+        for name, num, pcoeff, pval, zcoeff, zpval in zip(
+                names, num_overlap, partial_r, partial_p, zero_r, zero_p)
+        if num >= 4)
 
 def compute_partial(
         primary_vals, control_vals, targets, data_start_pos,
@@ -330,19 +428,19 @@ def compute_partial(
     `web.webqtl.correlation.correlationFunction.determinePartialsByR` function
     in GeneNetwork1.
 
-    This implementation reworks the child function `compute_partial` which will
-    then be used in the place of `determinPartialsByR`.
+    All the targets are correlated in bulk (see
+    `gn3.computations.matrix_correlations.partial_correlate_matrix`). Targets
+    with fewer than 4 samples that have values are skipped.
     """
-    with Pool(processes=cpu_count() - 1) as pool:
-        return (
-            result for result in (
-                pool.starmap(
-                    compute_trait_info,
-                    ((
-                        primary_vals, control_vals,
-                        (target[data_start_pos:], target[0]), method)
-                     for target in targets)))
-        if result is not None)
+    targets = tuple(targets)
+    num_samples = len(primary_vals)
+    return __partial_correlations__(
+        tuple(target[0] for target in targets),
+        __values_matrix__((primary_vals,), num_samples)[0],
+        __values_matrix__(control_vals, num_samples),
+        __values_matrix__(
+            tuple(target[data_start_pos:] for target in targets), num_samples),
+        method)
 
 def partial_correlations_normal(# pylint: disable=[R0913, too-many-positional-arguments]
         primary_vals, control_vals, input_trait_gene_id, trait_database,
@@ -380,18 +478,41 @@ def partial_correlations_normal(# pylint: disable=[R0913, too-many-positional-ar
 
     return all_correlations
 
-def partial_corrs(# pylint: disable=[R0913, too-many-positional-arguments]
+def partial_corrs(# pylint: disable=[R0913, R0914, too-many-positional-arguments]
         conn, samples, primary_vals, control_vals, return_number, species,
         input_trait_geneid, input_trait_symbol, tissue_probeset_freeze_id,
-        method, dataset, database_filename):
+        method, dataset, database_filename, matrices_dir: str = "",
+        redis_uri: Optional[str] = None):
     """
     Compute the partial correlations, selecting the fast or normal method
-    depending on the existence of the database text file.
+    depending on the existence of the database text file. Without a text file,
+    the dataset's precomputed matrix in `matrices_dir` (see
+    `gn3.dataset_matrices`) is used, if there is one, and is up to date with
+    the correlation cache's generation in the Redis at `redis_uri`.
 
     This is a partial migration of the
     `web.webqtl.correlation.PartialCorrDBPage.__init__` function in
     GeneNetwork1.
     """
+    correlation_type = (
+        "literature" if method.lower() == "sgo literature correlation"
+        else ("tissue" if "tissue" in method.lower() else "genetic"))
+    pheno = None if database_filename else dataset_matrix(
+        conn, matrices_dir, dataset["dataset_name"], dataset["dataset_type"],
+        redis_uri)
+    if pheno is not None:
+        return partial_correlations_from_matrix(
+            samples, primary_vals, control_vals, pheno,
+            ((fetch_literature_correlations(
+                species, input_trait_geneid, dataset, return_number, conn)
+              if correlation_type == "literature" else
+              fetch_tissue_correlations(
+                  dataset, input_trait_symbol, tissue_probeset_freeze_id,
+                  method, return_number, conn))
+             if (correlation_type != "genetic" and input_trait_geneid
+                 and dataset["dataset_type"] == "ProbeSet") else None),
+            method, correlation_type)
+
     if database_filename:
         return partial_correlations_fast(
             samples, primary_vals, control_vals, database_filename,
@@ -402,9 +523,7 @@ def partial_corrs(# pylint: disable=[R0913, too-many-positional-arguments]
                 fetch_tissue_correlations(
                     dataset, input_trait_symbol, tissue_probeset_freeze_id,
                     method, return_number, conn)),
-            method,
-            ("literature" if method.lower() == "sgo literature correlation"
-             else ("tissue" if "tissue" in method.lower() else "genetic")))
+            method, correlation_type)
 
     trait_database, data_start_pos = fetch_all_database_data(
         conn, species, input_trait_geneid, input_trait_symbol, samples, dataset,
@@ -673,7 +792,9 @@ def partial_correlations_with_target_db(# pylint: disable=[R0913, R0914, R0911 t
         method: str,
         criteria: int,
         target_db_name: str,
-        textdir: str
+        textdir: str,
+        matrices_dir: str = "",
+        redis_uri: Optional[str] = None
 ) -> dict:
     """
     This is the 'ochestration' function for the partial-correlation feature.
@@ -766,7 +887,7 @@ def partial_correlations_with_target_db(# pylint: disable=[R0913, R0914, R0911 t
         len(check_res["fixed_primary_values"]), check_res["species"],
         input_trait_geneid, input_trait_symbol, tissue_probeset_freeze_id,
         method, {**target_dataset, "dataset_type": target_dataset["type"]},
-        database_filename)
+        database_filename, matrices_dir, redis_uri)
 
 
     def __make_sorter__(method):
@@ -787,9 +908,8 @@ def partial_correlations_with_target_db(# pylint: disable=[R0913, R0914, R0911 t
             tissue_correlation_by_list, conn, input_trait_symbol,
             tissue_probeset_freeze_id, method))
 
-    selected_results = sorted(
-        all_correlations,
-        key=__make_sorter__(method))[:criteria]
+    selected_results = top_n_items(
+        all_correlations, key=__make_sorter__(method), top_n=criteria)
     traits_list_corr_info = {
         f"{target_dataset['dataset_name']}::{item[0]}": {
             "noverlap": item[1],
@@ -843,7 +963,9 @@ def partial_correlations_with_target_traits(
     target_traits = {
         trait["trait_name"]: trait
         for trait in traits_info(conn, threshold, target_trait_names)}
-    target_traits_data = traits_data(conn, tuple(target_traits.values()))
+    target_traits_data = {
+        trait_name: TraitData.from_dict(data) for trait_name, data in
+        traits_data(conn, tuple(target_traits.values())).items()}
 
     def __merge(trait, pcorrs):
         return {
@@ -855,17 +977,15 @@ def partial_correlations_with_target_traits(
             "corr_p_value": pcorrs[5]}
 
     all_pcorrs = (
-        __merge(
-            target_traits[target_name],
-            compute_trait_info(
+        __merge(target_traits[pcorrs[0]], pcorrs)
+        for pcorrs in compute_partial(
                 check_res["primary_values"],
                 check_res["fixed_control_values"],
-                (export_trait_data(
+                tuple((target_name, *export_trait_data(
                     target_data,
-                    samplelist=check_res["common_primary_control_samples"]),
-                 target_name),
-                method))
-        for target_name, target_data in target_traits_data.items())
+                    samplelist=check_res["common_primary_control_samples"]))
+                      for target_name, target_data in target_traits_data.items()),
+                1, method))
 
     return {
         "status": "success",
@@ -1,12 +1,32 @@
 """
 This module contains functions to interact with the `qtlreaper` utility for
 computation of QTLs.
+
+`run_reaper_for_traits` maps many traits at once: the traits are split into
+chunks that are mapped in parallel, and each trait's results are cached, keyed
+on the genotype file, the trait's values and the `qtlreaper` options, so that
+only new or changed traits are mapped again. The cached results that have not
+been used for `REAPER_CACHE_TTL` seconds are removed, so that the cache does
+not grow without bound.
 """
 import os
+import time
+import json
+import hashlib
+import tempfile
 import subprocess
-from typing import Union
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Optional, Sequence, Union
+
+import numpy as np
 
 from gn3.chancy import random_string
+from gn3.fs_helpers import get_hash_of_files
+
+# Number of traits mapped by each `qtlreaper` process
+REAPER_CHUNK_SIZE = 5
+# Seconds for which unused cached results are kept
+REAPER_CACHE_TTL = 7 * 24 * 60 * 60
 
 def generate_traits_file(samples, trait_values, traits_filename):
     """
@@ -105,63 +125,214 @@ def organise_reaper_main_results(parsed_results):
     """
     Provide the results of running reaper in a format that is easier to use.
     """
-    def __organise_by_chromosome(chr_name, items):
-        chr_items = [item for item in items if item["Chr"] == chr_name]
-        return {
-            "Chr": chr_name,
-            "loci": [{
-                "Locus": locus["Locus"],
-                "cM": locus["cM"],
-                "Mb": locus["Mb"],
-                "LRS": locus["LRS"],
-                "Additive": locus["Additive"],
-                "pValue": locus["pValue"]
-            } for locus in chr_items]}
-
-    def __organise_by_id(identifier, items):
-        id_items = [item for item in items if item["ID"] == identifier]
-        unique_chromosomes = {item["Chr"] for item in id_items}
-        return {
+    by_id = {}
+    for locus in parsed_results:
+        by_id.setdefault(locus["ID"], {}).setdefault(locus["Chr"], []).append({
+            "Locus": locus["Locus"],
+            "cM": locus["cM"],
+            "Mb": locus["Mb"],
+            "LRS": locus["LRS"],
+            "Additive": locus["Additive"],
+            "pValue": locus["pValue"]
+        })
+    return {
+        identifier: {
             "ID": identifier,
             "chromosomes": {
-                _chr["Chr"]: _chr for _chr in [
-                    __organise_by_chromosome(chromo, id_items)
-                    for chromo in sorted(
-                        unique_chromosomes, key=chromosome_sorter_key_fn)]}}
+                chromo: {"Chr": chromo, "loci": by_id[identifier][chromo]}
+                for chromo in sorted(
+                    by_id[identifier], key=chromosome_sorter_key_fn)}}
+        for identifier in sorted(by_id)}
 
-    unique_ids = {res["ID"] for res in parsed_results}
-    return {
-        trait["ID"]: trait for trait in
-        [__organise_by_id(_id, parsed_results) for _id in sorted(unique_ids)]}
+def __parse_column__(values: Sequence[str], dtype: type) -> list:
+    """Convert a whole column of `values` to `dtype` at once, falling back to
+    converting each value separately, and keeping the values that cannot be
+    converted as they are."""
+    try:
+        return np.array(values, dtype=dtype).tolist()
+    except ValueError:
+        pass
+
+    def __convert__(value):
+        try:
+            return dtype(value)
+        except ValueError:
+            return value
+    return [__convert__(value) for value in values]
+
+def read_reaper_main_columns(results_file) -> dict[str, list]:
+    """
+    Read the results file of running QTLReaper column by column, into a dict of
+    the column names and their values.
+
+    The first two columns (the trait ID and locus) are kept as strings, the
+    chromosomes are converted to integers, and the other columns to floats,
+    wherever possible.
+    """
+    with open(results_file, "r", encoding="utf8") as infile:
+        header = infile.readline().strip().split("\t")
+        columns = tuple(zip(*(
+            line.strip().split("\t") for line in infile if line.strip())))
+    if len(columns) == 0:
+        return {name: [] for name in header}
+    return dict(zip(header, (
+        list(columns[0]), list(columns[1]), __parse_column__(columns[2], int),
+        *(__parse_column__(column, float) for column in columns[3:]))))
 
 def parse_reaper_main_results(results_file):
     """
     Parse the results file of running QTLReaper into a list of dicts.
     """
-    with open(results_file, "r", encoding="utf8") as infile:
-        lines = infile.readlines()
+    columns = read_reaper_main_columns(results_file)
+    return [dict(zip(columns.keys(), row)) for row in zip(*columns.values())]
 
-    def __parse_column_float_value(value):
-        # pylint: disable=W0702
-        try:
-            return float(value)
-        except:
-            return value
+def __trait_cache_key__(
+        genotype_hash: str, samples: Sequence[str], values: Sequence,
+        other_options: Sequence[str]) -> str:
+    """Key the results of mapping a trait with everything that determines
+    them."""
+    return hashlib.sha256(json.dumps(
+        [genotype_hash, list(samples), [str(value) for value in values],
+         list(other_options)]).encode("utf-8")).hexdigest()
 
-    def __parse_column_int_value(value):
-        # pylint: disable=W0702
-        try:
-            return int(value)
-        except:
-            return value
+def __write_atomically__(path: str, results: list[dict]):
+    """Write the `results` for a single trait to the cache file at `path`, so
+    that concurrent readers never see a partially written file."""
+    with tempfile.NamedTemporaryFile(
+            "w", encoding="utf8", dir=os.path.dirname(path),
+            delete=False) as outfile:
+        json.dump(results, outfile)
+    os.replace(outfile.name, path)
 
-    def __parse_line(line):
-        items = line.strip().split("\t")
-        return items[0:2] + [__parse_column_int_value(items[2])] + [
-            __parse_column_float_value(item) for item in items[3:]]
+def __map_chunk__(
+        reaper_cmd: str, genotype_filename: str, samples: Sequence[str],
+        chunk: Sequence[tuple[str, Sequence]], output_dir: str,
+        other_options: tuple):
+    """Map the traits in `chunk`, a sequence of (cache file, trait values)
+    pairs, with a single `qtlreaper` process, and cache each trait's results."""
+    traits_filename = (
+        f"{output_dir}/qtlreaper/traits_file_{random_string(10)}.txt")
+    generate_traits_file(
+        samples, [values for _path, values in chunk], traits_filename)
+    try:
+        main_output, _permu_output = run_reaper(
+            reaper_cmd, genotype_filename, traits_filename, output_dir,
+            other_options)
+    finally:
+        os.remove(traits_filename)
+    by_trait: dict[str, list] = {}
+    for locus in parse_reaper_main_results(main_output):
+        by_trait.setdefault(locus["ID"], []).append(locus)
+    os.remove(main_output)
+    # `generate_traits_file` numbers the traits from 1, in order.
+    for idx, (path, _values) in enumerate(chunk):
+        __write_atomically__(path, by_trait.get(str(idx + 1), []))
+
+def __map_in_chunks__(
+        map_chunk: Callable[[Sequence], None], to_map: Sequence,
+        chunk_size: int, workers: Optional[int],
+        progress: Optional[Callable[[int, int], None]]):
+    """Call `map_chunk` on each chunk of `to_map`, with up to `workers` chunks
+    mapped at a time, reporting the `progress` as the chunks complete."""
+    # The `qtlreaper` processes do the work, so threads suffice to run them.
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(map_chunk, to_map[start:start + chunk_size]): len(
+                to_map[start:start + chunk_size])
+            for start in range(0, len(to_map), chunk_size)}
+        mapped = 0
+        for future in as_completed(futures):
+            future.result()
+            mapped += futures[future]
+            if progress is not None:
+                progress(mapped, len(to_map))
+
+def __is_cached__(path: str) -> bool:
+    """Check whether the results at `path` are cached, marking them as used if
+    so, which keeps them from being removed as stale."""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def __remove_stale__(cache_dir: str, max_age: float):
+    """Remove the files in `cache_dir` that were not used, nor written, in the
+    last `max_age` seconds: stale results and leftovers of interrupted
+    writes."""
+    oldest = time.time() - max_age
+    with os.scandir(cache_dir) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < oldest:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass # Removed by a concurrent run
+
+def __read_cached_results__(paths: Sequence[str]) -> list[dict]:
+    """Read the cached results for each trait, numbering the traits from "1" in
+    the order of `paths`."""
+    results: list[dict] = []
+    for idx, path in enumerate(paths):
+        with open(path, "r", encoding="utf8") as infile:
+            results.extend(
+                {**locus, "ID": str(idx + 1)} for locus in json.load(infile))
+    return results
+
+def run_reaper_for_traits(
+        reaper_cmd: str,
+        genotype_filename: str,
+        samples: Sequence[str],
+        trait_values: Sequence[Sequence],
+        output_dir: str,
+        other_options: tuple = ("--n_permutations", "1000"),
+        chunk_size: int = REAPER_CHUNK_SIZE,
+        workers: Optional[int] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+        cache_ttl: float = REAPER_CACHE_TTL) -> list[dict]:
+    """
+    Compute the QTLs of each of the traits in `trait_values`, reusing the
+    cached results of traits that have already been mapped. Cached results
+    unused for `cache_ttl` seconds are removed.
+
+    PARAMETERS:
+    samples: The samples, as for `generate_traits_file`.
+    trait_values: A list of lists of values for each trait and sample.
+    output_dir: A path to the directory where the outputs, and the cached
+        results, are put.
+    chunk_size: The number of traits mapped by each `qtlreaper` process.
+    workers: The maximum number of `qtlreaper` processes to run at a time.
+    progress: Called with the number of traits mapped so far, and the number
+        of traits to map, as the chunks complete.
+    cache_ttl: The number of seconds for which unused results are cached.
+
+    RETURNS:
+    The results in the format of `parse_reaper_main_results`, with the traits
+    numbered from "1", in the order of `trait_values`, as if all the traits had
+    been mapped with a single traits file.
+
+    RAISES:
+    A `subprocess.CalledProcessError` exception in case of any errors running
+    the `qtlreaper` command.
+    """
+    cache_dir = f"{output_dir}/qtlreaper/cache"
+    os.makedirs(cache_dir, exist_ok=True)
+    genotype_hash = get_hash_of_files([genotype_filename])
+    paths = [
+        os.path.join(cache_dir, __trait_cache_key__(
+            genotype_hash, samples, values, other_options) + ".json")
+        for values in trait_values]
+    to_map = list({
+        path: values for path, values in zip(paths, trait_values)
+        if not __is_cached__(path)}.items())
+    __remove_stale__(cache_dir, cache_ttl)
+    __map_in_chunks__(
+        lambda chunk: __map_chunk__(
+            reaper_cmd, genotype_filename, samples, chunk, output_dir,
+            other_options),
+        to_map, chunk_size, workers, progress)
 
-    header = lines[0].strip().split("\t")
-    return [dict(zip(header, __parse_line(line))) for line in lines[1:]]
+    return __read_cached_results__(paths)
 
 def parse_reaper_permutation_results(results_file):
     """
@@ -1,8 +1,9 @@
 """Procedures related to R/qtl computations"""
 import os
 import csv
+import json
 from bisect import bisect
-from typing import Dict, List, Tuple, Union
+from typing import Any, Dict, List, Tuple, Union
 
 import numpy as np
 
@@ -14,6 +15,10 @@ from gn3.fs_helpers import get_hash_of_files, assert_path_exists, get_tmpdir
 
 from gn3.debug import __pk__
 
+# The keyword arguments naming the genotype and phenotype files, whose contents,
+# rather than names, identify the results
+INPUT_FILE_KWARGS = ("g", "p", "geno", "pheno")
+
 def generate_rqtl_cmd(
     rqtl_wrapper_cmd: str,
     rqtl_wrapper_kwargs: Dict,
@@ -27,7 +32,7 @@ def generate_rqtl_cmd(
 
     # Generate a hash from contents of the genotype and phenotype files
     _hash = get_hash_of_files(
-        [v for k, v in rqtl_wrapper_kwargs.items() if k in ["g", "p"]]
+        [v for k, v in rqtl_wrapper_kwargs.items() if k in INPUT_FILE_KWARGS]
     )
 
     # Append to hash a hash of keyword arguments
@@ -36,7 +41,7 @@ def generate_rqtl_cmd(
             [
                 f"{k}:{v}"
                 for k, v in rqtl_wrapper_kwargs.items()
-                if k not in ["g", "p"]
+                if k not in INPUT_FILE_KWARGS
             ]
         )
     )
@@ -336,3 +341,61 @@ def process_perm_output(file_name: str) -> Tuple[List, float, float]:
         suggestive = np.percentile(np.array(perm_results), 67)
         significant = np.percentile(np.array(perm_results), 95)
     return perm_results, suggestive, significant
+
+
+def rqtl_result_id(output_file: str) -> str:
+    """The id of the results written to `output_file`: the hash of the inputs
+    that `generate_rqtl_cmd` computed the file name from."""
+    return output_file.removesuffix("-output.csv")
+
+
+def rqtl_result_files(output_file: str, pairscan: bool, nperm: int) -> List:
+    """The paths of the files that an R/qtl run writes its results to."""
+    outdir = os.path.join(get_tmpdir(), "gn3")
+    return [os.path.join(outdir, prefix + output_file) for prefix in (
+        "", *(("MAP_",) if pairscan else tuple()),
+        *(("PERM_",) if nperm > 0 else tuple()))]
+
+
+def rqtl_job_file(result_id: str) -> str:
+    """The path of the file describing the run that computes the results
+    identified by `result_id`."""
+    return os.path.join(get_tmpdir(), "gn3", f"{result_id}-job.json")
+
+
+def write_rqtl_job(output_file: str, job: Dict) -> str:
+    """Record `job`: how to process the results in `output_file` and, if they
+    are being computed, the id of the command computing them. Returns the id
+    of the results."""
+    result_id = rqtl_result_id(output_file)
+    with open(rqtl_job_file(result_id), "w", encoding="utf-8") as job_file:
+        json.dump({**job, "output_file": output_file}, job_file)
+    return result_id
+
+
+def read_rqtl_job(result_id: str) -> Dict:
+    """Read the record of the run that computes the results identified by
+    `result_id` (see `write_rqtl_job`)."""
+    with open(rqtl_job_file(result_id), "r", encoding="utf-8") as job_file:
+        return json.load(job_file)
+
+
+def rqtl_results(job: Dict) -> Dict:
+    """Process the results of the R/qtl run `job` (see `write_rqtl_job`): the
+    mapping or pair-scan results, and the permutation results and thresholds,
+    if permutations were run."""
+    output_file = job["output_file"]
+    rqtl_output: Dict[str, Any] = {}
+    if job["pairscan"]:
+        rqtl_output["results"] = process_rqtl_pairscan(
+            output_file, job["geno_file"])
+    else:
+        rqtl_output["results"] = process_rqtl_mapping(output_file)
+
+    if int(job["nperm"]) > 0:
+        (
+            rqtl_output["perm_results"],
+            rqtl_output["suggestive"],
+            rqtl_output["significant"],
+        ) = process_perm_output(f"PERM_{output_file}")
+    return rqtl_output
@@ -1,13 +1,19 @@
 """
 DESCRIPTION:
-    TODO: Add a description for the module
+    Single-linkage clustering of the traits in a heatmap, ported from
+    genenetwork1.
 
 FUNCTIONS:
 slink:
-    TODO: Describe what the function does...
+    Cluster members, given their distances from each other, by single linkage.
+nearest:
+    Compute the shortest distance between the members of two clusters.
 """
 import logging
-from typing import Union, Sequence
+from itertools import groupby
+from typing import Any, Union, Iterator, Sequence
+
+import numpy as np
 
 NumType = Union[int, float]
 SeqOfNums = Sequence[NumType]
@@ -133,65 +139,146 @@ def nearest(lists: Sequence[SeqOfNums], i, j) -> NumType:
 
     raise ValueError("member values (i or j) should be lists/tuples of integers or integers")
 
-# `lists` here could be Sequence[SeqOfNums], but that leads to errors I do not
-# understand down the line
-# Might have to re-implement the function especially since the errors are thrown
-# where `listindexcopy` is involved
+def __distance_matrix(lists) -> np.ndarray:
+    """Check that `lists` is a valid distance matrix, once, and convert it to a
+    NumPy array. `lists` can also be a square NumPy array already."""
+    if isinstance(lists, np.ndarray):
+        if lists.ndim != 2 or lists.shape[0] != lists.shape[1]:
+            raise LengthError(
+                "All children lists should be same length as the parent.")
+    else:
+        __raise_valueerror_if_data_is_not_lists_or_tuples(lists)
+        __raise_valueerror_if_lists_empty(lists)
+        __raise_lengtherror_if_child_lists_are_not_same_as_parent(lists)
+    try:
+        distances = np.asarray(lists, dtype=float)
+    except ValueError as _verr:
+        raise TypeError("Distances should be numbers.") from _verr
+    if np.any(np.diag(distances) != 0):
+        raise ValueError(
+            "Distance of each child list/tuple from itself should be zero!")
+    if not np.array_equal(distances, distances.T):
+        raise MirrorError((
+            "Distance from one child to the other should be the same in both "
+            "directions."))
+    if np.any(distances < 0):
+        raise ValueError("Distances should be positive.")
+    if not np.all(np.isfinite(distances)):
+        raise ValueError("Distances should be finite.")
+    return distances
+
+def __minimum_spanning_tree(distances: np.ndarray) -> list[
+        tuple[int, int, float]]:
+    """Compute the edges of a minimum spanning tree of the complete graph with
+    the given `distances`, with Prim's algorithm, in O(n^2) time. The edges are
+    sorted by increasing distance."""
+    size = distances.shape[0]
+    in_tree = np.zeros(size, dtype=bool)
+    in_tree[0] = True
+    distance_to_tree = distances[0].copy()
+    distance_to_tree[0] = np.inf
+    nearest_in_tree = np.zeros(size, dtype=np.intp)
+    edges = []
+    for _ in range(size - 1):
+        member = int(np.argmin(distance_to_tree))
+        edges.append((int(nearest_in_tree[member]), member,
+                      float(distance_to_tree[member])))
+        in_tree[member] = True
+        distance_to_tree[member] = np.inf
+        closer = (distances[member] < distance_to_tree) & ~in_tree
+        distance_to_tree[closer] = distances[member][closer]
+        nearest_in_tree[closer] = member
+    return sorted(edges, key=lambda edge: edge[2])
+
+def __equidistant_merges(distances: np.ndarray, clusters: list[list[int]],
+                         count: int) -> Iterator[tuple[int, int]]:
+    """Merge `count` pairs of the equally distant `clusters` (lists of members,
+    sorted by their smallest member) one pair at a time, the pair with the
+    smallest members first, yielding the indexes of the clusters merged."""
+    between = np.array([
+        [np.inf if idx_i == idx_j else
+         distances[np.ix_(members_i, members_j)].min()
+         for idx_j, members_j in enumerate(clusters)]
+        for idx_i, members_i in enumerate(clusters)])
+    # Only scan the upper triangle, in row-major order, like GN1 does.
+    lower = np.tril(np.full(between.shape, np.inf))
+    for _ in range(count):
+        i, j = divmod(int(np.argmin(between + lower)), len(clusters))
+        yield i, j
+        between[i] = between[:, i] = np.minimum(between[i], between[j])
+        between[i, i] = np.inf
+        between[j] = between[:, j] = np.inf
+
+def __single_linkage(distances: np.ndarray) -> tuple:
+    """Cluster the members by single linkage, returning the nested
+    `(cluster, cluster, distance)` tuples of the final merge.
+
+    Single linkage merges the clusters along the edges of a minimum spanning
+    tree, in order of increasing distance. Each cluster is identified by its
+    smallest member. To reproduce GN1's clustering exactly, the cluster with the
+    smallest member comes first in each merge, and when several pairs of
+    clusters are equally distant, the pair with the smallest members is merged
+    first: these ties are resolved by merging the clusters involved one pair at
+    a time, as GN1 does."""
+    size = distances.shape[0]
+    parents = list(range(size))
+    clusters: dict[int, Any] = dict(enumerate(range(size)))
+    members = {idx: [idx] for idx in range(size)}
+
+    def __root(member):
+        while parents[member] != member:
+            parents[member] = parents[parents[member]]
+            member = parents[member]
+        return member
+
+    def __merge(first, second, distance):
+        clusters[first] = (clusters[first], clusters.pop(second), distance)
+        members[first].extend(members.pop(second))
+        parents[second] = first
+
+    for distance, group in groupby(
+            __minimum_spanning_tree(distances), key=lambda edge: edge[2]):
+        edges = tuple(group)
+        if len(edges) == 1:
+            first, second = sorted((__root(edges[0][0]), __root(edges[0][1])))
+            __merge(first, second, distance)
+            continue
+        roots = sorted({__root(member) for edge in edges for member in edge[:2]})
+        for i, j in __equidistant_merges(
+                distances, [members[root] for root in roots], len(edges)):
+            __merge(roots[i], roots[j], distance)
+
+    return clusters[0]
+
 def slink(lists):
     """
-    DESCRIPTION:
-    TODO: Not quite sure what this function does. Work through the code with a
-        fine tooth comb, once we understand the context of its use, so as to
-        give a better description
+    Cluster the members of `lists` by single linkage (the SLINK method).
 
-        The name of the function does not clearly establish what the function
-        does either, meaning, once that is established, the function should be
-        renamed to give the user an idea of what it does without necessarily
-        reading through a ton of code.
-
-        We should also look into refactoring the function to reduce/eliminate
-        the multiple levels of nested-loops and conditionals
+    This reproduces the clustering in genenetwork1's
+    https://github.com/genenetwork/genenetwork1/blob/master/web/webqtl/heatmap/slink.py
+    in O(n^2) time, by building a minimum spanning tree of the members.
 
     PARAMETERS:
-    lists (list of lists of numbers): Give this a better name.
-        Each item of this list is a list of coordinates of the members in the
-        group.
-        What 'member' and 'group' in this context means, is not yet established.
+    lists (list of lists of numbers, or a square NumPy array): The distances of
+        the members from each other, as described for `nearest`.
+
+    RETURNS:
+    A list `[cluster, cluster, distance]` of the last two clusters merged, and
+    the distance between them. Each cluster is either the index of a member, or
+    a `(cluster, cluster, distance)` tuple of the two clusters merged to form
+    it, e.g. `[(0, 2, 3), (1, 3, 5), 6]`.
+
+    An empty list is returned for data that is not a valid distance matrix.
     """
+    if not ((isinstance(lists, np.ndarray)
+             or (__is_list_or_tuple(lists)
+                 and all(map(__is_list_or_tuple, lists))))
+            and len(lists) > 1):
+        logging.warning("Exception: expected a list of at least two lists")
+        return []
     try:
-        size = len(lists)
-        listindexcopy = list(range(size))
-        listscopy = [list(child[:]) for child in lists]
-        init_size = size
-        candidate = []
-        while init_size > 2:
-            mindist = 1e10
-            for i in range(init_size):
-                for j in range(i+1, init_size):
-                    if listscopy[i][j] < mindist:
-                        mindist = listscopy[i][j]
-                        candidate = [[i, j]]
-                    elif listscopy[i][j] == mindist:
-                        mindist = listscopy[i][j]
-                        candidate.append([i, j])
-                    else:
-                        pass
-            newmem = (
-                listindexcopy[candidate[0][0]], listindexcopy[candidate[0][1]],
-                mindist)
-            listindexcopy.pop(candidate[0][1])
-            listindexcopy[candidate[0][0]] = newmem
-
-            init_size -= 1
-            for i in range(init_size):
-                for j in range(i+1, init_size):
-                    listscopy[i][j] = nearest(
-                        lists, listindexcopy[i], listindexcopy[j])
-                    listscopy[j][i] = listscopy[i][j]
-        listindexcopy.append(
-            nearest(lists, listindexcopy[0], listindexcopy[1]))
-        return listindexcopy
-    except (LengthError, MirrorError, TypeError, IndexError) as exc:
+        return list(__single_linkage(__distance_matrix(lists)))
+    except (LengthError, MirrorError, TypeError) as exc:
         # Look into making the logging log output to the system's
         #   configured logger(s)
         logging.warning("Exception: %s, %s", type(exc), exc)
@@ -1,22 +1,37 @@
-"""Module contains streaming procedures  for genenetwork. """
+"""Module contains streaming procedures  for genenetwork.
+
+The stdout of a computation is written, line by line, to a log file in the
+TMPDIR as the computation runs (see `run_process`). Clients follow the log
+either by polling `/api/stream/<id>?peak=<offset>`, or by subscribing to the
+Server-Sent Events at `/api/stream/<id>/events` (see `log_events`), which push
+each line as soon as it is written. Every event carries the byte offset of the
+end of its line as its id, so that a client that reconnects (browsers send the
+id of the last event received as the `Last-Event-ID` header) resumes where it
+left off."""
 import os
+import time
 import subprocess
 from functools import wraps
+from typing import Iterator
 from flask import current_app, request
 
+# Marks the end of the log of a computation: the events stop there.
+COMPLETION_MESSAGE = "Done with GN3 Computation"
+
 
 def read_file(file_path):
     """Add utility function to read files"""
     with open(file_path, "r", encoding="UTF-8") as file_handler:
         return file_handler.read()
 
-def run_process(cmd, log_file, run_id):
+def run_process(cmd, log_file, run_id, env=None):
     """Function to execute an external process and
        capture the stdout in a file
       input:
            cmd: the command to execute as a list of args.
            log_file: abs file path to write the stdout.
            run_id: unique id to identify the process
+           env: the environment to run the process in, if not this one's
 
       output:
           Dict with the results for either success or failure.
@@ -27,16 +42,18 @@ def run_process(cmd, log_file, run_id):
             cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-        ) as process:
+            env=env,
+        ) as process, open(log_file, "ab") as file_handler:
             for line in iter(process.stdout.readline, b""):
-                # phase: capture the stdout for each line allowing read and write
-                with open(log_file, "a+", encoding="utf-8") as file_handler:
-                    file_handler.write(line.decode("utf-8"))
+                # phase: capture the stdout for each line, flushing it so that
+                # the readers of the log see it at once
+                file_handler.write(line)
+                file_handler.flush()
             process.wait()
-            return {"msg": "success" if process.returncode == 0 else "Process failed",
-                    "run_id": run_id,
-                    "log" :  read_file(log_file),
-                    "code": process.returncode}
+        return {"msg": "success" if process.returncode == 0 else "Process failed",
+                "run_id": run_id,
+                "log" :  read_file(log_file),
+                "code": process.returncode}
     except subprocess.CalledProcessError as error:
         return {"msg": "error occurred",
                 "code": error.returncode,
@@ -45,6 +62,46 @@ def run_process(cmd, log_file, run_id):
                 "log" : read_file(log_file)}
 
 
+def mark_done(log_file):
+    """Append the `COMPLETION_MESSAGE` to the log, ending its events."""
+    with open(log_file, "ab") as file_handler:
+        file_handler.write(f"{COMPLETION_MESSAGE}\n".encode("utf-8"))
+
+
+def __event__(offset: int, line: str) -> str:
+    """Format `line` as a Server-Sent Event with the id `offset`."""
+    data = "".join(f"data: {part}\n" for part in line.split("\n"))
+    return f"id: {offset}\n{data}\n"
+
+
+def log_events(log_file: str, offset: int = 0, poll_interval: float = 0.2,
+               idle_timeout: float = 600) -> Iterator[str]:
+    """Follow the log from `offset`, yielding each complete line as a
+    Server-Sent Event whose id is the offset of the end of the line.
+
+    The events end with the `COMPLETION_MESSAGE`, or once the log has not grown
+    for `idle_timeout` seconds, with an `end` event, in both cases."""
+    with open(log_file, "rb") as file_handler:
+        file_handler.seek(offset)
+        last_output = time.monotonic()
+        while True:
+            line = file_handler.readline()
+            if line.endswith(b"\n"):
+                offset = offset + len(line)
+                last_output = time.monotonic()
+                text = line.decode("utf-8", errors="replace").rstrip("\n")
+                yield __event__(offset, text)
+                if text.strip() == COMPLETION_MESSAGE:
+                    break
+                continue
+            # Partial line: leave it until its writer completes it.
+            file_handler.seek(offset)
+            if time.monotonic() - last_output >= idle_timeout:
+                break
+            time.sleep(poll_interval)
+    yield f"id: {offset}\nevent: end\ndata: \n\n"
+
+
 def enable_streaming(func):
     """Decorator function to enable streaming for an endpoint
     Note: should only be used  in an app context
@@ -0,0 +1,47 @@
+"""Select the top N results of a correlation without sorting all of them.
+
+Callers of the correlation computations only ever display the first few
+hundred results, so fully sorting tens of thousands of results, only to throw
+most of them away, is wasted work. The functions here give the same results as
+`sorted(…)[:top_n]` while only ordering the items that are actually kept."""
+import heapq
+from typing import Any, Callable, Iterable, Optional
+
+import numpy as np
+
+
+def top_n_indices(scores: np.ndarray, top_n: Optional[int] = None) -> np.ndarray:
+    """Return the indices of the `top_n` largest values in `scores`, ordered
+    from the largest to the smallest value.
+
+    Ties are broken by position, and NaN scores come last, so that the result
+    is identical to the first `top_n` items of a stable descending sort. If
+    `top_n` is `None`, the indices of all the scores are returned, sorted."""
+    scores = np.asarray(scores)
+    valid = np.flatnonzero(~np.isnan(scores))
+    if top_n is None or top_n >= valid.shape[0]:
+        return np.argsort(-scores, kind="stable")[:top_n]
+    if top_n <= 0:
+        return np.array([], dtype=np.intp)
+
+    # `argpartition` finds the value at the cut-off point in linear time...
+    threshold = scores[valid[
+        np.argpartition(-scores[valid], top_n - 1)[top_n - 1]]]
+    # ... then everything above it is kept, and ties with the cut-off value
+    # are kept in order of position until `top_n` items have been selected.
+    above = np.flatnonzero(scores > threshold)
+    ties = np.flatnonzero(scores == threshold)[:top_n - above.shape[0]]
+    selected = np.concatenate((above, ties))
+    selected.sort()
+    return selected[np.argsort(-scores[selected], kind="stable")]
+
+
+def top_n_items(
+        items: Iterable, key: Callable[[Any], Any],
+        top_n: Optional[int] = None) -> list:
+    """Return the `top_n` smallest `items` by `key`, i.e. the equivalent of
+    `sorted(items, key=key)[:top_n]`, using a heap of size `top_n` rather than
+    sorting all the items."""
+    if top_n is None:
+        return sorted(items, key=key)
+    return heapq.nsmallest(top_n, items, key=key)
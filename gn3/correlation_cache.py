@@ -0,0 +1,211 @@
+"""Shared cache of correlation results
+
+Results are cached in Redis, keyed on everything that determines them: the
+correlation method, a hash of the primary trait's values, the identity of the
+target dataset and `top_n`. A target dataset sent with the request is
+identified by a hash of its content; one read on the server is identified by
+its name and version.
+
+Sample-data edits (see `gn3.db.sample_data`) invalidate the whole cache, by
+bumping a generation number that is part of every key: results computed before
+an edit are never served after it, and the orphaned entries are evicted like
+any other. The edits also bump a generation of the edited datasets alone (see
+`dataset_generation`), which versions their precomputed matrices (see
+`gn3.dataset_matrices`).
+
+The cache is bounded: entries expire once they have not been used for the
+TTL, and the least recently used ones are evicted once the entries take up
+more than the given number of bytes. Redis's own eviction policies are not
+used, since the same Redis instance holds the job queues. The bound is
+approximate when several processes write to the cache at the same time.
+
+Failing to reach Redis is logged, and the results computed, as if there were
+no cache.
+"""
+import json
+import time
+import hashlib
+import logging
+from typing import Any, Callable, Optional, Sequence
+
+import redis
+from redis import Redis
+from flask import current_app, has_app_context
+
+PREFIX = "GN3::correlation-cache"
+INDEX_KEY = f"{PREFIX}::index"
+SIZES_KEY = f"{PREFIX}::sizes"
+BYTES_KEY = f"{PREFIX}::bytes"
+METRICS_KEY = f"{PREFIX}::metrics"
+GENERATION_KEY = f"{PREFIX}::generation"
+DATASET_GENERATIONS_KEY = f"{PREFIX}::dataset-generations"
+# Stands for the datasets of the edits whose dataset is not known: any of them
+ANY_DATASET = "*"
+DEFAULT_REDIS_URI = "redis://localhost:6379/0"
+# Number of entries dropped at a time when evicting
+EVICTION_BATCH = 100
+
+logger = logging.getLogger(__name__)
+
+
+def values_hash(values: Any) -> str:
+    """Hash JSON-serialisable `values`, e.g. a primary trait's sample data."""
+    return hashlib.sha256(
+        json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def content_hash(content: bytes) -> str:
+    """Hash raw `content`, e.g. the body of a request carrying a dataset."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def cache_key(generation: int, parts: Sequence[Any]) -> str:
+    """Build the key for the results determined by `parts`, i.e. the kind of
+    correlation (e.g. 'sample', 'tissue'), the method, the hash of the primary
+    trait's values, the identity of the target dataset and `top_n`."""
+    return f"{PREFIX}::{parts[0]}::" + values_hash([generation, *parts])
+
+
+def __drop__(conn: Redis, keys: Sequence[Any]):
+    """Remove the entries with `keys` and their bookkeeping."""
+    if len(keys) == 0:
+        return
+    sizes = conn.hmget(SIZES_KEY, keys)
+    with conn.pipeline() as pipe:
+        pipe.delete(*keys)
+        pipe.zrem(INDEX_KEY, *keys)
+        pipe.hdel(SIZES_KEY, *keys)
+        pipe.decrby(BYTES_KEY, sum(int(size or 0) for size in sizes))
+        pipe.execute()
+
+
+def __evict__(conn: Redis, ttl: int, max_bytes: int):
+    """Drop the entries that have expired, then the least recently used ones
+    until the cache fits within `max_bytes`."""
+    __drop__(conn, conn.zrangebyscore(INDEX_KEY, "-inf", time.time() - ttl))
+    while int(conn.get(BYTES_KEY) or 0) > max_bytes:
+        oldest = conn.zrange(INDEX_KEY, 0, EVICTION_BATCH - 1)
+        if len(oldest) == 0:
+            break
+        __drop__(conn, oldest)
+        conn.hincrby(METRICS_KEY, "evictions", len(oldest))
+
+
+def cached(conn: Redis, parts: Sequence[Any], compute: Callable[[], Any],
+           ttl: int, max_bytes: int) -> Any:
+    """Get the results determined by `parts` (see `cache_key`) from the cache,
+    or `compute` and cache them."""
+    try:
+        key = cache_key(int(conn.get(GENERATION_KEY) or 0), parts)
+        raw = conn.get(key)
+        if raw is not None:
+            with conn.pipeline() as pipe:
+                pipe.expire(key, ttl)
+                pipe.zadd(INDEX_KEY, {key: time.time()})
+                pipe.hincrby(METRICS_KEY, "hits", 1)
+                pipe.execute()
+            return json.loads(raw)
+    except redis.RedisError as _rerr:
+        logger.warning("Correlation cache unavailable: %s", _rerr)
+        return compute()
+
+    results = compute()
+    try:
+        serialised = json.dumps(results).encode("utf-8")
+        previous_size = int(conn.hget(SIZES_KEY, key) or 0)
+        with conn.pipeline() as pipe:
+            pipe.hincrby(METRICS_KEY, "misses", 1)
+            if len(serialised) <= max_bytes:
+                pipe.set(key, serialised, ex=ttl)
+                pipe.zadd(INDEX_KEY, {key: time.time()})
+                pipe.hset(SIZES_KEY, key, len(serialised))
+                pipe.incrby(BYTES_KEY, len(serialised) - previous_size)
+            pipe.execute()
+        __evict__(conn, ttl, max_bytes)
+    except (redis.RedisError, TypeError) as _err:
+        logger.warning("Could not cache the correlation results: %s", _err)
+    return results
+
+
+def invalidate(conn: Redis, datasets: Sequence[Optional[str]] = (None,)):
+    """Invalidate all the cached results, and bump the generations of the
+    `datasets` whose data changed, `None` standing for a dataset that is not
+    known."""
+    with conn.pipeline() as pipe:
+        pipe.incr(GENERATION_KEY)
+        for dataset in set(datasets):
+            pipe.hincrby(DATASET_GENERATIONS_KEY, dataset or ANY_DATASET, 1)
+        pipe.hincrby(METRICS_KEY, "invalidations", 1)
+        pipe.execute()
+
+
+def __redis_uri__(redis_uri: Optional[str]) -> str:
+    """Use `redis_uri` if given, else the app's `REDIS_URI`, in an app context,
+    else the default."""
+    if redis_uri:
+        return redis_uri
+    if has_app_context():
+        return current_app.config.get("REDIS_URI", DEFAULT_REDIS_URI)
+    return DEFAULT_REDIS_URI
+
+
+def invalidate_correlation_cache(
+        redis_uri: Optional[str] = None,
+        datasets: Sequence[Optional[str]] = (None,)):
+    """Invalidate all the cached results, e.g. once the sample data of the
+    `datasets` is edited (see `invalidate`), without failing if Redis cannot be
+    reached.
+
+    The cache is in the Redis at `redis_uri`, which defaults to the app's
+    `REDIS_URI` in an app context."""
+    try:
+        with Redis.from_url(__redis_uri__(redis_uri)) as conn:
+            invalidate(conn, datasets)
+    except redis.RedisError as _rerr:
+        logger.warning("Could not invalidate the correlation cache: %s", _rerr)
+
+
+def current_generation(redis_uri: Optional[str] = None) -> Optional[int]:
+    """Get the current generation of the cache, which every sample-data edit
+    bumps, or `None` if Redis cannot be reached. `redis_uri` defaults as for
+    `invalidate_correlation_cache`."""
+    try:
+        with Redis.from_url(__redis_uri__(redis_uri)) as conn:
+            return int(conn.get(GENERATION_KEY) or 0)
+    except redis.RedisError as _rerr:
+        logger.warning("Could not get the correlation cache's generation: %s",
+                       _rerr)
+        return None
+
+
+def dataset_generation(
+        dataset_name: str, redis_uri: Optional[str] = None) -> Optional[int]:
+    """Get the generation of the data of the dataset `dataset_name`, which the
+    edits of its sample data bump, as do those of unknown datasets, or `None`
+    if Redis cannot be reached. `redis_uri` defaults as for
+    `invalidate_correlation_cache`."""
+    try:
+        with Redis.from_url(__redis_uri__(redis_uri)) as conn:
+            # Both generations only grow: so does their sum
+            return sum(int(generation or 0) for generation in conn.hmget(
+                DATASET_GENERATIONS_KEY, [dataset_name, ANY_DATASET]))
+    except redis.RedisError as _rerr:
+        logger.warning("Could not get the generation of '%s': %s",
+                       dataset_name, _rerr)
+        return None
+
+
+def metrics(conn: Redis) -> dict:
+    """Get the cache's hit/miss metrics, and its current size."""
+    hits, misses, evictions, invalidations = (
+        int(value or 0) for value in conn.hmget(
+            METRICS_KEY, ["hits", "misses", "evictions", "invalidations"]))
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": (hits / (hits + misses)) if (hits + misses) else None,
+        "evictions": evictions,
+        "invalidations": invalidations,
+        "entries": conn.zcard(INDEX_KEY),
+        "bytes": int(conn.get(BYTES_KEY) or 0)
+    }
@@ -1,12 +1,10 @@
 """This module contains functions for manipulating and working with csv
 texts"""
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 
 import re
-import json
 import os
-import uuid
-from gn3.commands import run_cmd
+import warnings
 
 
 def extract_strain_name(csv_header, data, seek="Strain Name") -> str:
@@ -52,8 +50,9 @@ def remove_insignificant_edits(diff_data, epsilon=0.001):
 def reclassify_csv_diffs(diff_data: dict) -> dict:
     """Reclassify CSV diffs to properly distinguish additions from modifications.
 
-    The csvdiff tool treats all changes as modifications, but we need to
-    reclassify them based on whether the original/current values are "missing" data.
+    The row diff (see `diff_csv_rows`) treats all changes to existing strains as
+    modifications, but we need to reclassify them based on whether the
+    original/current values are "missing" data.
 
     Missing data patterns for CSV rows like "H2907,x,x,x":
     - Empty string
@@ -115,8 +114,35 @@ def clean_csv_text(csv_text: str) -> str:
     return "\n".join(_csv_text)
 
 
-def csv_diff(base_csv, delta_csv, tmp_dir="/tmp") -> dict:
-    """Diff 2 csv strings"""
+def diff_csv_rows(base_rows: List[str], delta_rows: List[str]) -> dict:
+    """Diff two lists of csv rows, keyed on their first column, i.e. the
+    strain's name, by joining the base and delta rows on a hash of the key.
+
+    Rows whose key is only in `delta_rows` are additions, those whose key is
+    only in `base_rows` are deletions, and those whose key is in both, but that
+    differ, are modifications."""
+    base = {row.split(",", maxsplit=1)[0]: row for row in base_rows}
+    delta = {row.split(",", maxsplit=1)[0]: row for row in delta_rows}
+    return {
+        "Additions": [row for key, row in delta.items() if key not in base],
+        "Deletions": [row for key, row in base.items() if key not in delta],
+        "Modifications": [
+            {"Original": base[key], "Current": row}
+            for key, row in delta.items()
+            if key in base and base[key] != row],
+    }
+
+
+def csv_diff(base_csv, delta_csv, tmp_dir: Optional[str] = None) -> dict:
+    """Diff 2 csv strings
+
+    `tmp_dir` is deprecated: the strings are diffed in memory, so it is not
+    used, and passing it warns."""
+    if tmp_dir is not None:
+        warnings.warn(
+            "The `tmp_dir` argument of `csv_diff` is not used, and will be "
+            "removed: stop passing it.",
+            category=DeprecationWarning, stacklevel=2)
     base_csv = clean_csv_text(base_csv)
     delta_csv = clean_csv_text(delta_csv)
     base_csv_list = base_csv.split("\n")
@@ -134,36 +160,24 @@ def csv_diff(base_csv, delta_csv, tmp_dir="/tmp") -> dict:
             base_csv  = "\n".join([longest_header] + base_csv_list[1:])
         else:
             delta_csv  = "\n".join([longest_header] + delta_csv_list[1:])
-    file_name1 = os.path.join(tmp_dir, str(uuid.uuid4()))
-    file_name2 = os.path.join(tmp_dir, str(uuid.uuid4()))
-
-    with open(file_name1, "w", encoding="utf-8") as _f:
-        _l = len(longest_header.split(","))
-        _f.write(fill_csv(csv_text=base_csv, width=_l))
-    with open(file_name2, "w", encoding="utf-8") as _f:
-        _f.write(fill_csv(delta_csv, width=_l))
-
-    # Now we can run the diff!
-    _r = run_cmd(
-        cmd=('"csvdiff ' f"{file_name1} {file_name2} " '--format json"')
-    )
-    if _r.get("code") == 0:
-        _r = json.loads(_r.get("output", ""))
-        if any(_r.values()):
-            _r["Columns"] = max(base_csv_header, delta_csv_header)
-            # Reclassify diffs to properly distinguish additions from deletions
-            _r = reclassify_csv_diffs(_r)
-    else:
-        _r = {}
-
-    # Clean Up!
-    if os.path.exists(file_name1):
-        os.remove(file_name1)
-    if os.path.exists(file_name2):
-        os.remove(file_name2)
+
+    width = len(longest_header.split(","))
+    _r = diff_csv_rows(
+        fill_csv(csv_text=base_csv, width=width).split("\n"),
+        fill_csv(csv_text=delta_csv, width=width).split("\n"))
+    if any(_r.values()):
+        _r["Columns"] = max(base_csv_header, delta_csv_header)
+        # Reclassify diffs to properly distinguish additions from deletions
+        _r = reclassify_csv_diffs(_r)
     return _r
 
 
+def csv_diffs(csvs: Dict[Any, Tuple[str, str]]) -> Dict[Any, dict]:
+    """Diff the (base, delta) csv strings of many traits, e.g. those of a batch
+    of sample-data edits, in one call."""
+    return {key: csv_diff(base, delta) for key, (base, delta) in csvs.items()}
+
+
 def fill_csv(csv_text, width, value="x"):
     """Fill a csv text with 'value' if it's length is less than width"""
     data = []
@@ -0,0 +1,187 @@
+"""Precomputed matrices of target datasets
+
+Correlating against a dataset that has no text file (see
+`gn3.db.correlations.get_filename`) used to query the database for all of the
+dataset's values on every job. This module materialises each ProbeSet, Publish
+or Geno dataset, once, into a (traits x samples) matrix, written to LMDB in the
+format read by `gn3.phenodb`, at `<matrices_dir>/<dataset_name>`. Correlations
+then read the matrix memory-mapped.
+
+Each matrix records the version of the data it was built from: the number of
+traits in the dataset and their highest DataId (see
+`gn3.db.correlations.fetch_dataset_data_version`), and the generation of its
+sample data, which the edits of the dataset's samples bump (see
+`gn3.correlation_cache.dataset_generation`): edits to other datasets leave
+the matrix current. Correlation jobs rebuild a matrix on demand once its
+data has changed (see `dataset_matrix`); the web requests only use matrices
+that are up to date (see `current_matrix`), and leave the building to a queued
+run of `scripts/dataset_matrices.py`, which also builds them ahead of time.
+"""
+import os
+import json
+import shutil
+import tempfile
+from typing import Any, Iterable, Optional
+
+import lmdb
+import numpy as np
+
+from gn3 import phenodb
+from gn3.correlation_cache import dataset_generation
+from gn3.db.correlations import fetch_dataset_values, fetch_dataset_data_version
+
+DTYPE = "<f8"
+
+
+def dataset_type(dataset_name: str) -> str:
+    """Get the type of the dataset named `dataset_name`, going by its name."""
+    if "Publish" in dataset_name:
+        return "Publish"
+    if "Geno" in dataset_name:
+        return "Geno"
+    return "ProbeSet"
+
+
+def matrix_path(matrices_dir: str, dataset_name: str) -> str:
+    """Get the path of the matrix for the dataset named `dataset_name`."""
+    return os.path.join(matrices_dir, dataset_name)
+
+
+def data_version(
+        conn: Any, dataset_name: str, db_type: str,
+        redis_uri: Optional[str] = None) -> Optional[str]:
+    """Get the current version of the data in the dataset: its traits (see
+    `fetch_dataset_data_version`) and the generation of its sample data (see
+    `gn3.correlation_cache.dataset_generation`). Returns `None` if there is no
+    such dataset, or its version cannot be known because Redis cannot be
+    reached."""
+    version = fetch_dataset_data_version(conn, dataset_name, db_type)
+    generation = dataset_generation(dataset_name, redis_uri)
+    if version is None or generation is None:
+        return None
+    return f"{version}:{generation}"
+
+
+def arrange_values(rows: Iterable[tuple[Any, str, float]]) -> tuple[
+        list[str], list[str], np.ndarray]:
+    """Arrange (trait name, sample name, value) rows into a (traits x samples)
+    matrix, with NaN for missing values.
+
+    Returns the traits' names, in the order they were first seen, the samples'
+    names, sorted, and the matrix."""
+    traits: dict[str, int] = {}
+    samples: dict[str, int] = {}
+    trait_idxs, sample_idxs, values = [], [], []
+    for trait, sample, value in rows:
+        trait_idxs.append(traits.setdefault(str(trait), len(traits)))
+        sample_idxs.append(samples.setdefault(sample, len(samples)))
+        values.append(value)
+
+    sample_names = sorted(samples)
+    columns = np.empty(len(samples), dtype=np.intp)
+    columns[[samples[name] for name in sample_names]] = np.arange(
+        len(sample_names))
+    matrix = np.full((len(traits), len(samples)), np.nan, dtype=DTYPE)
+    matrix[np.array(trait_idxs, dtype=np.intp),
+           columns[np.array(sample_idxs, dtype=np.intp)]] = np.array(
+               values, dtype=DTYPE)
+    return list(traits), sample_names, matrix
+
+
+def write_matrix(
+        path: str, traits: list[str], samples: list[str], matrix: np.ndarray,
+        metadata: dict):
+    """Write the (traits x samples) `matrix` to the LMDB database at `path`.
+
+    The database is written in a temporary directory, and its data file then
+    moved into place, so that readers never see a partly-written matrix."""
+    values = np.ascontiguousarray(matrix, dtype=DTYPE).tobytes(order="C")
+    meta = json.dumps({
+        "rows": len(traits),
+        "columns": len(samples),
+        "dtype": DTYPE,
+        "order": "C",
+        "endian": "little",
+        "traits": traits,
+        "strains": samples,
+        "transposed": False,
+        "has_se": False,
+        **metadata
+    }).encode("utf-8")
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmpdir = tempfile.mkdtemp(dir=parent, prefix=".matrix-")
+    try:
+        with lmdb.open(
+                tmpdir, map_size=2 * (len(values) + len(meta)) + (1 << 24)
+        ) as env:
+            with env.begin(write=True) as txn:
+                txn.put(phenodb.METADATA_KEY, meta)
+                txn.put(phenodb.VALUES_KEY, values)
+        os.makedirs(path, exist_ok=True)
+        os.replace(os.path.join(tmpdir, "data.mdb"),
+                   os.path.join(path, "data.mdb"))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def build_dataset_matrix(# pylint: disable=[too-many-arguments, too-many-positional-arguments]
+        conn: Any, matrices_dir: str, dataset_name: str,
+        db_type: Optional[str] = None, version: Optional[str] = None) -> str:
+    """Build the matrix for the dataset named `dataset_name` from the
+    database, recording `version` as the version of its data, and return its
+    path."""
+    db_type = db_type or dataset_type(dataset_name)
+    path = matrix_path(matrices_dir, dataset_name)
+    write_matrix(
+        path,
+        *arrange_values(fetch_dataset_values(conn, dataset_name, db_type)),
+        {"dataset": dataset_name, "dataset_type": db_type,
+         "data_version": version})
+    return path
+
+
+def current_matrix(
+        conn: Any, matrices_dir: str, dataset_name: str,
+        db_type: Optional[str] = None, redis_uri: Optional[str] = None
+) -> tuple[Optional[str], Optional[phenodb.PhenotypeReader]]:
+    """Get the current version of the data in the dataset named
+    `dataset_name`, and a reader for its matrix if the matrix is up to date
+    with it, or `None` if it is missing or out of date.
+
+    The version is `None` if there is no `matrices_dir`, no such dataset, or
+    the version of the data cannot be known: no matrix should then be built.
+    """
+    db_type = db_type or dataset_type(dataset_name)
+    if not matrices_dir or db_type not in ("ProbeSet", "Publish", "Geno"):
+        return None, None
+    version = data_version(conn, dataset_name, db_type, redis_uri)
+    if version is None:
+        return None, None
+    try:
+        pheno = phenodb.reader(matrix_path(matrices_dir, dataset_name))
+        if pheno.metadata.get("data_version") == version:
+            return version, pheno
+    except (OSError, lmdb.Error, KeyError):
+        pass
+    return version, None
+
+
+def dataset_matrix(# pylint: disable=[too-many-arguments, too-many-positional-arguments]
+        conn: Any, matrices_dir: str, dataset_name: str,
+        db_type: Optional[str] = None,
+        redis_uri: Optional[str] = None) -> Optional[phenodb.PhenotypeReader]:
+    """Get a reader for the matrix of the dataset named `dataset_name`,
+    (re)building the matrix if it is missing or out of date.
+
+    Returns `None` if there is no `matrices_dir`, no such dataset, or the
+    version of the data cannot be known: the caller should then read the data
+    from the database, if any.
+    """
+    db_type = db_type or dataset_type(dataset_name)
+    version, pheno = current_matrix(
+        conn, matrices_dir, dataset_name, db_type, redis_uri)
+    if version is None or pheno is not None:
+        return pheno
+    build_dataset_matrix(conn, matrices_dir, dataset_name, db_type, version)
+    return phenodb.reader(matrix_path(matrices_dir, dataset_name))
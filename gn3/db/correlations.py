@@ -4,7 +4,7 @@ feature to access the database to retrieve data needed for computations.
 """
 import os
 from functools import reduce
-from typing import Any, Dict, Tuple, Union, Optional
+from typing import Any, Dict, Tuple, Union, Iterator, Optional
 
 from gn3.chancy import random_string
 from gn3.data_helpers import partition_all
@@ -586,3 +586,73 @@ def fetch_all_database_data(# pylint: disable=[R0913, R0914]
             cursor.execute(f"DROP TEMPORARY TABLE {temp_table}")
 
     return (trait_database[0], trait_database[1])  # type: ignore
+
+def __dataset_values_query__(db_type: str) -> Tuple[str, str]:
+    """Build the queries for all the values in a dataset of type `db_type`, and
+    for the version of the dataset's data. Do not use outside of this
+    module."""
+    if db_type == "Publish":
+        return (
+            ("SELECT PublishXRef.Id, Strain.Name, PublishData.value "
+             "FROM PublishFreeze "
+             "INNER JOIN PublishXRef "
+             "ON PublishXRef.InbredSetId = PublishFreeze.InbredSetId "
+             "INNER JOIN PublishData ON PublishData.Id = PublishXRef.DataId "
+             "INNER JOIN Strain ON Strain.Id = PublishData.StrainId "
+             "WHERE PublishFreeze.Name = %(db_name)s "
+             "AND PublishData.value IS NOT NULL "
+             "ORDER BY PublishXRef.Id"),
+            ("SELECT COUNT(*), MAX(PublishXRef.DataId) "
+             "FROM PublishFreeze INNER JOIN PublishXRef "
+             "ON PublishXRef.InbredSetId = PublishFreeze.InbredSetId "
+             "WHERE PublishFreeze.Name = %(db_name)s"))
+    return (
+        (f"SELECT {db_type}.Name, Strain.Name, {db_type}Data.value "
+         f"FROM {db_type}Freeze "
+         f"INNER JOIN {db_type}XRef "
+         f"ON {db_type}XRef.{db_type}FreezeId = {db_type}Freeze.Id "
+         f"INNER JOIN {db_type} ON {db_type}.Id = {db_type}XRef.{db_type}Id "
+         f"INNER JOIN {db_type}Data ON {db_type}Data.Id = {db_type}XRef.DataId "
+         f"INNER JOIN Strain ON Strain.Id = {db_type}Data.StrainId "
+         f"WHERE {db_type}Freeze.Name = %(db_name)s "
+         f"AND {db_type}Data.value IS NOT NULL "
+         f"ORDER BY {db_type}.Id"),
+        (f"SELECT COUNT(*), MAX({db_type}XRef.DataId) "
+         f"FROM {db_type}Freeze INNER JOIN {db_type}XRef "
+         f"ON {db_type}XRef.{db_type}FreezeId = {db_type}Freeze.Id "
+         f"WHERE {db_type}Freeze.Name = %(db_name)s"))
+
+def fetch_dataset_values(
+        conn: Any, dataset_name: str, db_type: str,
+        batch_size: int = 10000) -> Iterator[Tuple[Any, str, float]]:
+    """
+    Fetch all the values in the dataset named `dataset_name`, of type
+    `db_type` (one of 'ProbeSet', 'Publish' or 'Geno'), as
+    (trait name, sample name, value) rows, in a single query.
+
+    Unlike `fetch_all_database_data`, this does not join the data tables once
+    per sample, so the cost of the query does not grow with the number of
+    samples.
+    """
+    query, _version_query = __dataset_values_query__(db_type)
+    with conn.cursor() as cursor:
+        cursor.execute(query, {"db_name": dataset_name})
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+
+def fetch_dataset_data_version(
+        conn: Any, dataset_name: str, db_type: str) -> Optional[str]:
+    """
+    Identify the version of the data in the dataset named `dataset_name`: this
+    changes whenever traits are added to, or removed from, the dataset.
+
+    Returns `None` if there is no such dataset, or it has no traits.
+    """
+    _query, version_query = __dataset_values_query__(db_type)
+    with conn.cursor() as cursor:
+        cursor.execute(version_query, {"db_name": dataset_name})
+        count, max_data_id = cursor.fetchone()
+        return f"{count}:{max_data_id}" if count else None
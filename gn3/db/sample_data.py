@@ -5,6 +5,7 @@ import MySQLdb
 
 from gn3.csvcmp import extract_strain_name
 from gn3.csvcmp import parse_csv_column
+from gn3.correlation_cache import invalidate_correlation_cache
 
 _MAP = {
     "ProbeSetData": ("StrainId", "Id", "value"),
@@ -262,7 +263,7 @@ def get_pheno_sample_data_ids(
     return (strain_id, publishdata_id, inbredset_id)
 
 
-# pylint: disable=[R0913, R0914]
+# pylint: disable=[R0912, R0913, R0914]
 def update_sample_data(
     conn: Any,
     original_data: str,
@@ -394,6 +395,9 @@ def update_sample_data(
             count += 1
     # except Exception as _e:
     #     raise MySQLdb.Error(_e) from _e
+    if count:
+        invalidate_correlation_cache(
+            datasets=(trait_info.get("dataset_name"),))
     return count
 
 def delete_sample_data(
@@ -484,6 +488,9 @@ def delete_sample_data(
                 )
     except Exception as _e:
         raise MySQLdb.Error(_e) from _e
+    if count:
+        invalidate_correlation_cache(
+            datasets=(trait_info.get("dataset_name"),))
     return count
 
 # pylint: disable=[R0913, R0914]
@@ -603,6 +610,9 @@ def insert_sample_data(
                 count += __insert_case_attribute(
                     conn=conn, case_attr=header, value=value
                 )
+        if count:
+            invalidate_correlation_cache(
+                datasets=(trait_info.get("dataset_name"),))
         return count
     except Exception as _e:
         raise MySQLdb.Error(_e) from _e
@@ -611,153 +621,183 @@ def _is_n_cases_missing(value):
     """Check if N value represents missing data (treat 0 as missing)."""
     return value in ('x', '0', 0)
 
-def batch_update_sample_data(
-    conn: Any, diff_data: Dict
-):
-    """Given sample data diffs, execute all relevant update/insert/delete queries"""
-    def __fetch_data_id(conn, db_type, trait_id, dataset_name):
-        with conn.cursor() as cursor:
-            if db_type == "Publish":
-                cursor.execute(
-                    (
-                        f"SELECT {db_type}XRef.DataId "
-                        f"FROM {db_type}XRef, {db_type}Freeze "
-                        f"WHERE {db_type}XRef.InbredSetId = {db_type}Freeze.InbredSetId AND "
-                        f"{db_type}XRef.Id = %s AND "
-                        f"{db_type}Freeze.Name = %s"
-                    ), (trait_id, dataset_name)
-                )
-            elif db_type == "ProbeSet":
-                cursor.execute(
-                    (
-                        f"SELECT {db_type}XRef.DataId "
-                        f"FROM {db_type}XRef, {db_type}, {db_type}Freeze "
-                        f"WHERE {db_type}XRef.InbredSetId = {db_type}Freeze.InbredSetId AND "
-                        f"{db_type}XRef.ProbeSetId = {db_type}.Id AND "
-                        f"{db_type}.Name = %s AND "
-                        f"{db_type}Freeze.Name = %s"
-                    ), (trait_id, dataset_name)
-                )
-            return cursor.fetchone()[0]
+def _dataset_type(dataset_name: str) -> str:
+    """Get the type of the dataset, i.e. 'Publish' or 'ProbeSet'."""
+    return "Publish" if "Publish" in dataset_name else "ProbeSet"
 
-    def __fetch_strain_id(conn, strain_name):
-        with conn.cursor() as cursor:
-            cursor.execute(
-                "SELECT Id FROM Strain WHERE Name = %s", (strain_name,)
-            )
-            result = cursor.fetchone()
-            if result is None:
-                raise ValueError(f"Strain '{strain_name}' not found in the database. Please verify the strain name exists.")
-            return result[0]
 
-    def __update_query(conn, db_type, data_id, strain_id, diffs):
-        with conn.cursor() as cursor:
-            if 'value' in diffs and diffs['value']['Current'] != 'x':
-                cursor.execute(
-                    (
-                        f"UPDATE {db_type}Data "
-                        "SET value = %s "
-                        "WHERE Id = %s AND StrainId = %s"
-                    ), (diffs['value']['Current'], data_id, strain_id)
-                )
-            if 'error' in diffs and diffs['error']['Current'] != 'x':
-                # Use INSERT ... ON DUPLICATE KEY UPDATE for atomic upsert
-                cursor.execute(
-                    (
-                        f"INSERT INTO {db_type}SE (DataId, StrainId, error) "
-                        "VALUES (%s, %s, %s) "
-                        "ON DUPLICATE KEY UPDATE error = VALUES(error)"
-                    ), (data_id, strain_id, diffs['error']['Current'])
-                )
-            if 'n_cases' in diffs and not _is_n_cases_missing(diffs['n_cases']['Current']):
-                # Insert/update N value using upsert pattern
-                cursor.execute(
-                    (
-                        "INSERT INTO NStrain (DataId, StrainId, count) "
-                        "VALUES (%s, %s, %s) "
-                        "ON DUPLICATE KEY UPDATE count = VALUES(count)"
-                    ), (data_id, strain_id, diffs['n_cases']['Current'])
-                )
+def _placeholders(items) -> str:
+    """Build the placeholders for the `items` in an `IN (...)` clause."""
+    return ", ".join(["%s"] * len(items))
 
-        conn.commit()
 
-    def __insert_query(conn, db_type, data_id, strain_id, diffs):
-        with conn.cursor() as cursor:
-            if 'value' in diffs and diffs['value'] != 'x':
-                cursor.execute(
-                    (
-                        f"INSERT INTO {db_type}Data (Id, StrainId, value)"
-                        "VALUES (%s, %s, %s)"
-                    ), (data_id, strain_id, diffs['value'])
-                )
-            if 'error' in diffs and diffs['error'] != 'x':
-                # Use INSERT ... ON DUPLICATE KEY UPDATE for atomic upsert
-                cursor.execute(
-                    (
-                        f"INSERT INTO {db_type}SE (DataId, StrainId, error) "
-                        "VALUES (%s, %s, %s) "
-                        "ON DUPLICATE KEY UPDATE error = VALUES(error)"
-                    ), (data_id, strain_id, diffs['error'])
-                )
-            if 'n_cases' in diffs and not _is_n_cases_missing(diffs['n_cases']):
-                # Insert/update N value using upsert pattern
-                cursor.execute(
-                    (
-                        "INSERT INTO NStrain (DataId, StrainId, count) "
-                        "VALUES (%s, %s, %s) "
-                        "ON DUPLICATE KEY UPDATE count = VALUES(count)"
-                    ), (data_id, strain_id, diffs['n_cases'])
-                )
-
-        conn.commit()
-
-    def __delete_query(conn, db_type, data_id, strain_id, diffs):
-        with conn.cursor() as cursor:
-            if 'value' in diffs:
-                cursor.execute(
-                    (
-                        f"DELETE FROM {db_type}Data "
-                        "WHERE Id = %s AND StrainId = %s"
-                    ), (data_id, strain_id)
-                )
-            if 'error' in diffs:
-                cursor.execute(
-                    (
-                        f"DELETE FROM {db_type}SE "
-                        "WHERE DataId = %s AND StrainId = %s"
-                    ), (data_id, strain_id)
-                )
-            if 'n_cases' in diffs:
+def _fetch_strain_ids(conn: Any, strain_names) -> Dict[str, int]:
+    """Fetch the ids of all the strains in `strain_names` in a single
+    query. Strains that do not exist are left out."""
+    strain_names = tuple(set(strain_names))
+    if not strain_names:
+        return {}
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT Name, Id FROM Strain "
+            f"WHERE Name IN ({_placeholders(strain_names)}) ORDER BY Id",
+            strain_names)
+        strain_ids: Dict[str, int] = {}
+        for name, strain_id in cursor.fetchall():
+            strain_ids.setdefault(name, strain_id)
+        return strain_ids
+
+
+def _fetch_data_ids(conn: Any, db_type: str, traits) -> Dict[Tuple[str, str], int]:
+    """Fetch the DataIds of all the (dataset name, trait name) `traits` of type
+    `db_type`, in a single query."""
+    datasets = tuple({dataset for dataset, _trait in traits})
+    names = tuple({trait for _dataset, trait in traits})
+    if db_type == "Publish":
+        query = (
+            "SELECT PublishFreeze.Name, PublishXRef.Id, PublishXRef.DataId "
+            "FROM PublishXRef INNER JOIN PublishFreeze "
+            "ON PublishXRef.InbredSetId = PublishFreeze.InbredSetId "
+            f"WHERE PublishFreeze.Name IN ({_placeholders(datasets)}) "
+            f"AND PublishXRef.Id IN ({_placeholders(names)})")
+    else:
+        query = (
+            "SELECT ProbeSetFreeze.Name, ProbeSet.Name, ProbeSetXRef.DataId "
+            "FROM ProbeSetXRef "
+            "INNER JOIN ProbeSetFreeze "
+            "ON ProbeSetXRef.ProbeSetFreezeId = ProbeSetFreeze.Id "
+            "INNER JOIN ProbeSet ON ProbeSetXRef.ProbeSetId = ProbeSet.Id "
+            f"WHERE ProbeSetFreeze.Name IN ({_placeholders(datasets)}) "
+            f"AND ProbeSet.Name IN ({_placeholders(names)})")
+    with conn.cursor() as cursor:
+        cursor.execute(query, datasets + names)
+        return {(dataset, str(trait)): data_id
+                for dataset, trait, data_id in cursor.fetchall()}
+
+
+def _diff_rows(data_id: int, strain_ids: Dict[str, int], diffs: Dict,
+               current: Any) -> Dict[str, list]:
+    """Collect the (value, DataId, StrainId) rows to write to each table, for
+    the strains in `diffs`. `current` gets a strain's new value of a column
+    from the strain's diff."""
+    rows: Dict[str, list] = {"value": [], "error": [], "n_cases": []}
+    for strain, diff in diffs.items():
+        for column, column_rows in rows.items():
+            if column not in diff:
+                continue
+            value = current(diff[column])
+            if (_is_n_cases_missing(value) if column == "n_cases"
+                else value == "x"):
+                continue
+            column_rows.append((value, data_id, strain_ids[strain]))
+    return rows
+
+
+def _apply_trait_diff(
+        conn: Any, db_type: str, data_id: int, strain_ids: Dict[str, int],
+        diff: Dict):
+    """Apply the modifications, additions and deletions in `diff` to the data
+    of a single trait, with a statement per table and kind of change."""
+    modified = _diff_rows(
+        data_id, strain_ids, diff.get("Modifications", {}),
+        lambda column: column["Current"])
+    added = _diff_rows(
+        data_id, strain_ids, diff.get("Additions", {}), lambda column: column)
+    with conn.cursor() as cursor:
+        if modified["value"]:
+            cursor.executemany(
+                f"UPDATE {db_type}Data SET value = %s "
+                "WHERE Id = %s AND StrainId = %s",
+                modified["value"])
+        if added["value"]:
+            cursor.executemany(
+                f"INSERT INTO {db_type}Data (value, Id, StrainId) "
+                "VALUES (%s, %s, %s)",
+                added["value"])
+        for table, column, rows in (
+                (f"{db_type}SE", "error", modified["error"] + added["error"]),
+                ("NStrain", "count", modified["n_cases"] + added["n_cases"])):
+            if rows:
+                cursor.executemany(
+                    f"INSERT INTO {table} ({column}, DataId, StrainId) "
+                    "VALUES (%s, %s, %s) "
+                    f"ON DUPLICATE KEY UPDATE {column} = VALUES({column})",
+                    rows)
+        for table, id_column, column in (
+                (f"{db_type}Data", "Id", "value"),
+                (f"{db_type}SE", "DataId", "error"),
+                ("NStrain", "DataId", "n_cases")):
+            deleted = tuple(
+                strain_ids[strain]
+                for strain, diffs in diff.get("Deletions", {}).items()
+                if column in diffs)
+            if deleted:
                 cursor.execute(
-                    (
-                        "DELETE FROM NStrain "
-                        "WHERE DataId = %s AND StrainId = %s"
-                    ), (data_id, strain_id)
-                )
-
-        conn.commit()
-
-    def __update_data(conn, db_type, data_id, diffs, update_type):
-        for strain in diffs:
-            strain_id = __fetch_strain_id(conn, strain)
-            if update_type == "update":
-                __update_query(conn, db_type, data_id, strain_id, diffs[strain])
-            elif update_type == "insert":
-                __insert_query(conn, db_type, data_id, strain_id, diffs[strain])
-            elif update_type == "delete":
-                __delete_query(conn, db_type, data_id, strain_id, diffs[strain])
-
-    for key in diff_data:
-        dataset, trait = key.split(":")
-        if "Publish" in dataset:
-            db_type = "Publish"
-        else:
-            db_type = "ProbeSet"
+                    f"DELETE FROM {table} WHERE {id_column} = %s "
+                    f"AND StrainId IN ({_placeholders(deleted)})",
+                    (data_id,) + deleted)
 
-        data_id = __fetch_data_id(conn, db_type, trait, dataset)
 
-        __update_data(conn, db_type, data_id, diff_data[key]['Modifications'], 'update')
-        __update_data(conn, db_type, data_id, diff_data[key]['Additions'], 'insert')
-        __update_data(conn, db_type, data_id, diff_data[key]['Deletions'], 'delete')
-
-    return diff_data
\ No newline at end of file
+def batch_update_sample_data(
+    conn: Any, diff_data: Dict
+) -> Dict[str, Dict]:
+    """Given sample data diffs, execute all relevant update/insert/delete
+    queries.
+
+    `diff_data` maps each "<dataset name>:<trait name>" to the trait's
+    "Modifications", "Additions" and "Deletions", by strain. The ids of all the
+    strains and traits are fetched up front, and each trait's changes are
+    applied, and committed, in a single transaction: a trait whose changes
+    fail is rolled back without affecting the others.
+
+    Returns a summary for each trait: its "status" ("success" or "error"),
+    with the number of strains "modified", "added" and "deleted", or the
+    "error"."""
+    traits = {key: tuple(key.split(":", maxsplit=1)) for key in diff_data}
+    strain_ids = _fetch_strain_ids(conn, (
+        strain for diff in diff_data.values()
+        for kind in ("Modifications", "Additions", "Deletions")
+        for strain in diff.get(kind, {})))
+    data_ids: Dict[Tuple[str, str], int] = {}
+    for db_type in ("Publish", "ProbeSet"):
+        typed = tuple(trait for trait in traits.values()
+                      if _dataset_type(trait[0]) == db_type)
+        if typed:
+            data_ids.update(_fetch_data_ids(conn, db_type, typed))
+
+    summary: Dict[str, Dict] = {}
+    for key, diff in diff_data.items():
+        missing = sorted(
+            strain for kind in ("Modifications", "Additions", "Deletions")
+            for strain in diff.get(kind, {}) if strain not in strain_ids)
+        if missing:
+            summary[key] = {
+                "status": "error",
+                "error": (f"Strains not found in the database: "
+                          f"{', '.join(missing)}. Please verify the strain "
+                          "names exist.")}
+            continue
+        if traits[key] not in data_ids:
+            summary[key] = {
+                "status": "error", "error": f"Trait '{key}' not found."}
+            continue
+        try:
+            _apply_trait_diff(
+                conn, _dataset_type(traits[key][0]), data_ids[traits[key]],
+                strain_ids, diff)
+            conn.commit()
+        except MySQLdb.Error as _err:
+            conn.rollback()
+            summary[key] = {"status": "error", "error": str(_err)}
+            continue
+        summary[key] = {
+            "status": "success",
+            **{label: len(diff.get(kind, {})) for label, kind in (
+                ("modified", "Modifications"), ("added", "Additions"),
+                ("deleted", "Deletions"))}}
+
+    edited = tuple(traits[key][0] for key, result in summary.items()
+                   if result["status"] == "success")
+    if edited:
+        invalidate_correlation_cache(datasets=edited)
+    return summary
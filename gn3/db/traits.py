@@ -1,16 +1,141 @@
 """This class contains functions relating to trait data manipulation"""
 import os
-from functools import reduce
-from typing import Any, Dict, Sequence
+from dataclasses import dataclass
+from typing import Any, Dict, Union, Sequence
+
+import numpy as np
 
 from gn3.chancy import random_string
 from gn3.function_helpers import compose
 from gn3.db.datasets import retrieve_trait_dataset
 
 
+@dataclass(frozen=True)
+class TraitData:
+    """
+    Array-backed trait data.
+
+    `index` maps each sample's name to its position in the `values`, `variances`
+    and `ndata` arrays. The arrays hold the values as they were retrieved from
+    the database (`None` where there is none), and the masks flag the positions
+    that hold a value, so that the data for any list of samples can be gathered
+    in one go.
+
+    The dictionary, e.g. as returned by `retrieve_trait_data`, is still
+    available with `as_dict`.
+    """
+    index: dict[str, int]
+    values: np.ndarray
+    variances: np.ndarray
+    ndata: np.ndarray
+    mysqlid: Any = None
+
+    @classmethod
+    def from_dict(cls, trait_data: dict) -> "TraitData":
+        """Build the arrays from the dictionary returned by
+        `retrieve_trait_data`."""
+        data = trait_data.get("data", {})
+        def __column__(key):
+            column = np.empty(len(data), dtype=object)
+            column[:] = [item.get(key) for item in data.values()]
+            return column
+        return cls(
+            index={sample: idx for idx, sample in enumerate(data)},
+            values=__column__("value"),
+            variances=__column__("variance"),
+            ndata=__column__("ndata"),
+            mysqlid=trait_data.get("mysqlid"))
+
+    @property
+    def samples(self) -> tuple[str, ...]:
+        """The names of the samples, in the order of the arrays."""
+        return tuple(self.index)
+
+    @property
+    def value_mask(self) -> np.ndarray:
+        """Flags the samples with a value."""
+        return np.array([val is not None for val in self.values], dtype=bool)
+
+    @property
+    def variance_mask(self) -> np.ndarray:
+        """Flags the samples with a variance."""
+        return np.array(
+            [var is not None for var in self.variances], dtype=bool)
+
+    @property
+    def ndata_mask(self) -> np.ndarray:
+        """Flags the samples with an N."""
+        return np.array([num is not None for num in self.ndata], dtype=bool)
+
+    def positions(self, samplelist: Sequence[str]) -> np.ndarray:
+        """The positions of the samples in `samplelist`, -1 for those with no
+        data."""
+        return np.fromiter(
+            (self.index.get(sample, -1) for sample in samplelist),
+            dtype=np.intp, count=len(samplelist))
+
+    def export(# pylint: disable=[too-many-arguments, too-many-positional-arguments, too-many-locals]
+            self, samplelist: Sequence[str], dtype: str = "val",
+            var_exists: bool = False, n_exists: bool = False) -> tuple:
+        """Gather the data for `samplelist`: see `export_trait_data`."""
+        columns = {"val": self.values, "var": self.variances, "N": self.ndata}
+        positions = self.positions(samplelist)
+        present = positions >= 0
+        width = 1 + int(var_exists) + int(n_exists)
+        cells = np.full((len(positions), width), None, dtype=object)
+        keep = np.ones(cells.shape, dtype=bool)
+        if dtype == "all":
+            informative = present.copy()
+            informative[present] = self.values[positions[present]].astype(bool)
+            rows = positions[informative]
+            cells[informative, 0] = self.values[rows]
+            flagged = tuple(
+                column for flag, column in
+                ((var_exists, self.variances), (n_exists, self.ndata)) if flag)
+            for idx, column in enumerate(flagged, start=1):
+                gathered = column[rows]
+                cells[informative, idx] = np.where(
+                    gathered.astype(bool), gathered, None)
+        elif dtype in columns:
+            cells[present, 0] = columns[dtype][positions[present]]
+            keep[present, 1:] = False
+        elif present.any():
+            raise KeyError(f"Type `{dtype}` is incorrect")
+        return tuple(cells[keep])
+
+    def informative(self, inc_var: bool = False) -> tuple:
+        """The samples with a value, and their values and variances: see
+        `export_informative`."""
+        mask = self.value_mask
+        if inc_var:
+            mask = mask & self.variance_mask
+        return (tuple(np.array(self.samples, dtype=object)[mask]),
+                tuple(self.values[mask]),
+                tuple(self.variances[mask]))
+
+    def as_dict(self) -> dict:
+        """The data as returned by `retrieve_trait_data`."""
+        return {
+            "mysqlid": self.mysqlid,
+            "data": {
+                sample: {
+                    "sample_name": sample,
+                    "value": self.values[idx],
+                    "variance": self.variances[idx],
+                    "ndata": self.ndata[idx]
+                } for sample, idx in self.index.items()}}
+
+
+def trait_data_arrays(trait_data: Union[dict, TraitData]) -> TraitData:
+    """Get the array-backed form of `trait_data`."""
+    if isinstance(trait_data, TraitData):
+        return trait_data
+    return TraitData.from_dict(trait_data)
+
+
 def export_trait_data(
-        trait_data: dict, samplelist: Sequence[str], dtype: str = "val",
-        var_exists: bool = False, n_exists: bool = False):
+        trait_data: Union[dict, TraitData], samplelist: Sequence[str],
+        dtype: str = "val", var_exists: bool = False, n_exists: bool = False):
     """
     Export data according to `samplelist`. Mostly used in calculating
     correlations.
@@ -19,8 +144,12 @@ def export_trait_data(
     Migrated from
     https://github.com/genenetwork/genenetwork1/blob/master/web/webqtl/base/webqtlTrait.py#L166-L211
 
+    The data is gathered from the arrays of a `TraitData` object: pass one,
+    rather than the dictionary, when exporting the same trait's data more than
+    once.
+
     PARAMETERS
-    trait: (dict)
+    trait: (dict or TraitData)
       The dictionary of key-value pairs representing a trait
     samplelist: (list)
       A list of sample names
@@ -31,49 +160,8 @@ def export_trait_data(
     n_exists: (bool)
       A flag indicating existence of ndata
     """
-    def __export_all_types(tdata, sample):
-        sample_data = []
-        if tdata[sample]["value"]:
-            sample_data.append(tdata[sample]["value"])
-            if var_exists:
-                if tdata[sample]["variance"]:
-                    sample_data.append(tdata[sample]["variance"])
-                else:
-                    sample_data.append(None)
-            if n_exists:
-                if tdata[sample]["ndata"]:
-                    sample_data.append(tdata[sample]["ndata"])
-                else:
-                    sample_data.append(None)
-        else:
-            if var_exists and n_exists:
-                sample_data += [None, None, None]
-            elif var_exists or n_exists:
-                sample_data += [None, None]
-            else:
-                sample_data.append(None)
-
-        return tuple(sample_data)
-
-    def __exporter(accumulator, sample):
-        # pylint: disable=[R0911]
-        if sample in trait_data["data"]:
-            if dtype == "val":
-                return accumulator + (trait_data["data"][sample]["value"], )
-            if dtype == "var":
-                return accumulator + (trait_data["data"][sample]["variance"], )
-            if dtype == "N":
-                return accumulator + (trait_data["data"][sample]["ndata"], )
-            if dtype == "all":
-                return accumulator + __export_all_types(trait_data["data"], sample)
-            raise KeyError(f"Type `{dtype}` is incorrect")
-        if var_exists and n_exists:
-            return accumulator + (None, None, None)
-        if var_exists or n_exists:
-            return accumulator + (None, None)
-        return accumulator + (None,)
-
-    return reduce(__exporter, samplelist, tuple())
+    return trait_data_arrays(trait_data).export(
+        samplelist, dtype, var_exists, n_exists)
 
 
 def retrieve_publish_trait_info(trait_data_source: Dict[str, Any], conn: Any):
@@ -610,8 +698,9 @@ def with_samplelist_data_setup(samplelist: Sequence[str]):
       sample's value, variance and ndata values, only if the sample is present
       in the provided `samplelist` variable.
     """
+    samples = frozenset(samplelist)
     def setup_fn(tdata):
-        if tdata["sample_name"] in samplelist:
+        if tdata["sample_name"] in samples:
             val = tdata["value"]
             if val is not None:
                 return {
@@ -695,7 +784,8 @@ def generate_traits_filename(base_path: str):
         f"{os.path.abspath(base_path)}/traits_test_file_{random_string(10)}.txt")
 
 
-def export_informative(trait_data: dict, inc_var: bool = False) -> tuple:
+def export_informative(
+        trait_data: Union[dict, TraitData], inc_var: bool = False) -> tuple:
     """
     Export informative strain
 
@@ -707,15 +797,4 @@ def export_informative(trait_data: dict, inc_var: bool = False) -> tuple:
     the inclusion of the `variance` value, then the current implementation, and
     that one in GN1 have a bug.
     """
-    def __exporter__(acc, data_item):
-        if not inc_var or data_item["variance"] is not None:
-            return (
-                acc[0] + (data_item["sample_name"],),
-                acc[1] + (data_item["value"],),
-                acc[2] + (data_item["variance"],))
-        return acc
-    return reduce(
-        __exporter__,
-        filter(lambda td: td["value"] is not None,
-               trait_data["data"].values()),
-        (tuple(), tuple(), tuple()))
+    return trait_data_arrays(trait_data).informative(inc_var)
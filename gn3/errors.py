@@ -19,6 +19,7 @@ from authlib.oauth2.rfc6749.errors import OAuth2Error
 from gn3.oauth2 import errors as oautherrors
 from gn3.oauth2.errors import AuthorisationError
 from  gn3.llms.errors import LLMError
+from gn3.exceptions import ServiceBusy
 
 logger = logging.getLogger(__name__)
 
@@ -149,6 +150,18 @@ def handle_llm_error(exc: Exception) -> Response:
     return resp
 
 
+def handle_service_busy(exc: ServiceBusy) -> Response:
+    """Handle a service being too busy to accept more requests."""
+    logger.error("Handling busy service - %s", request.url)
+    resp = jsonify({
+        "error": type(exc).__name__,
+        "error_description": (
+            exc.args[0] if bool(exc.args) else "Service busy")
+    })
+    resp.status_code = 503
+    return resp
+
+
 def register_error_handlers(app: Flask):
     """Register application-level error handlers."""
     app.register_error_handler(NotFound, page_not_found)
@@ -159,6 +172,7 @@ def register_error_handlers(app: Flask):
     app.register_error_handler(RemoteDisconnected, internal_server_error)
     app.register_error_handler(URLError, url_server_error)
     app.register_error_handler(LLMError, handle_llm_error)
+    app.register_error_handler(ServiceBusy, handle_service_busy)
     for exc in (
             EndPointInternalError,
             EndPointNotFound,
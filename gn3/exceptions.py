@@ -7,3 +7,7 @@ class FailedToQueue(Exception):
 
 class RedisConnectionError(ConnectionError):
     """Raised when there is no Redis connection"""
+
+
+class ServiceBusy(Exception):
+    """Raised when a service cannot accept any more requests at the moment"""
@@ -4,7 +4,7 @@ generate various kinds of heatmaps.
 """
 from pathlib import Path
 from functools import reduce
-from typing import Any, Dict, Union, Sequence
+from typing import Any, Dict, Union, Callable, Optional, Sequence
 
 from flask import current_app as app
 
@@ -13,21 +13,20 @@ import plotly.graph_objects as go # type: ignore
 import plotly.figure_factory as ff # type: ignore
 from plotly.subplots import make_subplots # type: ignore
 
-from gn3.chancy import random_string
 from gn3.computations.slink import slink
 from gn3.db.traits import export_trait_data
-from gn3.computations.correlations2 import compute_correlation
+from gn3.computations.matrix_correlations import pairwise_correlation_matrix
 from gn3.db.genotypes import (
     build_genotype_file, load_genotype_samples)
 from gn3.db.traits import (
-    retrieve_trait_data, retrieve_trait_info)
+    TraitData, retrieve_trait_data, retrieve_trait_info)
 from gn3.computations.qtlreaper import (
-    run_reaper,
-    generate_traits_file,
+    run_reaper_for_traits,
     chromosome_sorter_key_fn,
-    parse_reaper_main_results,
     organise_reaper_main_results)
 
+# The stages of building a heatmap, in order, as reported by `build_heatmap`
+HEATMAP_STAGES = ("fetch", "cluster", "map", "render")
 
 def trait_display_name(trait: Dict):
     """
@@ -53,25 +52,23 @@ def trait_display_name(trait: Dict):
         return prefix
     return trait["description"]
 
-def cluster_traits(traits_data_list: Sequence[Dict]):
+def cluster_traits(traits_data_list: Sequence[Sequence]) -> np.ndarray:
     """
     Clusters the trait values.
 
     DESCRIPTION
     Attempts to replicate the clustering of the traits, as done at
     https://github.com/genenetwork/genenetwork1/blob/master/web/webqtl/heatmap/Heatmap.py#L138-L162
-    """
-    def __compute_corr(tdata_i, tdata_j):
-        if tdata_i[0] == tdata_j[0]:
-            return 0.0
-        return 1 - compute_correlation(tdata_i[1], tdata_j[1])[0]
-
-    def __cluster(tdata_i):
-        return tuple(
-            __compute_corr(tdata_i, tdata_j)
-            for tdata_j in enumerate(traits_data_list))
 
-    return tuple(__cluster(tdata_i) for tdata_i in enumerate(traits_data_list))
+    Returns the (traits x traits) matrix of the distances between the traits,
+    i.e. 1 - Pearson's r of their values, where `None` values are left out of
+    each pair's correlation.
+    """
+    distances = 1 - pairwise_correlation_matrix(
+        np.array(traits_data_list, dtype=np.float64).reshape(
+            len(traits_data_list), -1))
+    np.fill_diagonal(distances, 0.0)
+    return distances
 
 def get_loci_names(
         organised: dict,
@@ -99,12 +96,20 @@ def get_loci_names(
         __get_trait_loci, [v[1] for v in organised.items()], {})
     return tuple(loci_dict[_chr] for _chr in chromosome_names)
 
-def build_heatmap(
+def __no_progress__(_stage: str, _done: int, _total: int):
+    """Ignore the progress of building a heatmap."""
+
+def build_heatmap(# pylint: disable=[too-many-arguments]
         conn: Any,
         traits_names: Sequence[str],
         genotype_files: Union[str, Path],
         vertical: bool = False,
-        tmpdir: Union[str, Path] = "/tmp") -> go.Figure:
+        tmpdir: Union[str, Path] = "/tmp",
+        *,
+        reaper_command: Optional[str] = None,
+        workers: Optional[int] = None,
+        progress: Callable[[str, int, int], None] = __no_progress__
+) -> go.Figure:
     """
     heatmap function
 
@@ -119,37 +124,45 @@ def build_heatmap(
 
     PARAMETERS:
     TODO: Elaborate on the parameters here...
+    reaper_command, workers: The `qtlreaper` command, and the maximum number
+        of `qtlreaper` processes to run at a time. These default to the
+        application's `REAPER_COMMAND` and `MULTIPROCESSOR_PROCS` settings.
+    progress: Called with the stage (one of `HEATMAP_STAGES`), the number of
+        items of that stage done so far and the number of items in the stage,
+        as the heatmap is built.
     """
     # pylint: disable=[R0914]
+    reaper_command = reaper_command or app.config['REAPER_COMMAND']
+    workers = workers or app.config.get("MULTIPROCESSOR_PROCS")
     threshold = 0 # webqtlConfig.PUBLICTHRESH
-    traits = [
-        retrieve_trait_info(threshold, fullname, conn)
-        for fullname in traits_names]
-    traits_data_list = [retrieve_trait_data(t, conn) for t in traits]
+    traits_data_list = []
+    traits = []
+    progress("fetch", 0, len(traits_names))
+    for idx, fullname in enumerate(traits_names):
+        traits.append(retrieve_trait_info(threshold, fullname, conn))
+        traits_data_list.append(
+            TraitData.from_dict(retrieve_trait_data(traits[-1], conn)))
+        progress("fetch", idx + 1, len(traits_names))
     genotype_filename = build_genotype_file(traits[0]["group"], genotype_files)
     samples = load_genotype_samples(genotype_filename)
     exported_traits_data_list = [
         export_trait_data(td, samples) for td in traits_data_list]
+    progress("cluster", 0, 1)
     clustered = cluster_traits(exported_traits_data_list)
     slinked = slink(clustered)
     traits_order = compute_traits_order(slinked)
     samples_and_values = retrieve_samples_and_values(
         traits_order, samples, exported_traits_data_list)
-    traits_filename = f"{tmpdir}/traits_test_file_{random_string(10)}.txt"
-    generate_traits_file(
+    progress("map", 0, len(samples_and_values))
+    qtlresults = run_reaper_for_traits(
+        reaper_command,
+        genotype_filename,
         samples_and_values[0][1],
         [t[2] for t in samples_and_values],
-        traits_filename)
-
-    main_output, _permutations_output = run_reaper(
-        app.config['REAPER_COMMAND'],
-        genotype_filename,
-        traits_filename,
-        output_dir=app.config["TMPDIR"],
-        separate_nperm_output=True
-    )
-
-    qtlresults = parse_reaper_main_results(main_output)
+        output_dir=str(tmpdir),
+        workers=workers,
+        progress=lambda done, total: progress("map", done, total))
+    progress("render", 0, 1)
     organised = organise_reaper_main_results(qtlresults)
 
     traits_ids = [# sort numerically, but retain the ids as strings
@@ -294,7 +307,7 @@ def process_traits_data_for_heatmap(data, trait_names, chromosome_names):
     return hdata
 
 def clustered_heatmap(# pylint: disable=[too-many-positional-arguments]
-        data: Sequence[Sequence[float]], clustering_data: Sequence[float],
+        data: Sequence[Sequence[float]], clustering_data: np.ndarray,
         x_axis,#: Dict[Union[str, int], Union[str, Sequence[str]]],
         y_axis: Dict[str, Union[str, Sequence[str]]],
         loci_names: Sequence[Sequence[str]] = tuple(),
@@ -320,7 +333,7 @@ def clustered_heatmap(# pylint: disable=[too-many-positional-arguments]
             f"Chromosome: {chromo}" if vertical else chromo
             for chromo in x_axis_data],#+ x_axis_data,
         figure=ff.create_dendrogram(
-            np.array(clustering_data),
+            np.asarray(clustering_data),
             orientation="bottom" if vertical else "right",
             labels=y_axis_data))
     hms = [go.Heatmap(
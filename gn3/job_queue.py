@@ -0,0 +1,392 @@
+"""Scheduling of the commands queued with `gn3.commands.queue_cmd`
+
+Each queued command belongs to a job class (see `JOB_CLASSES`), going by the
+command, and to the user that submitted it. The commands wait in a list per
+class and user, and the users with waiting commands are kept, per class, in a
+sorted set scored by when they were last served. The workers (see
+`sheepdog.worker`) take the next command off the queue with `dequeue`:
+
+  - from the class of highest priority that has waiting commands and fewer
+    than its `max_running` commands running,
+  - from the user of that class that was served the longest time ago, so that
+    one user's many commands do not hold up the others'.
+
+The keys, for a queue `<queue>` (e.g. `GN3::job-queue`), are:
+
+  - `<queue>::class::<class>::users`: the sorted set of users,
+  - `<queue>::class::<class>::user::<user>`: the list of a user's commands,
+  - `<queue>::running`: the number of running commands per class,
+  - `<queue>::stats`: the number of commands dequeued per class, and the total
+    time they waited,
+  - `<queue>::wakeup`: tokens that wake up the idle workers,
+  - `<queue>::dedup::<fingerprint>`: the command last queued with the given
+    fingerprint (see `command_fingerprint`), kept for a while after it
+    completes so that identical commands reuse its result; the submitters of
+    those commands are listed at `<command>::attached`,
+  - `<queue>::workers`, `<queue>::heartbeat::<worker>` and
+    `<queue>::in-flight::<worker>`: the workers, and the commands they run.
+
+Commands put directly on the `<queue>` list (e.g. before job classes existed)
+are run, in the default class, once there are no others."""
+import os
+import json
+import time
+import shlex
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Union, Optional, Sequence
+
+from redis import Redis
+
+from gn3.fs_helpers import get_hash_of_files
+
+@dataclass(frozen=True)
+class JobClass:
+    """A class of jobs: the jobs of the classes of higher `priority` are run
+    first, and at most `max_running` jobs of the class run at any one time (no
+    limit if `None`)."""
+    name: str
+    priority: int
+    max_running: Optional[int] = None
+
+
+DEFAULT_CLASS = "default"
+JOB_CLASSES = {job_class.name: job_class for job_class in (
+    JobClass("gemma", priority=30),
+    JobClass("rqtl", priority=20),
+    JobClass("partial-correlations", priority=20),
+    JobClass("partial-correlations-against-db", priority=10, max_running=2),
+    JobClass(DEFAULT_CLASS, priority=0))}
+ANONYMOUS_USER = "anonymous"
+# The ids of the workers that exit once idle (see `sheepdog.worker`) start with
+ONE_SHOT_PREFIX = "one-shot:"
+# Enough tokens to wake up all the idle workers of a queue
+MAX_WAKEUP_TOKENS = 64
+
+
+def __decode__(value: Any) -> Any:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def command_class(cmd: Union[str, Sequence[str]]) -> str:
+    """Get the name of the job class of the command `cmd`."""
+    command = cmd if isinstance(cmd, str) else " ".join(cmd)
+    if "scripts.partial_correlations" in command:
+        if "against-db" in command.split():
+            return "partial-correlations-against-db"
+        return "partial-correlations"
+    if "gemma" in command:
+        return "gemma"
+    if "rqtl" in command.lower():
+        return "rqtl"
+    return DEFAULT_CLASS
+
+
+def workers_key(job_queue: str) -> str:
+    """The set of the ids of the pool workers (see `sheepdog.worker`) serving
+    `job_queue`."""
+    return f"{job_queue}::workers"
+
+
+def heartbeat_key(job_queue: str, worker_id: str) -> str:
+    """The key that the pool worker `worker_id` keeps alive while it runs."""
+    return f"{job_queue}::heartbeat::{worker_id}"
+
+
+def in_flight_key(job_queue: str, worker_id: str) -> str:
+    """The list of the ids of the commands that the worker `worker_id` has
+    taken off `job_queue`, and not yet completed."""
+    return f"{job_queue}::in-flight::{worker_id}"
+
+
+def users_key(job_queue: str, job_class: str) -> str:
+    """The sorted set of the users with commands of class `job_class` waiting,
+    scored by when they were last served."""
+    return f"{job_queue}::class::{job_class}::users"
+
+
+def user_queue_key(job_queue: str, job_class: str, user: str) -> str:
+    """The list of the commands of class `job_class` waiting for `user`."""
+    return f"{job_queue}::class::{job_class}::user::{user}"
+
+
+def running_key(job_queue: str) -> str:
+    """The hash of the number of running commands per class."""
+    return f"{job_queue}::running"
+
+
+def stats_key(job_queue: str) -> str:
+    """The hash of the number of commands dequeued per class, and the total
+    number of seconds they waited."""
+    return f"{job_queue}::stats"
+
+
+def wakeup_key(job_queue: str) -> str:
+    """The list the idle workers block on, waiting for commands."""
+    return f"{job_queue}::wakeup"
+
+
+def dedup_key(job_queue: str, fingerprint: str) -> str:
+    """The key holding the id of the command with `fingerprint`."""
+    return f"{job_queue}::dedup::{fingerprint}"
+
+
+def live_workers(conn: Redis, job_queue: str) -> tuple[str, ...]:
+    """Get the ids of the pool workers serving `job_queue` whose heartbeat has
+    not expired."""
+    workers = sorted(
+        __decode__(worker) for worker in
+        conn.smembers(workers_key(job_queue)))# type: ignore[union-attr]
+    if not workers:
+        return tuple()
+    return tuple(
+        worker for worker, beat in zip(
+            workers,
+            conn.mget([heartbeat_key(job_queue, worker)
+                       for worker in workers]))# type: ignore[arg-type]
+        if beat is not None)
+
+
+def live_daemons(conn: Redis, job_queue: str) -> tuple[str, ...]:
+    """Get the ids of the live pool workers serving `job_queue` that do not
+    exit once idle."""
+    return tuple(
+        worker for worker in live_workers(conn, job_queue)
+        if not worker.startswith(ONE_SHOT_PREFIX))
+
+
+def command_fingerprint(
+        cmd: Union[str, Sequence[str]], extra: Sequence[Any] = tuple()) -> str:
+    """Hash the command `cmd`, split into its arguments, with the contents of
+    the files that its arguments name, and any `extra` values the results of
+    the command depend on."""
+    arguments = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+    files = sorted({arg for arg in arguments if os.path.isfile(arg)})
+    digest = hashlib.sha256(json.dumps(
+        [arguments, [__decode__(value) for value in extra]]).encode("utf-8"))
+    if files:
+        digest.update(get_hash_of_files(files).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def attached_key(cmd_id: str) -> str:
+    """The list of the submitters (see `claim_fingerprint`) attached to the
+    command `cmd_id`."""
+    return f"{cmd_id}::attached"
+
+
+def claim_fingerprint(# pylint: disable=[too-many-arguments, too-many-positional-arguments]
+        conn: Redis, job_queue: str, fingerprint: str, cmd_id: str,
+        ttl: int, submitter: Optional[dict] = None) -> str:
+    """Claim `fingerprint` for the new command `cmd_id`, unless a command with
+    the same fingerprint is queued, running or successfully completed less than
+    `ttl` seconds ago. Returns the id of the command to use: `cmd_id`, or that
+    of the existing command, which the new one should be attached to.
+
+    The hash of `cmd_id` has to be written before the fingerprint is claimed,
+    so that the identical commands submitted meanwhile find it queued. The
+    `submitter` (e.g. its user and email) of a command attached to an existing
+    one is recorded on the list at `attached_key`."""
+    key = dedup_key(job_queue, fingerprint)
+    if conn.set(key, cmd_id, nx=True, ex=ttl):
+        return cmd_id
+    existing = conn.get(key)
+    if existing is not None:
+        existing = __decode__(existing)# type: ignore[arg-type]
+        status = conn.hget(existing, "status")
+        if status is not None and __decode__(status) != "error":
+            with conn.pipeline() as pipe:
+                pipe.hincrby(existing, "attached", 1)
+                pipe.rpush(attached_key(existing), json.dumps(submitter or {}))
+                pipe.execute()
+            return existing
+    conn.set(key, cmd_id, ex=ttl)
+    return cmd_id
+
+
+def settle_fingerprint(conn: Redis, job_queue: str, cmd_id: str,
+                       success: bool):
+    """Keep the completed command `cmd_id` for reuse by identical commands for
+    its `dedup_ttl` seconds if it succeeded, or release its fingerprint so that
+    they run again otherwise."""
+    fingerprint = conn.hget(cmd_id, "fingerprint")
+    if fingerprint is None:
+        return
+    key = dedup_key(job_queue, __decode__(fingerprint))
+    owner = conn.get(key)
+    if owner is None or __decode__(owner) != cmd_id:
+        return
+    if success:
+        conn.expire(key, int(conn.hget(cmd_id, "dedup_ttl")))# type: ignore[arg-type]
+    else:
+        conn.delete(key)
+
+
+def __wake__(pipe: Any, job_queue: str):
+    """Wake up an idle worker, if any."""
+    pipe.lpush(wakeup_key(job_queue), 1)
+    pipe.ltrim(wakeup_key(job_queue), 0, MAX_WAKEUP_TOKENS - 1)
+
+
+def enqueue(conn: Redis, job_queue: str, cmd_id: str, job_class: str,
+            user: str):
+    """Put the command identified by `cmd_id` at the end of `user`'s queue of
+    `job_class` commands."""
+    with conn.pipeline() as pipe:
+        pipe.rpush(user_queue_key(job_queue, job_class, user), cmd_id)
+        pipe.zadd(users_key(job_queue, job_class), {user: time.time()}, nx=True)
+        __wake__(pipe, job_queue)
+        pipe.execute()
+
+
+def __next_command__(
+        pipe: Any, job_queue: str, ordered: Sequence[JobClass],
+        stale: list) -> Optional[tuple[str, str, str, bool]]:
+    """Find the next command to run, returning its class, its user, its id and
+    whether the user has more commands waiting."""
+    running = {
+        __decode__(name): int(count)
+        for name, count in pipe.hgetall(running_key(job_queue)).items()}
+    for job_class in ordered:
+        if (job_class.max_running is not None
+                and running.get(job_class.name, 0) >= job_class.max_running):
+            continue
+        pipe.watch(users_key(job_queue, job_class.name))
+        for user in pipe.zrange(users_key(job_queue, job_class.name), 0, -1):
+            user = __decode__(user)
+            queue = user_queue_key(job_queue, job_class.name, user)
+            pipe.watch(queue)
+            waiting = pipe.lrange(queue, 0, 1)
+            if len(waiting) == 0:
+                stale.append((job_class.name, user))
+                continue
+            return job_class.name, user, __decode__(waiting[0]), len(
+                waiting) > 1
+    return None
+
+
+def dequeue(conn: Redis, job_queue: str, in_flight: str,
+            classes: Optional[dict[str, JobClass]] = None) -> Optional[
+                tuple[str, str]]:
+    """Move the next command to run onto the `in_flight` list, returning its
+    id and class, or `None` if there is no command that can be run now."""
+    ordered = sorted(
+        (classes or JOB_CLASSES).values(),
+        key=lambda job_class: job_class.priority, reverse=True)
+
+    def __dequeue__(pipe):
+        stale: list = []
+        found = __next_command__(pipe, job_queue, ordered, stale)
+        if found is None:
+            pipe.watch(job_queue)
+            legacy = pipe.lindex(job_queue, 0)
+            queued_at = None
+        else:
+            queued_at = pipe.hget(found[2], "queued_at")
+        pipe.multi()
+        for class_name, user in stale:
+            pipe.zrem(users_key(job_queue, class_name), user)
+        if found is None:
+            if legacy is None:
+                return None
+            pipe.lmove(job_queue, in_flight, "LEFT", "RIGHT")
+            pipe.hincrby(running_key(job_queue), DEFAULT_CLASS, 1)
+            return __decode__(legacy), DEFAULT_CLASS
+
+        class_name, user, cmd_id, more_waiting = found
+        pipe.lmove(user_queue_key(job_queue, class_name, user), in_flight,
+                   "LEFT", "RIGHT")
+        pipe.hincrby(running_key(job_queue), class_name, 1)
+        if more_waiting:# to the back of the line
+            pipe.zadd(users_key(job_queue, class_name), {user: time.time()})
+        else:
+            pipe.zrem(users_key(job_queue, class_name), user)
+        pipe.hincrby(stats_key(job_queue), f"{class_name}:dequeued", 1)
+        if queued_at is not None:
+            pipe.hincrbyfloat(
+                stats_key(job_queue), f"{class_name}:wait",
+                max(0.0, time.time() - float(queued_at)))
+        return cmd_id, class_name
+
+    return conn.transaction(# type: ignore[return-value]
+        __dequeue__, running_key(job_queue), value_from_callable=True)
+
+
+def complete(conn: Redis, job_queue: str, in_flight: str, cmd_id: str,
+             job_class: str):
+    """Take the completed command identified by `cmd_id` off the `in_flight`
+    list, freeing its slot in its class."""
+    with conn.pipeline() as pipe:
+        pipe.lrem(in_flight, 1, cmd_id)
+        pipe.hincrby(running_key(job_queue), job_class, -1)
+        __wake__(pipe, job_queue)
+        pipe.execute()
+
+
+def requeue(conn: Redis, job_queue: str, in_flight: str, cmd_id: str) -> bool:
+    """Move the command identified by `cmd_id` from the `in_flight` list back
+    to the head of its user's queue, to be run again. Returns `False` if the
+    command was no longer in flight."""
+    def __requeue__(pipe):
+        if cmd_id not in (__decode__(item)
+                          for item in pipe.lrange(in_flight, 0, -1)):
+            return False
+        class_name = __decode__(pipe.hget(cmd_id, "class") or DEFAULT_CLASS)
+        user = __decode__(pipe.hget(cmd_id, "user") or ANONYMOUS_USER)
+        pipe.multi()
+        pipe.lrem(in_flight, 1, cmd_id)
+        pipe.lpush(user_queue_key(job_queue, class_name, user), cmd_id)
+        pipe.zadd(users_key(job_queue, class_name), {user: 0})
+        pipe.hincrby(running_key(job_queue), class_name, -1)
+        pipe.hset(cmd_id, key="status", value="queued")
+        __wake__(pipe, job_queue)
+        return True
+
+    return conn.transaction(# type: ignore[return-value]
+        __requeue__, in_flight, value_from_callable=True)
+
+
+def queue_stats(conn: Redis, job_queue: str,
+                classes: Optional[dict[str, JobClass]] = None) -> dict:
+    """Get the depth of the queue, and the wait times, per class."""
+    now = time.time()
+    running = {
+        __decode__(name): int(count) for name, count in
+        conn.hgetall(running_key(job_queue)).items()}# type: ignore[union-attr]
+    stats = {
+        __decode__(name): float(value) for name, value in
+        conn.hgetall(stats_key(job_queue)).items()}# type: ignore[union-attr]
+
+    def __class_stats__(job_class: JobClass) -> dict:
+        queued, oldest = 0, None
+        for user in conn.zrange(# type: ignore[union-attr]
+                users_key(job_queue, job_class.name), 0, -1):
+            queue = user_queue_key(
+                job_queue, job_class.name,
+                __decode__(user))# type: ignore[arg-type]
+            queued = queued + conn.llen(queue)# type: ignore[operator]
+            head = conn.lindex(queue, 0)
+            queued_at = conn.hget(head, "queued_at") if head else None
+            if queued_at is not None:
+                oldest = min(float(queued_at), oldest or now)
+        dequeued = int(stats.get(f"{job_class.name}:dequeued", 0))
+        return {
+            "priority": job_class.priority,
+            "max_running": job_class.max_running,
+            "running": max(0, running.get(job_class.name, 0)),
+            "queued": queued,
+            "dequeued": dequeued,
+            "mean_wait_seconds": (
+                stats.get(f"{job_class.name}:wait", 0.0) / dequeued
+                if dequeued else None),
+            "longest_wait_seconds": (
+                None if oldest is None else max(0.0, now - oldest))
+        }
+
+    return {
+        "classes": {
+            job_class.name: __class_stats__(job_class)
+            for job_class in (classes or JOB_CLASSES).values()},
+        "unclassified": conn.llen(job_queue),
+        "workers": len(live_workers(conn, job_queue))
+    }
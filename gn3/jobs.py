@@ -1,6 +1,7 @@
 """Handle external processes in a consistent manner."""
 import json
-from typing import Any
+import subprocess
+from typing import Any, Optional
 from uuid import UUID, uuid4
 from datetime import datetime
 
@@ -10,6 +11,9 @@ from pymonad.either import Left, Right, Either
 from gn3 import json_encoders_decoders as jed
 
 JOBS_NAMESPACE = "GN3::JOBS"
+# Seconds for which a job, and its output, are kept: from its creation, in case
+# its process never starts, and again once it is done
+JOB_TTL = 7 * 24 * 60 * 60
 
 class InvalidCommand(Exception):
     """Raise if the command to run is invalid."""
@@ -59,3 +63,23 @@ def create_job(redisconn: Redis, job_details: dict[str, Any]) -> UUID:
         raise InvalidCommand(err["error_description"])
     return __command_valid__(job_details.get("command")).either(
         __raise__, __create__)
+
+def update_job(redisconn: Redis, job_id: UUID, details: dict[str, Any]):
+    """Update the given `details` of the job identified by `job_id`."""
+    redisconn.hset(job_key(job_id), mapping={
+        key: json.dumps(value, cls=jed.CustomJSONEncoder)
+        for key, value in details.items()
+    })
+
+def job_output_key(job_id: UUID, namespace_prefix: str = JOBS_NAMESPACE):
+    """Build the key for the output of a specific job. The output is kept apart
+    from the job's details, so that checking on the job does not fetch its
+    (possibly large) output."""
+    return f"{job_key(job_id, namespace_prefix)}::output"
+
+def launch_job(the_job: dict[str, Any], env: Optional[dict] = None) -> dict:
+    """Run the command of `the_job` in a new process, without waiting for it to
+    complete. The command is responsible for updating the job's status."""
+    subprocess.Popen(# pylint: disable=[consider-using-with]
+        the_job["command"], env=env, start_new_session=True)
+    return the_job
@@ -0,0 +1,228 @@
+"""Phenotype matrix database reader
+
+This module reads the phenotype matrices written to LMDB by
+`scripts/lmdb_phenotypes_matrix.py`: each dataset is an LMDB environment with
+the keys
+
+* pheno_metadata - JSON with the trait (row) and strain (column) names, dtype…
+* pheno_matrix - the (traits x strains) matrix of values, in C-order
+* pheno_se_matrix - (optional) the standard errors, with the same layout
+
+Opening an environment and decoding the metadata is comparatively expensive,
+so readers are cached per dataset path, for the life of the process, and are
+re-opened when the LMDB data file changes. Rows are read straight from the
+memory-mapped matrix, without copying the whole matrix out of LMDB.
+
+Here is a typical invocation to read a single trait:
+
+from gn3 import phenodb
+
+pheno = phenodb.reader('/var/lib/lmdb/BXDPublish')
+print(pheno.strains)
+print(pheno.row('12315'))
+"""
+import os
+import json
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, Optional, Sequence
+
+import lmdb
+import numpy as np
+
+VALUES_KEY = b"pheno_matrix"
+SE_KEY = b"pheno_se_matrix"
+METADATA_KEY = b"pheno_metadata"
+
+
+def file_version(db_path: str) -> tuple[int, int, int]:
+    """Identify the current version of the LMDB data file at `db_path`. This
+    changes whenever the file is written to or replaced."""
+    stat = os.stat(os.path.join(db_path, "data.mdb"))
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def read_metadata(txn: lmdb.Transaction) -> dict:
+    """Read and decode the metadata JSON from an open transaction."""
+    raw = txn.get(METADATA_KEY)
+    if raw is None:
+        raise KeyError("Metadata not found in LMDB")
+    return json.loads(bytes(raw).decode("utf-8"))
+
+
+@dataclass
+class PhenotypeReader:# pylint: disable=[too-many-instance-attributes]
+    """An open phenotype matrix database, with its decoded metadata."""
+    path: str
+    env: lmdb.Environment
+    version: tuple[int, int, int]
+    metadata: dict
+    strains: list[str] = field(init=False)
+    traits: list[str] = field(init=False)
+    trait_index: dict[str, int] = field(init=False)
+    dtype: np.dtype = field(init=False)
+    closed: bool = field(init=False, default=False)
+    active_reads: int = field(init=False, default=0)
+    state: threading.Lock = field(
+        init=False, default_factory=threading.Lock)
+
+    def __post_init__(self):
+        self.strains = self.metadata["strains"]
+        self.traits = self.metadata["traits"]
+        self.trait_index = {
+            trait: idx for idx, trait in enumerate(self.traits)}
+        self.dtype = np.dtype(self.metadata["dtype"])
+
+    @property
+    def columns(self) -> int:
+        """The number of strains (columns) in the matrix."""
+        return self.metadata["columns"]
+
+    @property
+    def has_se(self) -> bool:
+        """Whether the database has a standard-errors matrix."""
+        return self.metadata.get("has_se", False)
+
+    def row_index(self, trait_name: str) -> int:
+        """Get the index of the row with the values for `trait_name`."""
+        try:
+            return self.trait_index[trait_name]
+        except KeyError as _kerr:
+            raise KeyError(f"Trait '{trait_name}' not found") from None
+
+    @contextmanager
+    def __reading__(self) -> Iterator[Optional[lmdb.Transaction]]:
+        """Open a read transaction, or yield `None` if the reader has been
+        closed because the database changed after the reader was handed out.
+        Any number of reads can run concurrently; the last one to end closes the
+        environment of a closed reader."""
+        with self.state:
+            if self.closed:
+                txn = None
+            else:
+                self.active_reads += 1
+                txn = self.env.begin(buffers=True)
+        if txn is None:
+            yield None
+            return
+        try:
+            with txn:
+                yield txn
+        finally:
+            with self.state:
+                self.active_reads -= 1
+                if self.closed and self.active_reads == 0:
+                    self.env.close()
+
+    def __matrix__(
+            self, txn: lmdb.Transaction, matrix_key: bytes) -> np.ndarray:
+        raw = txn.get(matrix_key)
+        if raw is None:
+            raise KeyError(f"Matrix '{matrix_key.decode()}' not found in LMDB")
+        return np.frombuffer(raw, dtype=self.dtype).reshape(-1, self.columns)
+
+    def read(self, trait_names: Sequence[str],
+             matrix_keys: Sequence[bytes] = (VALUES_KEY,)) -> dict[
+                 bytes, np.ndarray]:
+        """Fetch the rows for `trait_names`, from each of the matrices in
+        `matrix_keys`, as (traits x strains) arrays.
+
+        The rows are gathered directly from the memory-mapped matrices, in a
+        single read transaction."""
+        indexes = np.array(
+            [self.row_index(name) for name in trait_names], dtype=np.intp)
+        with self.__reading__() as txn:
+            if txn is not None:
+                # Fancy-indexing copies the rows out of the memory map, so
+                # that they remain valid once the transaction ends.
+                return {key: self.__matrix__(txn, key)[indexes]
+                        for key in matrix_keys}
+        return reader(self.path).read(trait_names, matrix_keys)
+
+    def rows(self, trait_names: Sequence[str],
+             matrix_key: bytes = VALUES_KEY) -> np.ndarray:
+        """Fetch the rows for `trait_names` as a (traits x strains) array."""
+        return self.read(trait_names, (matrix_key,))[matrix_key]
+
+    def row(self, trait_name: str,
+            matrix_key: bytes = VALUES_KEY) -> np.ndarray:
+        """Fetch the values of a single trait, for all strains."""
+        return self.rows((trait_name,), matrix_key)[0]
+
+    @contextmanager
+    def matrix(self, matrix_key: bytes = VALUES_KEY) -> Iterator[np.ndarray]:
+        """Get the whole (traits x strains) matrix, memory-mapped rather than
+        copied out of LMDB. The array is read-only and MUST NOT be used
+        outside of the `with` block."""
+        with self.__reading__() as txn:
+            if txn is not None:
+                yield self.__matrix__(txn, matrix_key)
+                return
+        with reader(self.path).matrix(matrix_key) as matrix:
+            yield matrix
+
+    def close(self):
+        """Stop new reads, and close the underlying LMDB environment: now, or
+        once the ongoing reads are done. Does not wait for them, so that a
+        long read, e.g. of the whole matrix, does not hold up the caller."""
+        with self.state:
+            self.closed = True
+            if self.active_reads == 0:
+                self.env.close()
+
+
+def open_reader(db_path: str) -> PhenotypeReader:
+    """Open the phenotype matrix database at `db_path`, bypassing the cache."""
+    version = file_version(db_path)
+    env = lmdb.open(db_path, readonly=True, lock=False)
+    try:
+        with env.begin() as txn:
+            metadata = read_metadata(txn)
+    except Exception:
+        env.close()
+        raise
+    return PhenotypeReader(db_path, env, version, metadata)
+
+
+__readers__: dict[str, PhenotypeReader] = {}
+__readers_lock__ = threading.Lock()
+
+
+def reader(db_path: str) -> PhenotypeReader:
+    """Get the (cached) reader for the phenotype matrix database at `db_path`.
+
+    The reader is re-opened if the database has changed since it was cached."""
+    db_path = os.path.abspath(db_path)
+    with __readers_lock__:
+        cached: Optional[PhenotypeReader] = __readers__.get(db_path)
+        if cached is not None:
+            if cached.version == file_version(db_path):
+                return cached
+            if cached.active_reads == 0:
+                # LMDB does not allow the same files to be opened more than
+                # once in a process, so the stale environment is closed first.
+                cached.close()
+            else:
+                # Without waiting, under the lock, for the ongoing reads: a
+                # replaced database can be opened alongside the stale one,
+                # which closes once its reads are done. One changed in place
+                # cannot: its reader stays in use until it is idle.
+                try:
+                    fresh = open_reader(db_path)
+                except lmdb.Error:
+                    return cached
+                cached.close()
+                __readers__[db_path] = fresh
+                return fresh
+        fresh = open_reader(db_path)
+        __readers__[db_path] = fresh
+        return fresh
+
+
+def clear_cache():
+    """Close and drop all the cached readers."""
+    with __readers_lock__:
+        for cached in __readers__.values():
+            cached.close()
+        __readers__.clear()
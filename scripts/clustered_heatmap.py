@@ -0,0 +1,88 @@
+"""Build a clustered heatmap as a background job (see `gn3.jobs`).
+
+The progress of each stage of building the heatmap is recorded in the job's
+details, and the figure's JSON is saved as the job's output. The URI of the
+database is read from the `SQL_URI` environment variable, so that it is not
+recorded with the job's command."""
+import os
+import traceback
+from uuid import UUID
+from datetime import datetime
+from typing import Optional
+from argparse import ArgumentParser
+
+from redis import Redis
+
+from gn3.db_utils import database_connection
+from gn3.heatmaps import build_heatmap
+from gn3.jobs import JOB_TTL, job_key, job_output_key, update_job
+
+def build_heatmap_job(rconn: Redis, sql_uri: Optional[str], args):
+    """Build the heatmap for the job identified by `args.job_id`, with the
+    database at `sql_uri`, recording its progress, and its output once it is
+    done. Failing to connect to the database fails the job too."""
+    def __progress__(stage: str, done: int, total: int):
+        update_job(rconn, args.job_id, {
+            "status": "running",
+            "stage": stage,
+            "progress": {"done": done, "total": total}
+        })
+
+    try:
+        if not sql_uri:
+            raise ValueError("The `SQL_URI` environment variable is not set.")
+        with database_connection(sql_uri) as conn:
+            figure = build_heatmap(
+                conn, args.traits_names, args.genotype_files,
+                vertical=args.vertical, tmpdir=args.tmpdir,
+                reaper_command=args.reaper_command, workers=args.workers,
+                progress=__progress__)
+        rconn.set(job_output_key(args.job_id), figure.to_json(), ex=args.ttl)
+        update_job(rconn, args.job_id, {
+            "status": "success", "completed": datetime.now()})
+    except Exception as _exc: # pylint: disable=[broad-except]
+        update_job(rconn, args.job_id, {
+            "status": "error", "error": traceback.format_exc()})
+    finally:
+        rconn.expire(job_key(args.job_id), args.ttl)
+
+def process_cli_arguments():
+    """Parse the command-line arguments"""
+    parser = ArgumentParser(
+        description="Build a clustered heatmap as a background job.")
+    parser.add_argument("job_id", help="The job's ID", type=UUID)
+    parser.add_argument(
+        "traits_names", nargs="+",
+        help=(
+            "The traits' fullnames, in the format <DATASET-NAME>::<TRAIT-NAME> "
+            "e.g. UCLA_BXDBXH_CARTILAGE_V2::ILM103710672"))
+    parser.add_argument(
+        "--vertical", default=False, action="store_true",
+        help="Lay the heatmap out vertically.")
+    parser.add_argument(
+        "--genotype-files", required=True,
+        help="The directory with the genotype files.")
+    parser.add_argument(
+        "--tmpdir", default="/tmp", help="Where to put the QTLReaper files.")
+    parser.add_argument(
+        "--reaper-command", default="qtlreaper",
+        help="The QTLReaper command.")
+    parser.add_argument(
+        "--workers", default=os.cpu_count(), type=int,
+        help="The maximum number of QTLReaper processes to run at a time.")
+    parser.add_argument(
+        "--redis-uri", default="redis://localhost:6379/0",
+        help="The Redis instance holding the job.")
+    parser.add_argument(
+        "--ttl", default=JOB_TTL, type=int,
+        help="Seconds for which the finished job and its output are kept.")
+    return parser.parse_args()
+
+def main():
+    """Entry point for the script"""
+    args = process_cli_arguments()
+    with Redis.from_url(args.redis_uri) as rconn:
+        build_heatmap_job(rconn, os.environ.get("SQL_URI"), args)
+
+if __name__ == "__main__":
+    main()
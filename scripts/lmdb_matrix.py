@@ -7,16 +7,25 @@ guix shell python-click python-lmdb python-wrapper python-numpy -- \
      python lmdb_matrix.py import-genotype \
      <path-to-genotype-file> <path-to-lmdb-store>
 
+guix shell python-click python-lmdb python-wrapper python-numpy -- \
+     python lmdb_matrix.py import-directory --workers 4 \
+     <path-to-genotype-directory> <path-to-lmdb-directory>
+
 guix shell python-click python-lmdb python-wrapper python-numpy -- \
      python lmdb_matrix.py print-current-matrix \
      <path-to-lmdb-store>
 
 """
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
+from itertools import islice
 from pathlib import Path
-from subprocess import check_output
+from typing import Optional, TextIO
 
+import os
 import json
+import time
+import hashlib
 import click
 import lmdb
 import numpy as np
@@ -28,209 +37,94 @@ class GenotypeMatrix:
     matrix: np.ndarray
     metadata: dict
     file_info: dict
-
-
-def count_trailing_newlines(file_path):
-    """Count trailing newlines in a file"""
-    with open(file_path, 'rb', encoding="utf-8") as stream:
-        stream.seek(0, 2)  # Move to the end of the file
-        file_size = stream.tell()
-        if file_size == 0:
-            return 0
-        chunk_size = 1024  # Read in small chunks
-        empty_lines = 0
-        _buffer = b""
-
-        # Read chunks from the end backward
-        while stream.tell() > 0:
-            # Don't read beyond start
-            chunk_size = min(chunk_size, stream.tell())
-            stream.seek(-chunk_size, 1)  # Move backward
-            chunk = stream.read(chunk_size) + _buffer
-            stream.seek(-chunk_size, 1)  # Move back to start of chunk
-            # Decode chunk to text
-            try:
-                chunk_text = chunk.decode('utf-8', errors='ignore')
-            except UnicodeDecodeError:
-                # If decoding fails, keep some bytes for the next
-                # chunk Keep last 16 bytes to avoid splitting
-                # characters
-                _buffer = chunk[-16:]
-                continue
-
-            # Split into lines from the end
-            lines = chunk_text.splitlines()
-
-            # Count empty lines from the end
-            for line in reversed(lines):
-                if line.strip() != "":
-                    return empty_lines
-                empty_lines += 1
-            if stream.tell() == 0:
-                return empty_lines
-        return empty_lines
-
-
-def wc(filename):
-    """Get total file count of a file"""
-    return int(check_output(["wc", "-l", filename]).split()[0]) - \
-        count_trailing_newlines(filename)
-
-
-def get_genotype_metadata(genotype_file: str) -> tuple[dict, dict]:
-    """Parse metadata from a genotype file, separating '@'-prefixed
-    and '#'-prefixed entries.
-
-    This function reads a genotype file and extracts two types of metadata:
-    - '@'-prefixed metadata (e.g., '@name:BXD'), stored as key-value
-      pairs for dataset attributes.
-    - '#'-prefixed metadata (e.g., '# File name: BXD_Geno...'), stored
-      as key-value pairs for file information.  Lines starting with
-      '#' without a colon are skipped as comments. Parsing stops at
-      the first non-metadata line.
-
-    Args:
-        genotype_file (str): Path to the genotype file to be parsed.
+    # The matrix followed by its transpose, as read by `gn3.genodb`; `matrix`
+    # is a view of its first half.
+    read_optimized_blob: Optional[np.ndarray] = None
+
+
+METADATA_COLUMNS = ("Chr", "Locus", "cM", "Mb")
+# Number of marker rows parsed at a time
+CHUNK_ROWS = 10_000
+READ_SIZE = 1024 * 1024
+
+
+def count_lines(genotype_file: str) -> int:
+    """Count the lines in a file, reading it in binary chunks. This is an
+    upper bound on the number of marker rows in a genotype file."""
+    with open(genotype_file, "rb") as stream:
+        return 1 + sum(chunk.count(b"\n") for chunk in iter(
+            lambda: stream.read(READ_SIZE), b""))
+
+
+class GenotypeCodes(dict):
+    """Map the genotype symbols of a file to their numeric values (0:
+    maternal, 1: paternal, 2: heterozygous, 3: unknown), as given by the
+    file's '@mat', '@pat', '@het' and '@unk' metadata. Numeric symbols map to
+    their value."""
+    def __init__(self, metadata: dict):
+        super().__init__(
+            (metadata[key], code)
+            for code, key in enumerate(("mat", "pat", "het", "unk"))
+            if metadata.get(key))
+
+    def __missing__(self, symbol: str) -> int:
+        # KLUDGE: It's not clear how to handle float types in a geno file
+        # E.g. HSNIH-Palmer_true.geno which has float values such as:
+        # 0.997.  For now, they are left as 0.
+        code = int(symbol) if symbol.isdigit() else 0
+        self[symbol] = code
+        return code
+
+
+def read_genotype_header(stream: TextIO) -> tuple[dict, dict, list[str]]:
+    """Read the metadata and the header row at the top of a genotype file,
+    leaving `stream` at the first marker row.
+
+    - '@'-prefixed metadata (e.g., '@name:BXD') are the dataset attributes.
+    - '#'-prefixed metadata (e.g., '# File name: BXD_Geno...') are the file
+      information. Lines starting with '#' without a colon are comments.
+    - The first other non-empty line is the header row (e.g., 'Chr', 'Locus',
+      'cM', 'Mb', followed by strain names like 'BXD1', 'BXD2', etc.)
 
     Returns:
-        tuple[dict, dict]: A tuple containing two dictionaries:
-            - First dict: '@'-prefixed metadata (e.g., {'name': 'BXD',
-              'type': 'riset'}).
-            - Second dict: '#'-prefixed metadata with colons (e.g.,
-              {'File name': 'BXD_Geno...', 'Citation': '...'}).
-
-    Example:
-        >>> meta, file_info = get_genotype_metadata("BXD.small.geno")
-        >>> print(meta)
-        {'name': 'BXD', 'type': 'riset', 'mat': 'B', 'pat': 'D',
-        'het': 'H', 'unk': 'U'}
-        >>> print(file_info)
-        {'File name': 'BXD_Geno-19Jan2017b_forGN.xls', 'Metadata':
-        'Please retain...'}
-
+        tuple[dict, dict, list[str]]: The '@'-prefixed metadata, the
+        '#'-prefixed metadata and the column headers.
     """
-    metadata = {}
-    file_metadata = {}
-    with open(genotype_file, "r", encoding="utf-8") as stream:
-        while True:
-            line = stream.readline().strip()
-            match line:
-                case meta if line.startswith("#"):
-                    if ":" in meta:
-                        key, value = meta[2:].split(":", 1)
-                        file_metadata[key] = value
-                case meta if line.startswith("#"):
-                    continue
-                case meta if line.startswith("@") and ":" in line:
+    metadata: dict = {}
+    file_metadata: dict = {}
+    for line in stream:
+        line = line.strip()
+        match line:
+            case "":
+                continue
+            case meta if line.startswith("#"):
+                if ":" in meta:
+                    key, value = meta[2:].split(":", 1)
+                    file_metadata[key] = value
+            case meta if line.startswith("@"):
+                if ":" in meta:
                     key, value = meta[1:].split(":", 1)
                     if value:
                         metadata[key] = value.strip()
-                case _:
-                    break
-    return metadata, file_metadata
-
-
-def get_genotype_dimensions(genotype_file: str) -> tuple[int, int]:
-    """Calculate the dimensions of the data section in a genotype
-    file.
-
-    This function determines the number of data rows and columns in a
-    genotype file.  It skips metadata lines (starting with '#' or '@')
-    and uses the first non-metadata line as the header to count
-    columns. The total number of lines is counted in binary mode to
-    efficiently handle large files, and the number of data rows is
-    calculated by subtracting metadata and header lines. Accounts for
-    a potential trailing newline.
-
-    Args:
-        genotype_file (str): Path to the genotype file to be analyzed.
-
-    Returns:
-        tuple[int, int]: A tuple containing:
-            - First int: Number of data rows (excluding metadata and
-              header).
-            - Second int: Number of columns (based on the header row).
-
-    Example:
-        >>> rows, cols = get_genotype_dimensions("BXD.small.geno")
-        >>> print(rows, cols)
-        2, 202  # Example: 2 data rows, 202 columns (from header)
-
-    Note:
-        Assumes the first non-metadata line is the header row, split
-        by whitespace.  A trailing newline may be included in the line
-        count but is accounted for in the returned row count.
-
-    """
-    counter = 0
-    rows = []
-
-    with open(genotype_file, "r", encoding="utf-8") as stream:
-        while True:
-            line = stream.readline()
-            counter += 1
-            match line:
-                case "" | _ if line.startswith(("#", "@", "\n")):
-                    continue
-                case _:
-                    rows = line.split()
-                    break
-    return wc(genotype_file) - counter, len(rows)
-
-
-def read_genotype_headers(genotype_file: str) -> list[str]:
-    """Extract the header row from a genotype file.
-
-    This function reads a genotype file and returns the first
-    non-metadata line as a list of column headers. It skips lines
-    starting with '#' (comments), '@' (metadata), or empty lines,
-    assuming the first non-skipped line contains the header (e.g.,
-    'Chr', 'Locus', 'cM', 'Mb', followed by strain names like 'BXD1',
-    'BXD2', etc.). The header is split by whitespace to create the
-    list of column names.
-
-    Args:
-        genotype_file (str): Path to the genotype file to be parsed.
-
-    Returns:
-        list[str]: A list of column headers from the first non-metadata line.
-
-    Example:
-        >>> headers = read_genotype_headers("BXD.small.geno")
-        >>> print(headers)
-        ['Chr', 'Locus', 'cM', 'Mb', 'BXD1', 'BXD2', ..., 'BXD220']
-    """
-    rows = []
-    with open(genotype_file, "r", encoding="utf-8") as stream:
-        while True:
-            line = stream.readline()
-            match line:
-                case _ if line.startswith("#") or line.startswith("@") or line == "":
-                    continue
-                case _:
-                    rows = line.split()
-                    break
-    return rows
+            case _:
+                return metadata, file_metadata, line.split()
+    raise ValueError(f"No header row found in '{stream.name}'")
 
 
 # pylint: disable=too-many-locals
 def read_genotype_file(genotype_file: str) -> GenotypeMatrix:
     """Read a genotype file and construct a GenotypeMatrix object.
 
-    This function parses a genotype file to extract metadata and
-    genotype data, creating a numerical matrix of genotype values and
-    associated metadata. It processes:
-    - '@'-prefixed metadata (e.g., '@mat:B') for dataset attributes
-      like maternal/paternal alleles.
-    - '#'-prefixed metadata (e.g., '# File name:...') for file
-      information.
-    - Header row for column names (e.g., 'Chr', 'Locus', BXD strains).
-    - Data rows, converting genotype symbols (e.g., 'B', 'D', 'H',
-    'U') to numeric values (0, 1, 2, 3) based on metadata mappings.
-
-    The function skips comment lines ('#'), metadata lines ('@'), and
-    empty lines, and organizes the data into a GenotypeMatrix with a
-    numpy array and metadata dictionaries.
+    The file is read twice: a quick pass over its raw bytes counts its lines
+    (see `count_lines`) to size the buffer, then the marker rows are parsed in
+    chunks of `CHUNK_ROWS`, and their genotype symbols converted (see
+    `GenotypeCodes`) straight into that preallocated uint8 buffer, which has
+    room for both the matrix and its transpose, i.e. the read-optimized blob
+    of `gn3.genodb`. The leading 'Chr', 'Locus', 'cM' and 'Mb' columns are kept
+    as lists in the metadata.
+
+    Marker rows whose number of values does not match the header, e.g. some
+    chromosome rows that start with a '#' (B6D2F2_mm8), are skipped.
 
  Args:
     genotype_file (str): Path to the genotype file to be parsed.
@@ -244,10 +138,7 @@ def read_genotype_file(genotype_file: str) -> GenotypeMatrix:
     'Locus'), and lists of metadata values per row.
     - file_info: A dictionary with '#'-prefixed metadata (e.g., 'File
       name', 'Citation').
-
- Raises:
-    ValueError: If an unrecognized genotype symbol is encountered in
-    the data.
+    - read_optimized_blob: The matrix followed by its transpose.
 
  Example:
     >>> geno_matrix = read_genotype_file("BXD.small.geno")
@@ -258,87 +149,46 @@ def read_genotype_file(genotype_file: str) -> GenotypeMatrix:
     >>> print(geno_matrix.file_info["File name"])
     'BXD_Geno-19Jan2017b_forGN.xls'
     """
-    header = read_genotype_headers(genotype_file)
-
-    counter = 0
-    for i, el in enumerate(header):
-        if el not in ["Chr", "Locus", "cM", "Mb"]:
-            break
-        counter = i
-
-    metadata_columns, individuals = header[:counter], header[counter:]
-    nrows, ncols = get_genotype_dimensions(genotype_file)
-    ncols -= len(metadata_columns)
-    matrix = np.zeros((nrows, ncols), dtype=np.uint8)
-
-    metadata, file_metadata = get_genotype_metadata(genotype_file)
-    metadata = metadata | {
-        "nrows": nrows,
-        "ncols": ncols,
-        "individuals": individuals,
-        "metadata_columns": metadata_columns
-    }
-    for key in metadata_columns:
-        metadata[key] = []
-
-    maternal = metadata.get("mat")
-    paternal = metadata.get("pat")
-    heterozygous = metadata.get("het")
-    unknown = metadata.get("unk")
-    i = 0
-    sentinel = True
+    max_rows = count_lines(genotype_file)
     with open(genotype_file, "r", encoding="utf-8") as stream:
-        while True:
-            if i == nrows:
-                break
-            line = stream.readline().split()
-            meta, data = [], []
-            if line and line[0] in metadata_columns:
-                # Skip the metadata column
-                line = stream.readline().split()
-                sentinel = False
-            if len(line) == 0 or (line[0].startswith("#") and sentinel) \
-               or line[0].startswith("@"):
-                continue
-            meta, data = line[:len(metadata_columns)
-                              ], line[len(metadata_columns):]
-            # KLUDGE: It's not clear whether chromosome rows that
-            # start with a '#' should be a comment or not.  For some
-            # there's a mismatch between (E.g. B6D2F2_mm8) the size of
-            # the data values and ncols.  For now, skip them.
-            if len(data) != ncols:
-                i += 1
-                continue
-            for j, el in enumerate(data):
-                match el:
-                    case _ if el.isdigit():
-                        matrix[i, j] = int(el)
-                    case _ if maternal == el:
-                        matrix[i, j] = 0
-                    case _ if paternal == el:
-                        matrix[i, j] = 1
-                    case _ if heterozygous == el:
-                        matrix[i, j] = 2
-                    case _ if unknown == el:
-                        matrix[i, j] = 3
-                    case _:
-                        # KLUDGE: It's not clear how to handle float
-                        # types in a geno file
-                        # E.g. HSNIH-Palmer_true.geno which has float
-                        # values such as:  0.997.  Ideally maybe:
-                        # raise ValueError
-                        continue
-            i += 1
-            __map = dict(zip(metadata_columns, meta))
-            for key in metadata_columns:
-                metadata[key].append(__map.get(key))
-
-    genotype_matrix = GenotypeMatrix(
+        metadata, file_metadata, header = read_genotype_header(stream)
+        nmeta = 0
+        while nmeta < len(header) and header[nmeta] in METADATA_COLUMNS:
+            nmeta += 1
+        metadata_columns, individuals = header[:nmeta], header[nmeta:]
+        ncols = len(individuals)
+        codes = GenotypeCodes(metadata)
+        blob = np.empty(2 * max_rows * ncols, dtype=np.uint8)
+        # Rows are filled from the start of the buffer, so that the first
+        # `nrows` of them are the row-major matrix, whatever `nrows` ends up
+        # being.
+        buffer = blob[:max_rows * ncols].reshape(max_rows, ncols)
+        meta_values: list[list[str]] = [[] for _ in metadata_columns]
+        nrows = 0
+        for chunk in iter(lambda: list(islice(stream, CHUNK_ROWS)), []):
+            rows = [row for row in (line.split() for line in chunk)
+                    if len(row) == len(header)]
+            tokens = [token for row in rows for token in row[nmeta:]]
+            buffer[nrows:nrows + len(rows)] = np.fromiter(
+                map(codes.__getitem__, tokens), dtype=np.uint8,
+                count=len(tokens)).reshape(len(rows), ncols)
+            for values, column in zip(
+                    meta_values, zip(*(row[:nmeta] for row in rows))):
+                values.extend(column)
+            nrows += len(rows)
+
+    matrix = blob[:nrows * ncols].reshape(nrows, ncols)
+    blob[nrows * ncols:2 * nrows * ncols].reshape(ncols, nrows)[:] = matrix.T
+    return GenotypeMatrix(
         matrix=matrix,
-        metadata=metadata,
-        file_info=file_metadata
-    )
-    return genotype_matrix
+        metadata=metadata | {
+            "nrows": nrows,
+            "ncols": ncols,
+            "individuals": individuals,
+            "metadata_columns": metadata_columns
+        } | dict(zip(metadata_columns, meta_values)),
+        file_info=file_metadata,
+        read_optimized_blob=blob[:2 * nrows * ncols])
 
 
 def create_database(db_path: str) -> lmdb.Environment:
@@ -347,14 +197,35 @@ def create_database(db_path: str) -> lmdb.Environment:
 
 
 def genotype_db_put(db: lmdb.Environment, genotype: GenotypeMatrix) -> bool:
-    """Put genotype GENOTYPEMATRIX from DB environment"""
+    """Put genotype GENOTYPEMATRIX into DB environment.
+
+    Besides the plain `matrix`, the matrix is stored as a new version in the
+    layout read by `gn3.genodb`: the read-optimized blob (the matrix followed
+    by its transpose) keyed by its SHA256 hash, which `current` points to,
+    with the dimensions keyed by the hash of the matrix, which is prepended to
+    `versions`."""
+    matrix = np.ascontiguousarray(genotype.matrix)
+    nrows, ncols = matrix.shape
+    blob = genotype.read_optimized_blob
+    if blob is None:
+        blob = np.concatenate((matrix.ravel(), matrix.T.ravel()))
+    matrix_hash = hashlib.sha256(matrix.data).digest()
+    blob_hash = hashlib.sha256(blob.data).digest()
     metadata = json.dumps(genotype.metadata).encode("utf-8")
     file_info = json.dumps(genotype.file_info).encode("utf-8")
     with db.begin(write=True) as txn:
-        txn.put(b"matrix", genotype.matrix.tobytes())
+        txn.put(b"matrix", matrix.data)
         txn.put(b"metadata", metadata)
         # XXXX: KLUDGE: Put this in RDF instead
         txn.put(b"file_info", file_info)
+        txn.put(blob_hash, blob.data)
+        txn.put(matrix_hash + b":nrows", nrows.to_bytes(8, "little"))
+        txn.put(matrix_hash + b":ncols", ncols.to_bytes(8, "little"))
+        txn.put(matrix_hash + b":read-optimized-blob", blob_hash)
+        versions = txn.get(b"versions", b"")
+        if not versions.startswith(matrix_hash):
+            txn.put(b"versions", matrix_hash + versions)
+        txn.put(b"current", blob_hash)
     return True
 
 
@@ -381,26 +252,64 @@ def get_genotype_files(directory: str) -> list[tuple[str, int]]:
     return sorted(geno_files, key=lambda x: x[1])
 
 
-def __import_directory(directory: str, lmdb_path: str):
+def import_genotype_file(genotype_file: str, lmdb_store: str) -> dict:
+    """Import a genotype file into the LMDB store at `lmdb_store`, and return
+    the size of the import and the time it took."""
+    start = time.perf_counter()
+    genotype = read_genotype_file(genotype_file)
+    with create_database(lmdb_store) as db:
+        genotype_db_put(db=db, genotype=genotype)
+    return {
+        "file": genotype_file,
+        "rows": genotype.matrix.shape[0],
+        "bytes": os.stat(genotype_file).st_size,
+        "seconds": time.perf_counter() - start
+    }
+
+
+def throughput(stats: dict) -> str:
+    """Describe the throughput of an import, from its statistics."""
+    seconds = max(stats["seconds"], 1e-9)
+    size_mb = stats["bytes"] / (1024 ** 2)
+    return (f"{stats['rows']} rows, {size_mb:.2f} MB in {seconds:.2f}s "
+            f"({stats['rows'] / seconds:.0f} rows/s, "
+            f"{size_mb / seconds:.2f} MB/s)")
+
+
+def __import_directory(directory: str, lmdb_path: str, workers: int = 1):
     """Import all the genotype files from a given directory into
-    LMDB."""
-    for file_, file_size in get_genotype_files(directory):
-        genofile = Path(file_)
-        size_mb = file_size / (1024 ** 2)
-        lmdb_store = (Path(lmdb_path) / genofile.stem).as_posix()
-        print(f"Processing file: {genofile.name}")
-        with create_database(lmdb_store) as db:
-            genotype_db_put(
-                db=db, genotype=read_genotype_file(genofile.as_posix()))
-        print(f"\nSuccessfuly created: [{size_mb:.2f} MB] {genofile.stem}")
+    LMDB, with up to `workers` files imported in parallel."""
+    # Start with the largest files, so that they do not hold up the end of
+    # the import.
+    geno_files = sorted(
+        get_genotype_files(directory), key=lambda x: x[1], reverse=True)
+    Path(lmdb_path).mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    totals = {"rows": 0, "bytes": 0}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                import_genotype_file, file_,
+                (Path(lmdb_path) / Path(file_).stem).as_posix())
+            for file_, _file_size in geno_files]
+        for future in as_completed(futures):
+            stats = future.result()
+            totals = {key: total + stats[key] for key, total in totals.items()}
+            print(f"Successfuly created: {Path(stats['file']).stem} "
+                  f"[{throughput(stats)}]")
+    print(f"\nImported {len(geno_files)} files: " + throughput(
+        totals | {"seconds": time.perf_counter() - start}))
 
 
 @click.command(help="Import the genotype directory")
 @click.argument("genotype_directory")
 @click.argument("lmdb_path")
-def import_directory(genotype_directory: str, lmdb_path: str):
+@click.option("--workers", type=int, default=1, show_default=True,
+              help="Number of files to import in parallel")
+def import_directory(genotype_directory: str, lmdb_path: str, workers: int):
     "Import a genotype directory into genotype_database path"
-    __import_directory(directory=genotype_directory, lmdb_path=lmdb_path)
+    __import_directory(
+        directory=genotype_directory, lmdb_path=lmdb_path, workers=workers)
 
 
 @click.command(help="Import the genotype file")
@@ -408,8 +317,7 @@ def import_directory(genotype_directory: str, lmdb_path: str):
 @click.argument("genotype_database")
 def import_genotype(geno_file: str, genotype_database: str):
     "Import a genotype file into genotype_database path"
-    with create_database(genotype_database) as db:
-        genotype_db_put(db=db, genotype=read_genotype_file(geno_file))
+    print(throughput(import_genotype_file(geno_file, genotype_database)))
 
 
 @click.command(help="Print the current matrix")
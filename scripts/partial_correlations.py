@@ -5,6 +5,7 @@ from pathlib import Path
 from argparse import ArgumentParser
 
 from gn3.db_utils import database_connection
+from gn3.correlation_cache import DEFAULT_REDIS_URI
 from gn3.responses.pcorrs_responses import OutputEncoder
 from gn3.computations.partial_correlations import (
     partial_correlations_with_target_db,
@@ -49,7 +50,8 @@ def pcorrs_against_traits(dbconn, args):
 def pcorrs_against_db(dbconn, args):
     """Run partial correlations agaist the entire dataset provided."""
     return partial_correlations_with_target_db(
-        dbconn, **process_db_args(args), textdir=args.textdir)
+        dbconn, **process_db_args(args), textdir=args.textdir,
+        matrices_dir=args.matrices_dir, redis_uri=args.redis_uri)
 
 def run_pcorrs(dbconn, args):
     """Run the selected partial correlations function."""
@@ -95,6 +97,20 @@ def against_db_parser(parent_parser):
         help="Directory to read text files from",
         type=Path,
         default=Path("/tmp/"))
+    parser.add_argument(
+        "--matrices-dir",
+        help=(
+            "Directory with the datasets' precomputed matrices (see "
+            "`gn3.dataset_matrices`). If empty, the matrices are not used."),
+        type=str,
+        default="")
+    parser.add_argument(
+        "--redis-uri",
+        help=(
+            "The Redis instance holding the correlation cache's generation, "
+            "which the matrices' versions depend on."),
+        type=str,
+        default=DEFAULT_REDIS_URI)
     parser.set_defaults(func=pcorrs_against_db)
     return parent_parser
 
@@ -31,6 +31,9 @@ if __name__ == "__main__":
             "destfile", type=str,
             help=("Path to file with pickled results of computing the "
                   "correlations."))
+        parser.add_argument(
+            "--top-n", type=int, default=None,
+            help="Only keep this many of the strongest correlations.")
         args = parser.parse_args()
         return args
 
@@ -42,7 +45,8 @@ if __name__ == "__main__":
                 corrs = compute_all_sample_correlation(
                     corr_method=args.corrmethod,
                     this_trait=pickle.load(traitfile),
-                    target_dataset=pickle.load(targetdataset))
+                    target_dataset=pickle.load(targetdataset),
+                    top_n=args.top_n)
 
         with open(args.destfile, "wb") as dest:
             pickle.dump(corrs, dest)
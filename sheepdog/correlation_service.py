@@ -0,0 +1,224 @@
+"""Long-running service that computes sample correlations.
+
+The service listens on a local (unix) socket for requests from the web
+application, and computes the correlations in a pool of worker processes that
+is started, with the heavy imports (scipy, pingouin, …) already done, when the
+service starts. This avoids paying for the start-up of a new python
+interpreter, and of a new process pool, on every request, while still keeping
+the computations out of the web application's processes.
+
+A bounded number of requests are admitted at any one time: requests that
+cannot be admitted within `--admission-timeout` seconds get a 'busy'
+response.
+
+Connections are authenticated with the `SAMPLE_CORRELATIONS_AUTHKEY` setting,
+which is read from the same settings as the web application's (see
+`configured_authkey`), so that both use the same key."""
+import os
+import sys
+import json
+import signal
+import logging
+import argparse
+import threading
+from typing import Optional
+from multiprocessing import cpu_count
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import Config
+
+# Enable importing from one dir up: put as first to override any other globally
+# accessible GN3
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+logging.basicConfig(
+    format=("%(asctime)s — %(filename)s:%(lineno)s — %(levelname)s: "
+            "CorrelationService: %(message)s"))
+logger = logging.getLogger(__name__)
+
+
+def warm_up_worker():
+    """Do the expensive imports once, when each worker process starts."""
+    # pylint: disable=[import-outside-toplevel, unused-import]
+    import gn3.computations.correlations
+
+
+def compute_sample_correlations(request: dict) -> list:
+    """Compute the sample correlations described by `request` -- runs in the
+    worker processes."""
+    # pylint: disable=[import-outside-toplevel]
+    from gn3.computations.correlations import compute_all_sample_correlation
+    return compute_all_sample_correlation(
+        this_trait=request["this_trait"],
+        target_dataset=request["target_dataset"],
+        corr_method=request["method"],
+        top_n=request.get("top_n"))
+
+
+class CorrelationService:
+    """Run the correlation requests in a pre-started pool of processes,
+    admitting at most `max_pending` requests at a time."""
+
+    def __init__(
+            self, workers: int, max_pending: int,
+            admission_timeout: float = 30):
+        self.workers = workers
+        self.admission_timeout = admission_timeout
+        self.admission = threading.BoundedSemaphore(max_pending)
+        self.pool_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.pool = self.__new_pool__()
+
+    def __new_pool__(self) -> ProcessPoolExecutor:
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=warm_up_worker)
+        # Start all the workers now, rather than on the first request.
+        for future in [pool.submit(warm_up_worker)
+                       for _ in range(self.workers)]:
+            future.result()
+        return pool
+
+    def __restart_pool__(self, broken: ProcessPoolExecutor):
+        with self.pool_lock:
+            if self.pool is broken:
+                logger.warning("A worker process died: restarting the pool.")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self.pool = self.__new_pool__()
+
+    def compute(self, request: dict) -> dict:
+        """Compute the correlations for `request`, returning a response."""
+        if not self.admission.acquire(# pylint: disable=[consider-using-with]
+                timeout=self.admission_timeout):
+            return {
+                "status": "busy",
+                "message": ("The correlation service is busy. Please try "
+                            "again later.")}
+        try:
+            pool = self.pool
+            try:
+                return {
+                    "status": "success",
+                    "results": pool.submit(
+                        compute_sample_correlations, request).result()
+                }
+            except BrokenProcessPool as exc:
+                self.__restart_pool__(pool)
+                return {"status": "error", "message": repr(exc)}
+            except Exception as exc:# pylint: disable=[broad-exception-caught]
+                logger.error("Failed to compute correlations.", exc_info=True)
+                return {"status": "error", "message": repr(exc)}
+        finally:
+            self.admission.release()
+
+    def handle_connection(self, conn):
+        """Process the request(s) from a single client connection."""
+        with conn:
+            try:
+                while True:
+                    conn.send(self.compute(conn.recv()))
+            except EOFError:
+                pass# the client closed the connection
+
+    def serve(self, listener: Listener):
+        """Accept client connections until `stop` is called."""
+        while not self.stopping.is_set():
+            try:
+                conn = listener.accept()
+            except AuthenticationError:
+                logger.warning("Rejected a client that failed to authenticate.")
+                continue
+            if self.stopping.is_set():
+                conn.close()
+                break
+            threading.Thread(
+                target=self.handle_connection, args=(conn,),
+                daemon=True).start()
+
+    def stop(self, listener: Listener, authkey: Optional[bytes] = None):
+        """Stop `serve`-ing: it is woken up with a last connection, since a
+        blocked `accept` is not interrupted by closing the listener."""
+        self.stopping.set()
+        Client(listener.address, family="AF_UNIX", authkey=authkey).close()
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def configured_authkey() -> Optional[bytes]:
+    """The `SAMPLE_CORRELATIONS_AUTHKEY` setting, loaded as `gn3.app.create_app`
+    loads the settings: the defaults, then the `GN3_CONF` file, then the
+    `GN3_SECRETS` file."""
+    config = Config(os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "..", "gn3")))
+    config.from_file("settings.json", load=json.load)
+    if "GN3_CONF" in os.environ:
+        config.from_envvar("GN3_CONF")
+    secrets_file = os.environ.get("GN3_SECRETS")
+    if secrets_file and os.path.exists(secrets_file):
+        config.from_envvar("GN3_SECRETS")
+    authkey = config.get("SAMPLE_CORRELATIONS_AUTHKEY")
+    return authkey.encode("utf-8") if authkey else None
+
+
+def parse_cli_arguments():
+    """Parse the command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Run the sample correlations service.")
+    parser.add_argument(
+        "socket", type=str,
+        help=("Path to the unix socket to listen on. This is the value of the "
+              "`SAMPLE_CORRELATIONS_SOCKET` setting in GN3."))
+    parser.add_argument(
+        "--workers", type=int, default=max(1, cpu_count() - 1),
+        help="Number of worker processes computing correlations.")
+    parser.add_argument(
+        "--max-pending", type=int, default=None,
+        help=("Maximum number of requests admitted at any one time. Defaults "
+              "to twice the number of workers."))
+    parser.add_argument(
+        "--admission-timeout", type=float, default=30,
+        help=("Seconds a request waits to be admitted before getting a "
+              "'busy' response."))
+    parser.add_argument(
+        "--log-level", default="info", type=str,
+        choices=("debug", "info", "warning", "error", "critical"),
+        help="What level to output the logs at.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    def main():
+        """Entry-point: run the service until interrupted."""
+        args = parse_cli_arguments()
+        logger.setLevel(args.log_level.upper())
+        service = CorrelationService(
+            args.workers, args.max_pending or 2 * args.workers,
+            args.admission_timeout)
+        authkey_bytes = configured_authkey()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        terminate = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_args: terminate.set())
+        with Listener(args.socket, family="AF_UNIX",
+                      authkey=authkey_bytes) as listener:
+            os.chmod(args.socket, 0o660)
+            server = threading.Thread(target=service.serve, args=(listener,))
+            server.start()
+            logger.info("Listening on '%s' with %s workers.",
+                        args.socket, args.workers)
+            try:
+                while not terminate.wait(timeout=1):
+                    pass
+            except KeyboardInterrupt:
+                pass
+            service.stop(listener, authkey_bytes)
+            server.join()
+        service.shutdown()
+        logger.info("Correlation service exiting …")
+        return 0
+
+    sys.exit(main())
@@ -1,14 +1,30 @@
-"""Daemon that processes commands"""
+"""Daemon that processes commands
+
+In the default 'one-shot' mode, the worker runs the commands on the queue until
+there is none that it can run, then exits. In daemon mode, it runs a pool of
+workers (see `WorkerPool`) that keeps taking commands off the queue until it is
+sent a SIGTERM."""
 import os
 import sys
-import time
+import json
+import shlex
+import signal
+import socket
 import logging
 import argparse
+import threading
+import traceback
+from uuid import uuid4
+from typing import Optional
+from dataclasses import replace
 
 import redis
 import redis.connection
 
 from gn3.loggers import setup_modules_logging
+from gn3.job_queue import (
+    JOB_CLASSES, ONE_SHOT_PREFIX, JobClass, dequeue, requeue, complete,
+    wakeup_key, workers_key, heartbeat_key, in_flight_key, settle_fingerprint)
 
 # Enable importing from one dir up: put as first to override any other globally
 # accessible GN3
@@ -25,48 +41,188 @@ def update_status(conn, cmd_id, status):
     conn.hset(name=f"{cmd_id}", key="status", value=f"{status}")
 
 
-def make_incremental_backoff(init_val: float = 0.1, maximum: int = 420):
-    """
-    Returns a closure that can be used to increment the returned value up to
-    `maximum` or reset it to `init_val`.
-    """
-    current = init_val
+def run_job(conn, queue_name: str, cmd_id: str):
+    """Run the command identified by `cmd_id`, if it is still queued, recording
+    its status and results."""
+    # pylint: disable=E0401, C0415
+    from gn3.commands import run_cmd
+    from gn3.computations.streaming import run_process, mark_done
+    cmd = conn.hget(name=cmd_id, key="cmd")
+    if cmd and (conn.hget(cmd_id, "status") == b"queued"):
+        logger.debug("Updating status for job '%s' to 'running'", cmd_id)
+        update_status(conn, cmd_id, "running")
+        env = conn.hget(name=cmd_id, key="env")
+        log_file = conn.hget(name=cmd_id, key="log_file")
+        if log_file:
+            # Stream the output, which is both stdout and stderr
+            log_file = log_file.decode("utf-8")
+            parsed_cmd = json.loads(cmd)
+            try:
+                process = run_process(
+                    shlex.split(parsed_cmd) if isinstance(parsed_cmd, str)
+                    else parsed_cmd,
+                    log_file, cmd_id,
+                    env=json.loads(env) if env else None)
+            finally:
+                # End the log's events even if the command could not be run
+                mark_done(log_file)
+            result = {"code": process["code"], "output": process["log"]}
+        else:
+            result = run_cmd(cmd.decode("utf-8"), env=env)
+        conn.hset(name=cmd_id, key="result", value=result.get("output"))
+        if result.get("code") == 0:  # Success
+            update_status(conn, cmd_id, "success")
+        else:
+            update_status(conn, cmd_id, "error")
+            conn.hset(cmd_id, "stderr", result.get("output"))
+        settle_fingerprint(
+            conn, queue_name, cmd_id, success=result.get("code") == 0)
 
-    def __increment_or_reset__(command: str, value: float = 0.1):
-        nonlocal current
-        if command == "reset":
-            current = init_val
-            return current
 
-        if command == "increment":
-            current = min(current + abs(value), maximum)
-            return current
+class WorkerPool:# pylint: disable=[too-many-instance-attributes]
+    """Run the commands on a queue in `slots` concurrent threads, until `stop`
+    is called or, if `until_idle`, until there is no command that can be run.
 
-        return current
+    Each slot takes the next command off the queue (see `gn3.job_queue`),
+    which moves the command's id onto this worker's in-flight list in the same
+    step, and takes it off once the command completes. Idle slots block until a
+    command is queued, or another completes. The worker keeps a heartbeat key
+    alive while it runs: the commands left in-flight by a worker whose heartbeat
+    has expired (e.g. it was killed) are put back at the head of their queue by
+    the other workers, or by the next worker to start. Once stopped, the worker
+    takes no new commands, but waits for those it is running to complete."""
 
-    return __increment_or_reset__
+    def __init__(# pylint: disable=[too-many-arguments, too-many-positional-arguments]
+            self, conn, queue_name: str, slots: int,
+            heartbeat_interval: float = 10, dequeue_timeout: float = 5,
+            classes: Optional[dict[str, JobClass]] = None,
+            until_idle: bool = False):
+        self.conn = conn
+        self.queue_name = queue_name
+        self.slots = slots
+        self.heartbeat_interval = heartbeat_interval
+        self.dequeue_timeout = dequeue_timeout
+        self.classes = classes or JOB_CLASSES
+        self.until_idle = until_idle
+        self.worker_id = (
+            f"{ONE_SHOT_PREFIX if until_idle else ''}"
+            f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex}")
+        self.heartbeat = heartbeat_key(queue_name, self.worker_id)
+        self.in_flight = in_flight_key(queue_name, self.worker_id)
+        self.stopping = threading.Event()
 
+    def beat(self):
+        """Register this worker, and renew its heartbeat."""
+        self.conn.set(
+            self.heartbeat, "alive",
+            px=int(3 * self.heartbeat_interval * 1000))
+        self.conn.sadd(workers_key(self.queue_name), self.worker_id)
 
-def run_jobs(conn, queue_name):
-    """Process the redis using a redis connection, CONN"""
-    # pylint: disable=E0401, C0415
-    from gn3.commands import run_cmd
-    cmd_id = (conn.lpop(queue_name) or b'').decode("utf-8")
-    if bool(cmd_id):
-        cmd = conn.hget(name=cmd_id, key="cmd")
-        if cmd and (conn.hget(cmd_id, "status") == b"queued"):
-            logger.debug("Updating status for job '%s' to 'running'", cmd_id)
-            update_status(conn, cmd_id, "running")
-            result = run_cmd(
-                cmd.decode("utf-8"), env=conn.hget(name=cmd_id, key="env"))
-            conn.hset(name=cmd_id, key="result", value=result.get("output"))
-            if result.get("code") == 0:  # Success
-                update_status(conn, cmd_id, "success")
-            else:
-                update_status(conn, cmd_id, "error")
-                conn.hset(cmd_id, "stderr", result.get("output"))
-        return cmd_id
-    return None
+    def unregister(self):
+        """Remove this worker from the workers serving the queue."""
+        self.conn.srem(workers_key(self.queue_name), self.worker_id)
+        self.conn.delete(self.heartbeat)
+
+    def recover(self) -> list[str]:
+        """Put the commands left in-flight by dead workers back at the head of
+        their queue, returning their ids."""
+        recovered = []
+        for worker in self.conn.smembers(workers_key(self.queue_name)):
+            worker = worker.decode("utf-8")
+            if worker == self.worker_id or self.conn.exists(
+                    heartbeat_key(self.queue_name, worker)):
+                continue
+            in_flight = in_flight_key(self.queue_name, worker)
+            for cmd_id in self.conn.lrange(in_flight, 0, -1):
+                cmd_id = cmd_id.decode("utf-8")
+                if requeue(self.conn, self.queue_name, in_flight, cmd_id):
+                    logger.warning(
+                        "Re-queued '%s', left running by dead worker '%s'.",
+                        cmd_id, worker)
+                    recovered.append(cmd_id)
+            self.conn.srem(workers_key(self.queue_name), worker)
+        return recovered
+
+    def run_dequeued(self, cmd_id: str, job_class: str):
+        """Run the command identified by `cmd_id`, which this worker took off
+        the queue, then free its slot."""
+        try:
+            run_job(self.conn, self.queue_name, cmd_id)
+        except Exception as _exc:# pylint: disable=[broad-except]
+            logger.error("Failed to run '%s'.", cmd_id, exc_info=True)
+            update_status(self.conn, cmd_id, "error")
+            self.conn.hset(cmd_id, "result", traceback.format_exc())
+            self.conn.hset(cmd_id, "stderr", traceback.format_exc())
+            settle_fingerprint(self.conn, self.queue_name, cmd_id, False)
+        finally:
+            complete(self.conn, self.queue_name, self.in_flight, cmd_id,
+                     job_class)
+
+    def run_slot(self):
+        """Run commands off the queue, one at a time, until stopped."""
+        while not self.stopping.is_set():
+            dequeued = dequeue(
+                self.conn, self.queue_name, self.in_flight, self.classes)
+            if dequeued is None:
+                if self.until_idle:
+                    break
+                self.conn.blpop(
+                    [wakeup_key(self.queue_name)], timeout=self.dequeue_timeout)
+                continue
+            if self.stopping.is_set():# Leave it to the next worker
+                requeue(self.conn, self.queue_name, self.in_flight, dequeued[0])
+                break
+            self.run_dequeued(*dequeued)
+
+    def run(self):
+        """Run the slots, renewing the heartbeat and recovering the commands of
+        dead workers, until the slots stop."""
+        while True:
+            self.beat()
+            self.recover()
+            threads = [
+                threading.Thread(target=self.run_slot, name=f"slot-{slot}")
+                for slot in range(self.slots)]
+            for thread in threads:
+                thread.start()
+            logger.info("Worker '%s' running %s slot(s) on '%s'.",
+                        self.worker_id, self.slots, self.queue_name)
+            while any(thread.is_alive() for thread in threads):
+                next(thread for thread in threads if thread.is_alive()).join(
+                    timeout=self.heartbeat_interval)
+                self.beat()
+                if not self.stopping.is_set():
+                    self.recover()
+            self.unregister()
+            if self.stopping.is_set() or not self.until_idle:
+                break
+            # A command queued as the worker went idle could have been left to
+            # this worker: check once more, now that it is no longer
+            # registered, and new commands start a new worker.
+            dequeued = dequeue(
+                self.conn, self.queue_name, self.in_flight, self.classes)
+            if dequeued is None:
+                break
+            self.beat()
+            self.run_dequeued(*dequeued)
+        self.conn.delete(self.in_flight)
+
+    def stop(self):
+        """Stop taking new commands off the queue, and wait for the running
+        commands to complete."""
+        logger.info("Draining: waiting for the running commands to complete.")
+        self.stopping.set()
+
+
+def max_running(value: str) -> JobClass:
+    """Parse a 'CLASS=N' argument, setting the maximum number of running
+    commands of the job class CLASS."""
+    name, _sep, limit = value.partition("=")
+    if name not in JOB_CLASSES or not limit.isdigit():
+        raise argparse.ArgumentTypeError(
+            f"Expected 'CLASS=N', with CLASS one of "
+            f"{', '.join(JOB_CLASSES)}; got '{value}'.")
+    return replace(JOB_CLASSES[name], max_running=int(limit))
 
 
 def parse_cli_arguments():
@@ -76,11 +232,24 @@ def parse_cli_arguments():
     parser.add_argument(
         "--daemon", default=False, action="store_true",
         help=(
-            "Run process as a daemon instead of the default 'one-shot' "
-            "process"))
+            "Run process as a daemon, with a pool of `--workers` slots, "
+            "instead of the default 'one-shot' process"))
     parser.add_argument(
         "--queue-name", default="GN3::job-queue", type=str,
         help="The redis list that holds the unique command ids")
+    parser.add_argument(
+        "--workers", default=1, type=int,
+        help="The number of commands the daemon runs at a time.")
+    parser.add_argument(
+        "--heartbeat-interval", default=10, type=float,
+        help=("Seconds between the daemon's heartbeats. The commands of a "
+              "daemon that misses three heartbeats are re-queued."))
+    parser.add_argument(
+        "--max-running", default=[], action="append", metavar="CLASS=N",
+        type=max_running,
+        help=("The maximum number of commands of the job class CLASS that run "
+              "at a time, e.g. 'partial-correlations-against-db=2'. Can be "
+              "repeated."))
     parser.add_argument(
         "--log-level", default="info", type=str,
         choices=("debug", "info", "warning", "error", "critical"),
@@ -96,19 +265,18 @@ if __name__ == "__main__":
         logging.getLevelName(logger.getEffectiveLevel()),
         ("gn3.commands",))
     with redis.Redis() as redis_conn:
+        pool = WorkerPool(
+            redis_conn, args.queue_name, args.workers if args.daemon else 1,
+            args.heartbeat_interval, classes={
+                **JOB_CLASSES,
+                **{job_class.name: job_class for job_class in args.max_running}
+            }, until_idle=not args.daemon)
         if not args.daemon:
             logger.info("Worker Script: Running worker in one-shot mode.")
-            run_jobs(redis_conn, args.queue_name)
-            logger.debug("Job completed!")
         else:
             logger.debug("Worker Script: Running worker in daemon-mode.")
-            sleep_time = make_incremental_backoff()
-            while True:  # Daemon that keeps running forever:
-                if run_jobs(redis_conn, args.queue_name):
-                    logger.debug("Ran a job. Pausing for a while...")
-                    time.sleep(sleep_time("reset"))
-                    continue
-                time.sleep(sleep_time(
-                    "increment", sleep_time("return_current")))
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_args: pool.stop())
+        pool.run()
 
     logger.info("Worker exiting …")
@@ -0,0 +1,90 @@
+"""module contains performance tests for the slink clustering
+
+Compares `gn3.computations.slink.slink` with the original genenetwork1
+algorithm, on random distance matrices of increasing size, e.g.
+
+    python -m tests.performance.perf_slink perf_slink_20_traits
+"""
+
+import sys
+import time
+import random
+
+from inspect import getmembers
+from inspect import isfunction
+
+from gn3.computations.slink import slink, nearest
+
+
+def gn1_slink(lists):
+    """The original genenetwork1 algorithm: at each step, merge the closest
+    pair of clusters, then recompute every distance between the clusters."""
+    clusters = list(range(len(lists)))
+    distances = [list(child) for child in lists]
+    while len(clusters) > 2:
+        mindist, first, second = min(
+            (distances[i][j], i, j) for i in range(len(clusters))
+            for j in range(i + 1, len(clusters)))
+        clusters[first] = (clusters[first], clusters.pop(second), mindist)
+        distances = [[nearest(lists, clst_i, clst_j) if clst_i != clst_j else 0
+                      for clst_j in clusters]
+                     for clst_i in clusters]
+    return clusters + [nearest(lists, clusters[0], clusters[1])]
+
+
+def timer(func, *args):
+    """time function"""
+    start_time = time.perf_counter()
+    results = func(*args)
+    print(f"{func.__name__}: the time taken is "
+          f"{time.perf_counter() - start_time:.3f} seconds")
+    return results
+
+
+def random_distances(size: int, seed: int = 17):
+    """Generate a random distance matrix for `size` traits, like the
+    1 - correlation matrices clustered for heatmaps."""
+    rng = random.Random(seed)
+    distances = [[0.0] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(i + 1, size):
+            distances[i][j] = distances[j][i] = round(rng.uniform(0, 2), 4)
+    return distances
+
+
+def compare(size: int):
+    """Time both implementations on `size` traits, and check that they give
+    the same clustering."""
+    distances = random_distances(size)
+    print(f"Performance test for slink with {size} traits")
+    assert timer(slink, distances) == timer(gn1_slink, distances)
+
+
+def perf_slink_20_traits():
+    """small heatmap"""
+    compare(20)
+
+
+def perf_slink_40_traits():
+    """medium heatmap: the genenetwork1 algorithm takes about a minute"""
+    compare(40)
+
+
+def perf_slink_1000_traits():
+    """large heatmap, beyond the reach of the genenetwork1 algorithm"""
+    print("Performance test for slink with 1000 traits")
+    timer(slink, random_distances(1000))
+
+
+def fetch_perf_functions():
+    """function to filter all functions strwith perf_"""
+    return {name: func_obj for name, func_obj in
+            getmembers(sys.modules[__name__], isfunction)
+            if func_obj.__module__ == __name__ and name.startswith('perf_')}
+
+
+if __name__ == '__main__':
+    cmd_args = sys.argv[1:]
+    for name, func_obj in fetch_perf_functions().items():
+        if len(cmd_args) == 0 or name in cmd_args:
+            func_obj()
@@ -13,6 +13,7 @@ from gn3.computations.correlations import filter_shared_sample_keys
 
 from gn3.computations.correlations import tissue_correlation_for_trait
 from gn3.computations.correlations import lit_correlation_for_trait
+from gn3.computations.correlations import bulk_lit_correlation_for_trait
 from gn3.computations.correlations import fetch_lit_correlation_data
 from gn3.computations.correlations import query_formatter
 from gn3.computations.correlations import map_to_mouse_gene_id
@@ -250,6 +251,33 @@ class TestCorrelation(TestCase):
 
         self.assertEqual(lit_results, expected_results)
 
+    @pytest.mark.unit_test
+    def test_bulk_lit_correlation_for_trait(self):
+        """All the gene ids are mapped to mouse gene ids in one query, and all
+        the trait's literature correlations fetched in another"""
+        cursor = mock.MagicMock()
+        cursor.fetchall.side_effect = [
+            [(12, 112), (15, 115), (17, 117), (11, "110;111")],
+            [(117, 0.5, 0), (115, 0.7, 0), (117, 0.8, 1)]]
+        conn = mock.Mock()
+        conn.cursor.return_value.__enter__ = mock.Mock(return_value=cursor)
+        conn.cursor.return_value.__exit__ = mock.Mock(return_value=False)
+
+        lit_results = bulk_lit_correlation_for_trait(
+            conn=conn,
+            target_trait_lists=[("1426679_at", 15), ("1426702_at", "17"),
+                                ("1426682_at", 11), ("1426690_at", None),
+                                ("1426695_at", 19)],
+            species="rat", trait_gene_id="12")
+
+        self.assertEqual(lit_results, [
+            {"1426679_at": {"gene_id": 15, "lit_corr": 0.7}},
+            {"1426702_at": {"gene_id": "17", "lit_corr": 0.8}},
+            {"1426682_at": {"gene_id": 11, "lit_corr": None}},
+            {"1426695_at": {"gene_id": 19, "lit_corr": None}}])
+        self.assertEqual(cursor.execute.call_count, 2)
+        self.assertEqual(cursor.execute.call_args_list[1][0][1], ("112", "112"))
+
     @pytest.mark.unit_test
     def test_fetch_lit_correlation_data(self):
         """Test for fetching lit correlation data from\
@@ -359,10 +387,10 @@ class TestCorrelation(TestCase):
         self.assertEqual(results, expected_results)
 
     @pytest.mark.unit_test
-    @mock.patch("gn3.computations.correlations.lit_correlation_for_trait")
+    @mock.patch("gn3.computations.correlations.bulk_lit_correlation_for_trait")
     def test_compute_all_lit_correlation(self, mock_lit_corr):
         """Test for compute all lit correlation which acts\
-        as an abstraction for lit_correlation_for_trait
+        as an abstraction for bulk_lit_correlation_for_trait
         and is used in the api/correlation/lit
         """
 
@@ -415,7 +443,7 @@ class TestCorrelation(TestCase):
         results = compute_tissue_correlation(
             primary_tissue_dict=primary_tissue_dict,
             target_tissues_data=target_tissue_data,
-            corr_method="pearson")
+            corr_method="bicor")
         process_trait_symbol.assert_called_once_with(
             target_trait_symbol, target_symbol_tissue_vals)
 
@@ -0,0 +1,234 @@
+"""Tests for the vectorised sample correlations"""
+import random
+from unittest import TestCase
+
+import pytest
+import numpy as np
+import pandas as pd
+import pingouin
+from numpy.testing import assert_allclose
+
+from gn3.computations.correlations import compute_one_sample_correlation
+from gn3.computations.correlations import tissue_correlation_for_trait
+from gn3.computations.correlations2 import compute_correlation
+from gn3.computations.matrix_correlations import correlate_matrix
+from gn3.computations.matrix_correlations import sample_values_matrix
+from gn3.computations.matrix_correlations import pairwise_correlation_matrix
+from gn3.computations.matrix_correlations import partial_correlate_matrix
+from gn3.computations.matrix_correlations import (
+    compute_matrix_sample_correlation, compute_dataset_sample_correlation,
+    compute_matrix_tissue_correlation)
+
+
+def random_dataset(num_traits, samples, missing=0.2, seed=31):
+    """Generate a primary trait and a target dataset in the GN2 format, with
+    some values missing or set to `None`."""
+    rng = random.Random(seed)
+    def __trait_data__():
+        return {
+            sample: (None if rng.random() < missing / 2
+                     else round(rng.gauss(8, 2), 1))
+            for sample in samples if rng.random() >= missing / 2}
+    return (
+        {"trait_id": "primary", "trait_sample_data": __trait_data__()},
+        [{"trait_id": f"trait_{idx}", "trait_sample_data": __trait_data__()}
+         for idx in range(num_traits)])
+
+
+class TestMatrixCorrelations(TestCase):
+    """Tests for `gn3.computations.matrix_correlations`"""
+
+    @pytest.mark.unit_test
+    def test_sample_values_matrix(self):
+        """Missing samples and `None` values are set to NaN."""
+        trait_ids, matrix = sample_values_matrix(
+            ("BXD1", "BXD2", "BXD5"),
+            [{"trait_id": "T1",
+              "trait_sample_data": {"BXD1": 4.1, "BXD5": 3.2}},
+             {"trait_id": "T2",
+              "trait_sample_data": {"BXD1": None, "BXD2": 5.7, "BXD5": 3.6}}])
+        self.assertEqual(trait_ids, ["T1", "T2"])
+        assert_allclose(
+            matrix, np.array([[4.1, np.nan, 3.2], [np.nan, 5.7, 3.6]]))
+
+    @pytest.mark.unit_test
+    def test_correlate_matrix_overlap(self):
+        """Only samples present in both the primary and target are counted."""
+        primary = np.array([1.0, 2.0, np.nan, 4.0, 5.0, 6.0, 7.0, 8.0])
+        targets = np.array([
+            [2.0, 4.0, 6.0, 8.0, 10.0, 12.0, 14.0, 16.0],
+            [np.nan, 4.0, 6.0, np.nan, 10.0, 12.0, 14.0, 16.0]])
+        coeffs, p_values, num_overlap = correlate_matrix(primary, targets)
+        self.assertEqual(num_overlap.tolist(), [7, 5])
+        assert_allclose(coeffs, [1.0, 1.0])
+        assert_allclose(p_values, [0.0, 0.0])
+
+    @pytest.mark.unit_test
+    def test_correlate_matrix_invalid_method(self):
+        """Methods that cannot be vectorised are rejected."""
+        with self.assertRaises(ValueError):
+            correlate_matrix(np.ones(6), np.ones((2, 6)), "bicor")
+
+    @pytest.mark.unit_test
+    def test_matches_per_trait_computation(self):
+        """The vectorised results match those of computing each target trait's
+        correlation separately with scipy."""
+        samples = [f"BXD{idx}" for idx in range(1, 40)]
+        this_trait, target_dataset = random_dataset(60, samples)
+        for method in ("pearson", "spearman"):
+            with self.subTest(method=method):
+                expected = {
+                    trait_id: corr
+                    for result in (
+                        compute_one_sample_correlation(
+                            this_trait["trait_sample_data"], trait, method)
+                        for trait in target_dataset)
+                    if result is not None
+                    for trait_id, corr in result.items()}
+                results = compute_matrix_sample_correlation(
+                    this_trait, target_dataset, method)
+                self.assertEqual(len(results), len(expected))
+                coeffs = [tuple(result.values())[0]["corr_coefficient"]
+                          for result in results]
+                self.assertEqual(
+                    coeffs, sorted(coeffs, key=lambda coeff: -abs(coeff)))
+                for result in results:
+                    ((trait_id, corr),) = result.items()
+                    self.assertEqual(
+                        corr["num_overlap"], expected[trait_id]["num_overlap"])
+                    assert_allclose(
+                        [corr["corr_coefficient"], corr["p_value"]],
+                        [expected[trait_id]["corr_coefficient"],
+                         expected[trait_id]["p_value"]],
+                        rtol=1e-7, atol=1e-12)
+
+    @pytest.mark.unit_test
+    def test_dataset_correlation_aligns_strains(self):
+        """Correlating against a dataset matrix aligns the primary trait's
+        samples to the dataset's strains by name, giving the same results as
+        correlating against the equivalent list of traits."""
+        strains = [f"BXD{idx}" for idx in range(1, 30)]
+        this_trait, target_dataset = random_dataset(25, strains, seed=5)
+        trait_ids, matrix = sample_values_matrix(
+            tuple(reversed(strains)), target_dataset)
+        this_trait["trait_sample_data"]["NOT-IN-DATASET"] = 3.5
+        dataset_trait = {**this_trait, "trait_sample_data": {
+            key: val for key, val in this_trait["trait_sample_data"].items()
+            if key in strains}}
+        for method in ("pearson", "spearman"):
+            with self.subTest(method=method):
+                results = compute_dataset_sample_correlation(
+                    this_trait, tuple(reversed(strains)), trait_ids, matrix,
+                    method, top_n=10)
+                expected = compute_matrix_sample_correlation(
+                    dataset_trait, target_dataset, method, top_n=10)
+                self.assertEqual(
+                    [tuple(result.keys()) for result in results],
+                    [tuple(result.keys()) for result in expected])
+                assert_allclose(
+                    [tuple(corr.values()) for result in results
+                     for corr in result.values()],
+                    [tuple(corr.values()) for result in expected
+                     for corr in result.values()],
+                    rtol=1e-9)
+
+    @pytest.mark.unit_test
+    def test_tissue_correlation_matches_per_trait_computation(self):
+        """The vectorised tissue correlations match those computed for each
+        trait separately, with traits sharing a gene symbol sharing a row."""
+        rng = random.Random(7)
+        symbol_tissue_vals = {
+            f"gene{idx}": [round(rng.gauss(5, 2), 2) for _ in range(25)]
+            for idx in range(30)}
+        trait_symbols = {
+            **{f"{idx}_at": f"Gene{idx % 20}" for idx in range(40)},
+            "missing_at": "NotAGene", "no_symbol_at": None}
+        primary = {"trait_id": "primary_at",
+                   "tissue_values": symbol_tissue_vals.pop("gene29")}
+        for method in ("pearson", "spearman"):
+            with self.subTest(method=method):
+                results = compute_matrix_tissue_correlation(
+                    primary, {"trait_symbol_dict": trait_symbols,
+                              "symbol_tissue_vals_dict": symbol_tissue_vals},
+                    method, top_n=30)
+                coeffs = [tuple(result.values())[0]["tissue_corr"]
+                          for result in results]
+                self.assertEqual(len(results), 30)
+                self.assertEqual(
+                    coeffs, sorted(coeffs, key=lambda coeff: -abs(coeff)))
+                for result in results:
+                    ((trait_id, corr),) = result.items()
+                    expected = tissue_correlation_for_trait(
+                        primary["tissue_values"],
+                        symbol_tissue_vals[trait_symbols[trait_id].lower()],
+                        method, trait_id)[trait_id]
+                    self.assertEqual(corr["tissue_number"], 25)
+                    assert_allclose(
+                        [corr["tissue_corr"], corr["tissue_p_val"]],
+                        [expected["tissue_corr"], expected["tissue_p_val"]],
+                        rtol=1e-7, atol=1e-12)
+
+    @pytest.mark.unit_test
+    def test_tissue_correlation_skips_undefined_correlations(self):
+        """Symbols whose tissue values are constant, and so have no defined
+        correlation, are left out rather than crowding out the others."""
+        results = compute_matrix_tissue_correlation(
+            {"trait_id": "primary_at", "tissue_values": [1.0, 2.0, 3.0, 5.0]},
+            {"trait_symbol_dict": {
+                "valid_at": "Valid", "flat1_at": "Flat1", "flat2_at": "Flat2"},
+             "symbol_tissue_vals_dict": {
+                 "valid": [2.0, 1.0, 4.0, 3.0], "flat1": [1.0] * 4,
+                 "flat2": [2.0] * 4}},
+            "pearson", top_n=2)
+        self.assertEqual([tuple(result) for result in results], [("valid_at",)])
+
+    @pytest.mark.unit_test
+    def test_pairwise_correlation_matrix(self):
+        """The pairwise correlations match those computed for each pair of
+        traits separately, whatever the chunk size, with pairs that share fewer
+        than 6 samples given a correlation of 0."""
+        rng = random.Random(11)
+        traits = [[None if rng.random() < 0.3 else round(rng.gauss(8, 2), 2)
+                   for _ in range(12)] for _ in range(25)]
+        traits.append([None] * 8 + [1.0, 2.0, 3.0, 4.0])
+        expected = [[compute_correlation(trait_i, trait_j)[0]
+                     for trait_j in traits] for trait_i in traits]
+        for chunk_size in (4, 100):
+            with self.subTest(chunk_size=chunk_size):
+                coeffs = pairwise_correlation_matrix(
+                    np.array(traits, dtype=np.float64), chunk_size=chunk_size)
+                assert_allclose(coeffs, expected, rtol=1e-9, atol=1e-12)
+                self.assertTrue(np.array_equal(coeffs, coeffs.T))
+
+    @pytest.mark.unit_test
+    def test_partial_correlate_matrix(self):
+        """The partial and zero-order correlations match those computed with
+        pingouin for each target separately, whatever the target's missing
+        values, with the partial correlation of a constant target undefined."""
+        rng = np.random.default_rng(13)
+        primary = rng.normal(size=30)
+        controls = rng.normal(size=(2, 30))
+        targets = rng.normal(size=(40, 30)) + 0.5 * primary
+        targets[rng.random(targets.shape) < 0.15] = np.nan
+        targets[0] = 1.0
+        for method in ("pearson", "spearman"):
+            with self.subTest(method=method):
+                results = np.array(partial_correlate_matrix(
+                    primary, controls, targets, method))
+                self.assertTrue(np.isnan(results[0:2, 0]).all())
+                for target, result in zip(targets[1:], results.T[1:]):
+                    present = ~np.isnan(target)
+                    data = pd.DataFrame({
+                        "x": primary[present], "y": target[present],
+                        "z0": controls[0][present], "z1": controls[1][present]})
+                    expected = [
+                        (frame["r"].iloc[0],
+                         frame.filter(regex="p.val").iloc[0, 0])
+                        for frame in (
+                            pingouin.partial_corr(
+                                data=data, x="x", y="y", covar=["z0", "z1"],
+                                method=method),
+                            pingouin.corr(data["x"], data["y"], method=method))]
+                    self.assertEqual(result[4], present.sum())
+                    assert_allclose(
+                        result[:4], np.ravel(expected), rtol=1e-7, atol=1e-12)
@@ -1,7 +1,9 @@
 """Module contains tests for gn3.partial_correlations"""
 
+import tempfile
 from unittest import TestCase
 
+import numpy
 import pandas
 import pytest
 from numpy.testing import assert_allclose
@@ -11,8 +13,14 @@ from gn3.computations.partial_correlations import (
     control_samples,
     build_data_frame,
     tissue_correlation,
+    compute_partial,
+    read_text_database,
     find_identical_traits,
-    good_dataset_samples_indexes)
+    partial_correlations_fast,
+    good_dataset_samples_indexes,
+    partial_correlations_from_matrix)
+from gn3.dataset_matrices import write_matrix
+from gn3.phenodb import open_reader
 
 sampleslist = ["B6cC3-1", "BXD1", "BXD12", "BXD16", "BXD19", "BXD2"]
 control_traits = (
@@ -280,3 +288,87 @@ class TestPartialCorrelations(TestCase):
             with self.subTest(xdata=xdata, ydata=ydata, zdata=zdata):
                 self.assertTrue(
                     build_data_frame(xdata, ydata, zdata).equals(expected))
+
+    @pytest.mark.unit_test
+    def test_read_text_database(self):
+        """
+        Check that only the wanted traits are read, in chunks, with the values
+        aligned to the given samples.
+        """
+        with tempfile.NamedTemporaryFile("w", suffix=".txt") as dbfile:
+            dbfile.write(
+                '"ID","BXD2","BXD1","BXD5"\n'
+                '"T1","1.5","2.5","x"\n'
+                '"T2","3.5","4.5","5.5"\n'
+                '"T3","6.5","7.5","8.5"\n')
+            dbfile.flush()
+            chunks = tuple(read_text_database(
+                dbfile.name, ("BXD1", "BXD5", "BXD9"), ("T1", "T3"),
+                chunk_size=1))
+        self.assertEqual(
+            tuple(names for names, _values in chunks), (("T1",), ("T3",)))
+        assert_allclose(
+            numpy.vstack([values for _names, values in chunks]),
+            [[2.5, numpy.nan, numpy.nan], [7.5, 8.5, numpy.nan]])
+
+    @pytest.mark.unit_test
+    def test_partial_correlations_fast(self):
+        """
+        Check that correlating against a text file gives the same results as
+        correlating against the same targets in memory.
+        """
+        rng = numpy.random.default_rng(17)
+        samples = tuple(f"BXD{idx}" for idx in range(20))
+        primary, control = rng.normal(size=(2, 20))
+        targets = tuple(
+            (f"T{idx}", *(None if rng.random() < 0.2 else round(val, 4)
+                          for val in rng.normal(size=20) + primary))
+            for idx in range(30))
+        fetched = {f"T{idx}": (idx / 30, 0.5) for idx in range(0, 30, 2)}
+        with tempfile.NamedTemporaryFile("w", suffix=".txt") as dbfile:
+            dbfile.write(",".join(("ID",) + samples[::-1]) + "\n")
+            dbfile.writelines(
+                ",".join((name,) + tuple(
+                    "x" if val is None else str(val) for val in values[::-1]))
+                + "\n"
+                for name, *values in targets)
+            dbfile.flush()
+            results = tuple(partial_correlations_fast(
+                samples, primary, (control,), dbfile.name, fetched, "pearson",
+                "tissue"))
+        expected = tuple(
+            corr + fetched[corr[0]] for corr in compute_partial(
+                primary, (control,), targets[::2], 1, "pearson"))
+        self.assertEqual(
+            tuple(row[0] for row in results), tuple(row[0] for row in expected))
+        assert_allclose(
+            [row[1:] for row in results], [row[1:] for row in expected])
+
+    @pytest.mark.unit_test
+    def test_partial_correlations_from_matrix(self):
+        """
+        Check that correlating against a dataset's precomputed matrix gives the
+        same results as correlating against the same targets in memory.
+        """
+        rng = numpy.random.default_rng(19)
+        samples = tuple(f"BXD{idx}" for idx in range(20))
+        primary, control = rng.normal(size=(2, 20))
+        matrix = rng.normal(size=(30, 20)) + primary
+        matrix[rng.random(matrix.shape) < 0.2] = numpy.nan
+        names = [f"T{idx}" for idx in range(30)]
+        targets = tuple((name, *values) for name, values in zip(names, matrix))
+        with tempfile.TemporaryDirectory() as tempdir:
+            write_matrix(
+                f"{tempdir}/dataset", names, list(samples[::-1]),
+                matrix[:, ::-1], {})
+            pheno = open_reader(f"{tempdir}/dataset")
+            results = tuple(partial_correlations_from_matrix(
+                samples + ("BXD99",), (*primary, 1.0), ((*control, 1.0),),
+                pheno, None, "pearson", "genetic"))
+            pheno.env.close()
+        expected = tuple(compute_partial(
+            primary, (control,), targets, 1, "pearson"))
+        self.assertEqual(
+            tuple(row[0] for row in results), tuple(row[0] for row in expected))
+        assert_allclose(
+            [row[1:] for row in results], [row[1:] for row in expected])
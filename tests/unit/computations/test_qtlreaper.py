@@ -1,12 +1,34 @@
 """Module contains tests for gn3.computations.qtlreaper"""
-from unittest import TestCase
+import os
+import tempfile
+from unittest import TestCase, mock
 import pytest
 from gn3.computations.qtlreaper import (
+    run_reaper_for_traits,
     parse_reaper_main_results,
     organise_reaper_main_results,
     parse_reaper_permutation_results)
 from tests.unit.sample_test_data import organised_trait_1
 
+def fake_run_reaper(# pylint: disable=[too-many-arguments, too-many-positional-arguments]
+        _reaper_cmd, _genotype_filename, traits_filename, output_dir,
+        _other_options, mapped):
+    """Stand in for `run_reaper`: write a main output file with two loci per
+    trait, whose LRS is the sum of the trait's values."""
+    with open(traits_filename, "r", encoding="utf8") as infile:
+        traits = [line.strip().split("\t") for line in infile][1:]
+    mapped.append([trait[1:] for trait in traits])
+    output_filename = f"{output_dir}/qtlreaper/main_output_{len(mapped)}.txt"
+    with open(output_filename, "w", encoding="utf8") as outfile:
+        outfile.write("ID\tLocus\tChr\tcM\tMb\tLRS\tAdditive\tpValue\n")
+        for trait in traits:
+            lrs = sum(float(value) for value in trait[1:])
+            for locus, chromo in (("rs1", "1"), ("rs2", "X")):
+                outfile.write(
+                    f"{trait[0]}\t{locus}\t{chromo}\t1.5\t3.0\t{lrs}\t"
+                    "-0.07\t1.000\n")
+    return output_filename, None
+
 class TestQTLReaper(TestCase):
     """Class for testing qtlreaper interface functions."""
 
@@ -137,3 +159,65 @@ class TestQTLReaper(TestCase):
                 }
             ]),
             organised_trait_1)
+
+    @pytest.mark.unit_test
+    def test_run_reaper_for_traits(self):
+        """Traits are mapped in chunks, numbered in order, and only the traits
+        that have not been mapped before are mapped again."""
+        mapped: list = []
+        with (tempfile.TemporaryDirectory() as output_dir,
+              mock.patch(
+                  "gn3.computations.qtlreaper.run_reaper",
+                  side_effect=lambda *args: fake_run_reaper(*args, mapped))):
+            genotype_filename = os.path.join(output_dir, "BXD.geno")
+            with open(genotype_filename, "w", encoding="utf8") as outfile:
+                outfile.write("@name:BXD\n")
+            traits = [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]
+            results = run_reaper_for_traits(
+                "qtlreaper", genotype_filename, ["BXD1", "BXD2"], traits,
+                output_dir, chunk_size=2)
+            self.assertEqual(
+                [(locus["ID"], locus["Chr"], locus["LRS"])
+                 for locus in results],
+                [("1", 1, 3.0), ("1", "X", 3.0), ("2", 1, 7.0),
+                 ("2", "X", 7.0), ("3", 1, 11.0), ("3", "X", 11.0)])
+            self.assertEqual(len(mapped), 2)
+
+            results = run_reaper_for_traits(
+                "qtlreaper", genotype_filename, ["BXD1", "BXD2"],
+                [[7.0, 8.0]] + traits, output_dir, chunk_size=2)
+            self.assertEqual(mapped[2:], [[["7.0", "8.0"]]])
+            self.assertEqual(
+                [(locus["ID"], locus["LRS"]) for locus in results][::2],
+                [("1", 15.0), ("2", 3.0), ("3", 7.0), ("4", 11.0)])
+
+    @pytest.mark.unit_test
+    def test_run_reaper_for_traits_removes_stale_results(self):
+        """Cached results that have not been used for the cache's TTL are
+        removed; those that are used are kept."""
+        mapped: list = []
+        with (tempfile.TemporaryDirectory() as output_dir,
+              mock.patch(
+                  "gn3.computations.qtlreaper.run_reaper",
+                  side_effect=lambda *args: fake_run_reaper(*args, mapped))):
+            genotype_filename = os.path.join(output_dir, "BXD.geno")
+            with open(genotype_filename, "w", encoding="utf8") as outfile:
+                outfile.write("@name:BXD\n")
+            cache_dir = os.path.join(output_dir, "qtlreaper", "cache")
+            for traits in ([[1.0, 2.0]], [[3.0, 4.0]]):
+                run_reaper_for_traits(
+                    "qtlreaper", genotype_filename, ["BXD1", "BXD2"], traits,
+                    output_dir)
+            long_ago = os.path.getmtime(genotype_filename) - 3600
+            for name in os.listdir(cache_dir):
+                os.utime(os.path.join(cache_dir, name), (long_ago, long_ago))
+
+            run_reaper_for_traits(
+                "qtlreaper", genotype_filename, ["BXD1", "BXD2"],
+                [[1.0, 2.0]], output_dir, cache_ttl=60)
+            self.assertEqual(len(mapped), 2)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            run_reaper_for_traits(
+                "qtlreaper", genotype_filename, ["BXD1", "BXD2"],
+                [[3.0, 4.0]], output_dir, cache_ttl=60)
+            self.assertEqual(mapped[2:], [[["3.0", "4.0"]]])
@@ -3,7 +3,8 @@ import unittest
 
 from unittest import mock
 import pytest
-from gn3.computations.rqtl import generate_rqtl_cmd
+from gn3.computations.rqtl import (
+    generate_rqtl_cmd, rqtl_result_files, rqtl_result_id)
 
 class TestRqtl(unittest.TestCase):
     """Test cases for computations.rqtl module"""
@@ -42,3 +43,39 @@ class TestRqtl(unittest.TestCase):
                                       "--addcovar --interval"
                                   )
                               })
+
+    @pytest.mark.unit_test
+    @mock.patch("gn3.computations.rqtl.assert_path_exists")
+    @mock.patch("gn3.computations.rqtl.get_hash_of_files")
+    def test_rqtl_command_hashes_input_files(self, mock_get_hash_files, _exists):
+        """Test that the contents of the genotype and phenotype files, not their
+        names, identify the results"""
+        mock_get_hash_files.return_value = "my-hash1"
+        output_file = generate_rqtl_cmd(
+            rqtl_wrapper_cmd="scripts/rqtl_wrapper.R",
+            rqtl_wrapper_kwargs={"geno": "genofile", "pheno": "phenofile",
+                                 "nperm": 0},
+            rqtl_wrapper_bool_kwargs=[])["output_file"]
+        mock_get_hash_files.assert_called_once_with(["genofile", "phenofile"])
+        self.assertEqual(
+            output_file,
+            generate_rqtl_cmd(
+                rqtl_wrapper_cmd="scripts/rqtl_wrapper.R",
+                rqtl_wrapper_kwargs={"geno": "other-genofile",
+                                     "pheno": "other-phenofile",
+                                     "nperm": 0},
+                rqtl_wrapper_bool_kwargs=[])["output_file"])
+
+    @pytest.mark.unit_test
+    @mock.patch("gn3.computations.rqtl.get_tmpdir")
+    def test_rqtl_result_files(self, mock_get_tmpdir):
+        """Test that the result files include those of the pair-scan map and
+        of the permutations, when run"""
+        mock_get_tmpdir.return_value = "/tmp"
+        self.assertEqual(rqtl_result_files("hash-output.csv", False, 0),
+                         ["/tmp/gn3/hash-output.csv"])
+        self.assertEqual(rqtl_result_files("hash-output.csv", True, 1000),
+                         ["/tmp/gn3/hash-output.csv",
+                          "/tmp/gn3/MAP_hash-output.csv",
+                          "/tmp/gn3/PERM_hash-output.csv"])
+        self.assertEqual(rqtl_result_id("hash-output.csv"), "hash")
@@ -322,3 +322,18 @@ class TestSlink(TestCase):
                  [(0, (2, 4, 2), 3), (1, 3, 5), 6]]]:
             with self.subTest(data=data):
                 self.assertEqual(slink(data), expected)
+
+    @pytest.mark.unit_test
+    def test_slink_with_equal_distances(self):
+        """Test that equally distant clusters are merged in the same order as in
+        genenetwork1: the pair of clusters with the smallest members first."""
+        for data, expected in [
+                [[[0, 1, 1, 4], [1, 0, 1, 4], [1, 1, 0, 2], [4, 4, 2, 0]],
+                 [((0, 1, 1), 2, 1), 3, 2]],
+                [[[0, 2, 1, 1, 3], [2, 0, 2, 1, 1], [1, 2, 0, 2, 1],
+                  [1, 1, 2, 0, 2], [3, 1, 1, 2, 0]],
+                 [(((0, 2, 1), 3, 1), 1, 1), 4, 1]],
+                [[[0, 1, 2, 1], [1, 0, 1, 2], [2, 1, 0, 1], [1, 2, 1, 0]],
+                 [((0, 1, 1), 2, 1), 3, 1]]]:
+            with self.subTest(data=data):
+                self.assertEqual(slink(data), expected)
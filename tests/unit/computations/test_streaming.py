@@ -0,0 +1,56 @@
+"""Test cases for procedures defined in computations.streaming"""
+import sys
+from unittest import mock
+
+import pytest
+
+from gn3.computations.streaming import (
+    COMPLETION_MESSAGE, run_process, mark_done, log_events)
+
+
+@pytest.mark.unit_test
+def test_run_process_logs_output(tmp_path):
+    """The output of the process is appended to the log."""
+    log_file = tmp_path / "run.txt"
+    log_file.write_text("File created for streaming\n")
+    result = run_process(
+        [sys.executable, "-c", "print('one'); print('two')"], log_file, "run")
+    assert result["code"] == 0
+    assert log_file.read_text() == "File created for streaming\none\ntwo\n"
+
+
+@pytest.mark.unit_test
+def test_log_events_resume_from_offset(tmp_path):
+    """Each line is an event whose id is the offset to resume from; the events
+    end with the completion message."""
+    log_file = tmp_path / "run.txt"
+    log_file.write_text("one\ntwo\n")
+    mark_done(log_file)
+    events = list(log_events(str(log_file), idle_timeout=0))
+    assert events == [
+        "id: 4\ndata: one\n\n", "id: 8\ndata: two\n\n",
+        f"id: 34\ndata: {COMPLETION_MESSAGE}\n\n",
+        "id: 34\nevent: end\ndata: \n\n"]
+    assert list(log_events(str(log_file), offset=4, idle_timeout=0))[0] == (
+        "id: 8\ndata: two\n\n")
+
+
+@pytest.mark.unit_test
+def test_log_events_wait_for_complete_lines(tmp_path):
+    """A partial line is not sent until it is complete."""
+    log_file = tmp_path / "run.txt"
+    log_file.write_text("one\npart")
+    assert list(log_events(str(log_file), idle_timeout=0)) == [
+        "id: 4\ndata: one\n\n", "id: 4\nevent: end\ndata: \n\n"]
+
+
+@pytest.mark.unit_test
+@pytest.mark.parametrize("headers,query", (
+    ({"Last-Event-ID": "abc"}, ""), ({}, "?peak=-4"), ({}, "?peak=1.5")))
+def test_stream_events_reject_invalid_offsets(client, tmp_path, headers, query):
+    """An offset that is not a non-negative integer is a client error."""
+    (tmp_path / "run.txt").write_text("one\n")
+    with mock.patch.dict(client.application.config, {"TMPDIR": str(tmp_path)}):
+        response = client.get(f"/api/stream/run/events{query}", headers=headers)
+    assert response.status_code == 400
+    assert "Invalid offset" in response.get_json()["error"]
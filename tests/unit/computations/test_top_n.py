@@ -0,0 +1,59 @@
+"""Tests for the top-N selection of correlation results"""
+import random
+from unittest import TestCase
+
+import pytest
+import numpy as np
+
+from gn3.computations.top_n import top_n_items, top_n_indices
+
+
+class TestTopN(TestCase):
+    """Tests for `gn3.computations.top_n`"""
+
+    @pytest.mark.unit_test
+    def test_top_n_indices_matches_full_sort(self):
+        """Selecting the top N gives the prefix of a stable descending sort,
+        including when there are ties at the cut-off."""
+        rng = random.Random(7)
+        scores = np.array([rng.randint(0, 20) / 10 for _ in range(300)])
+        full_sort = np.argsort(-scores, kind="stable")
+        for top_n in (1, 5, 37, 150, 299, 300, 1000):
+            with self.subTest(top_n=top_n):
+                self.assertEqual(
+                    top_n_indices(scores, top_n).tolist(),
+                    full_sort[:top_n].tolist())
+
+    @pytest.mark.unit_test
+    def test_top_n_indices_edge_cases(self):
+        """`None` selects everything, zero selects nothing."""
+        scores = np.array([0.1, 0.9, 0.5])
+        self.assertEqual(top_n_indices(scores).tolist(), [1, 2, 0])
+        self.assertEqual(top_n_indices(scores, 0).tolist(), [])
+        self.assertEqual(top_n_indices(np.array([]), 3).tolist(), [])
+
+    @pytest.mark.unit_test
+    def test_top_n_indices_with_nan(self):
+        """NaN scores are never selected ahead of the others, and come last,
+        as in a full sort."""
+        scores = np.array([0.5, np.nan, np.nan, 0.9, 0.5])
+        for top_n in (1, 2, 3, 4, 5, None):
+            with self.subTest(top_n=top_n):
+                self.assertEqual(
+                    top_n_indices(scores, top_n).tolist(),
+                    np.argsort(-scores, kind="stable")[:top_n].tolist())
+        self.assertEqual(
+            top_n_indices(np.array([0.5, np.nan, np.nan]), 2).tolist(), [0, 1])
+
+    @pytest.mark.unit_test
+    def test_top_n_items(self):
+        """Selecting the top N items is equivalent to sorting and slicing."""
+        items = [{f"trait_{idx}": {"corr": (idx * 7) % 11 - 5}}
+                 for idx in range(40)]
+        def __key__(item):
+            return -abs(tuple(item.values())[0]["corr"])
+        for top_n in (None, 0, 3, 10, 40, 100):
+            with self.subTest(top_n=top_n):
+                self.assertEqual(
+                    top_n_items(iter(items), __key__, top_n),
+                    sorted(items, key=__key__)[:top_n])
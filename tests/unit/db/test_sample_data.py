@@ -1,11 +1,16 @@
 """Tests for gn3.db.sample_data"""
 import pytest
+from flask import Flask
 import gn3
 
+from gn3.correlation_cache import GENERATION_KEY, dataset_generation
+
 from gn3.db.sample_data import __extract_actions
 from gn3.db.sample_data import delete_sample_data
 from gn3.db.sample_data import insert_sample_data
 from gn3.db.sample_data import update_sample_data
+from gn3.db.sample_data import batch_update_sample_data
+from tests.unit.fake_redis import FakeRedis
 
 
 @pytest.mark.unit_test
@@ -214,3 +219,88 @@ def test_update_sample_data(mocker):
             ],
             any_order=False,
         )
+
+
+@pytest.mark.unit_test
+def test_batch_update_sample_data(mocker):
+    """Test that the ids are fetched up front, that each trait's changes are
+    applied with a statement per table, and that traits with unknown strains
+    are reported without being changed"""
+    mock_conn = mocker.MagicMock()
+    invalidate = mocker.patch("gn3.db.sample_data.invalidate_correlation_cache")
+    with mock_conn.cursor() as cursor:
+        cursor.fetchall.side_effect = (
+            (("BXD1", 1), ("BXD2", 2), ("BXD5", 5)),
+            (("BXDPublish", 10001, 17373),),
+        )
+        summary = batch_update_sample_data(mock_conn, {
+            "BXDPublish:10001": {
+                "Modifications": {
+                    "BXD1": {"value": {"Original": "7.5", "Current": "8.5"},
+                             "error": {"Original": "x", "Current": "0.3"}}},
+                "Additions": {"BXD2": {"value": "9.1", "n_cases": "0"}},
+                "Deletions": {"BXD5": {"value": "4.2", "error": "0.1"}}},
+            "BXDPublish:10002": {
+                "Modifications": {},
+                "Additions": {"BXD99": {"value": "1.0"}},
+                "Deletions": {}}})
+        assert summary == {
+            "BXDPublish:10001": {
+                "status": "success", "modified": 1, "added": 1, "deleted": 1},
+            "BXDPublish:10002": {
+                "status": "error",
+                "error": ("Strains not found in the database: BXD99. Please "
+                          "verify the strain names exist.")}}
+        cursor.executemany.assert_has_calls([
+            mocker.call(
+                "UPDATE PublishData SET value = %s "
+                "WHERE Id = %s AND StrainId = %s",
+                [("8.5", 17373, 1)]),
+            mocker.call(
+                "INSERT INTO PublishData (value, Id, StrainId) "
+                "VALUES (%s, %s, %s)",
+                [("9.1", 17373, 2)]),
+            mocker.call(
+                "INSERT INTO PublishSE (error, DataId, StrainId) "
+                "VALUES (%s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE error = VALUES(error)",
+                [("0.3", 17373, 1)])])
+        assert cursor.executemany.call_count == 3
+        cursor.execute.assert_has_calls([
+            mocker.call(
+                "DELETE FROM PublishData WHERE Id = %s AND StrainId IN (%s)",
+                (17373, 5)),
+            mocker.call(
+                "DELETE FROM PublishSE WHERE DataId = %s AND StrainId IN (%s)",
+                (17373, 5))])
+    mock_conn.commit.assert_called_once()
+    invalidate.assert_called_once()
+
+
+@pytest.mark.unit_test
+def test_edits_invalidate_the_configured_cache(mocker):
+    """Test that sample-data edits bump the generation of the correlation cache
+    in the Redis that the app is configured with"""
+    instances = {"redis://cache-host:6380/3": FakeRedis(),
+                 "redis://localhost:6379/0": FakeRedis()}
+    mocker.patch("gn3.correlation_cache.Redis.from_url",
+                 side_effect=instances.__getitem__)
+    mock_conn = mocker.MagicMock()
+    with mock_conn.cursor() as cursor:
+        cursor.fetchall.side_effect = (
+            (("BXD1", 1),), (("BXDPublish", 10001, 17373),))
+        app = Flask(__name__)
+        app.config["REDIS_URI"] = "redis://cache-host:6380/3"
+        with app.app_context():
+            batch_update_sample_data(mock_conn, {
+                "BXDPublish:10001": {
+                    "Modifications": {},
+                    "Additions": {"BXD1": {"value": "9.1"}},
+                    "Deletions": {}}})
+    assert instances["redis://cache-host:6380/3"].get(GENERATION_KEY) == b"1"
+    assert instances["redis://localhost:6379/0"].get(GENERATION_KEY) is None
+    # Only the edited dataset's matrix goes out of date
+    assert dataset_generation(
+        "BXDPublish", "redis://cache-host:6380/3") == 1
+    assert dataset_generation(
+        "HC_M2_0606_P", "redis://cache-host:6380/3") == 0
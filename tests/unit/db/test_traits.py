@@ -2,6 +2,7 @@
 from unittest import mock, TestCase
 import pytest
 from gn3.db.traits import (
+    TraitData,
     build_trait_name,
     export_trait_data,
     export_informative,
@@ -294,6 +295,44 @@ class TestTraitsDBFunctions(TestCase):
                         n_exists=nflag),
                     expected)
 
+    @pytest.mark.unit_test
+    def test_export_trait_data_missing_and_uninformative_samples(self):
+        """
+        Test `export_trait_data` pads samples with no data, and samples with a
+        zero value under the `all` type, with `None`s, whether it is given the
+        dictionary or the arrays.
+        """
+        tdata = {"mysqlid": 5, "data": {
+            "BXD1": {"sample_name": "BXD1", "value": 7.5, "variance": 0.2,
+                     "ndata": 3},
+            "BXD2": {"sample_name": "BXD2", "value": 0, "variance": 0.1,
+                     "ndata": 4},
+            "BXD5": {"sample_name": "BXD5", "value": 8.5, "variance": 0,
+                     "ndata": None}}}
+        samples = ["BXD5", "BXD3", "BXD2", "BXD1"]
+        for dtype, vflag, nflag, expected in [
+                ["val", False, False, (8.5, None, 0, 7.5)],
+                ["val", True, False, (8.5, None, None, 0, 7.5)],
+                ["var", False, True, (0, None, None, 0.1, 0.2)],
+                ["N", True, True, (None, None, None, None, 4, 3)],
+                ["all", True, True,
+                 (8.5, None, None, None, None, None, None, None, None,
+                  7.5, 0.2, 3)],
+                ["all", False, True,
+                 (8.5, None, None, None, None, None, 7.5, 3)]]:
+            for data in (tdata, TraitData.from_dict(tdata)):
+                with self.subTest(dtype=dtype, vflag=vflag, nflag=nflag,
+                                  data=type(data)):
+                    self.assertEqual(
+                        export_trait_data(
+                            data, samples, dtype=dtype, var_exists=vflag,
+                            n_exists=nflag),
+                        expected)
+
+        with self.assertRaises(KeyError):
+            export_trait_data(tdata, samples, dtype="se")
+        self.assertEqual(TraitData.from_dict(tdata).as_dict(), tdata)
+
     @pytest.mark.unit_test
     def test_export_informative(self):
         """Test that the function exports appropriate data."""
@@ -0,0 +1,277 @@
+"""An in-memory stand-in for the parts of a Redis connection that the job queue
+and its workers use."""
+# pylint: disable=[missing-function-docstring]
+import time
+import threading
+from typing import Optional
+
+
+def _bytes(value) -> bytes:
+    return value if isinstance(value, bytes) else str(value).encode("utf-8")
+
+
+class FakePipeline:
+    """Buffers the commands until `execute`, except in a transaction, where
+    they run at once until `multi` is called."""
+
+    def __init__(self, conn: "FakeRedis", immediate: bool = False):
+        self.conn = conn
+        self.immediate = immediate
+        self.commands: list = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self.conn, name)
+        def __run_or_buffer__(*args, **kwargs):
+            if self.immediate:
+                return command(*args, **kwargs)
+            self.commands.append((command, args, kwargs))
+            return self
+        return __run_or_buffer__
+
+    def watch(self, *_keys):
+        pass
+
+    def multi(self):
+        self.immediate = False
+
+    def execute(self):
+        with self.conn.lock:
+            results = [command(*args, **kwargs)
+                       for command, args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+
+class FakeRedis:# pylint: disable=[too-many-public-methods]
+    """Strings, lists, hashes and sets, with values returned as bytes."""
+
+    def __init__(self):
+        self.data: dict = {}
+        self.expiry: dict = {}
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+
+    def _value(self, key, default=None):
+        key = _bytes(key)
+        if key in self.expiry and self.expiry[key] <= time.monotonic():
+            self.data.pop(key, None)
+            self.expiry.pop(key, None)
+        return self.data.get(key, default)
+
+    def _list(self, key) -> list:
+        return self.data.setdefault(_bytes(key), [])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        pass
+
+    def ping(self):
+        return True
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def transaction(self, func, *_watches, value_from_callable=False):
+        with self.changed:
+            pipe = FakePipeline(self, immediate=True)
+            value = func(pipe)
+            results = pipe.execute()
+            self.changed.notify_all()
+        return value if value_from_callable else results
+
+    def get(self, key):
+        with self.lock:
+            return self._value(key)
+
+    def set(# pylint: disable=[too-many-arguments, too-many-positional-arguments]
+            self, key, value, px: Optional[int] = None,
+            ex: Optional[int] = None, nx: bool = False):
+        with self.lock:
+            if nx and self._value(key) is not None:
+                return None
+            self.data[_bytes(key)] = _bytes(value)
+            self.expiry.pop(_bytes(key), None)
+            if px:
+                self.expiry[_bytes(key)] = time.monotonic() + px / 1000
+            elif ex:
+                self.expiry[_bytes(key)] = time.monotonic() + ex
+            return True
+
+    def mget(self, keys):
+        with self.lock:
+            return [self._value(key) for key in keys]
+
+    def exists(self, *keys):
+        with self.lock:
+            return sum(self._value(key) is not None for key in keys)
+
+    def incr(self, key, amount=1):
+        with self.lock:
+            value = int(self._value(key, b"0")) + amount
+            self.data[_bytes(key)] = _bytes(value)
+            return value
+
+    def expire(self, key, seconds):
+        with self.lock:
+            if self._value(key) is None:
+                return False
+            self.expiry[_bytes(key)] = time.monotonic() + seconds
+            return True
+
+    def delete(self, *keys):
+        with self.lock:
+            return sum(
+                self.data.pop(_bytes(key), None) is not None for key in keys)
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        with self.lock:
+            items = dict(mapping or {})
+            if key is not None:
+                items[key] = value
+            self.data.setdefault(_bytes(name), {}).update(
+                {_bytes(fld): _bytes(val) for fld, val in items.items()})
+            return len(items)
+
+    def hget(self, name, key):
+        with self.lock:
+            return self._value(name, {}).get(_bytes(key))
+
+    def hmget(self, name, keys):
+        with self.lock:
+            fields = self._value(name, {})
+            return [fields.get(_bytes(key)) for key in keys]
+
+    def hgetall(self, name):
+        with self.lock:
+            return dict(self._value(name, {}))
+
+    def hincrby(self, name, key, amount=1):
+        with self.lock:
+            fields = self.data.setdefault(_bytes(name), {})
+            value = int(fields.get(_bytes(key), b"0")) + amount
+            fields[_bytes(key)] = _bytes(value)
+            return value
+
+    def hincrbyfloat(self, name, key, amount=1.0):
+        with self.lock:
+            fields = self.data.setdefault(_bytes(name), {})
+            value = float(fields.get(_bytes(key), b"0")) + amount
+            fields[_bytes(key)] = _bytes(value)
+            return value
+
+    def zadd(self, key, mapping, nx=False):
+        with self.lock:
+            scores = self.data.setdefault(_bytes(key), {})
+            added = 0
+            for member, score in mapping.items():
+                if nx and _bytes(member) in scores:
+                    continue
+                added = added + int(_bytes(member) not in scores)
+                scores[_bytes(member)] = score
+            return added
+
+    def zrem(self, key, *members):
+        with self.lock:
+            scores = self.data.get(_bytes(key), {})
+            return sum(scores.pop(_bytes(member), None) is not None
+                       for member in members)
+
+    def zrange(self, key, start, end):
+        with self.lock:
+            members = sorted(self._value(key, {}).items(),
+                             key=lambda item: (item[1], item[0]))
+            return [member for member, _score in
+                    members[start:(None if end == -1 else end + 1)]]
+
+    def sadd(self, key, *values):
+        with self.lock:
+            members = self.data.setdefault(_bytes(key), set())
+            before = len(members)
+            members.update(_bytes(value) for value in values)
+            return len(members) - before
+
+    def srem(self, key, *values):
+        with self.lock:
+            members = self.data.get(_bytes(key), set())
+            before = len(members)
+            members.difference_update(_bytes(value) for value in values)
+            return before - len(members)
+
+    def smembers(self, key):
+        with self.lock:
+            return set(self._value(key, set()))
+
+    def rpush(self, key, *values):
+        with self.changed:
+            self._list(key).extend(_bytes(value) for value in values)
+            self.changed.notify_all()
+            return len(self._list(key))
+
+    def lpush(self, key, *values):
+        with self.changed:
+            for value in values:
+                self._list(key).insert(0, _bytes(value))
+            self.changed.notify_all()
+            return len(self._list(key))
+
+    def blpop(self, keys, timeout=0):
+        with self.changed:
+            self.changed.wait_for(
+                lambda: any(self._value(key) for key in keys), timeout=timeout)
+            for key in keys:
+                if self._value(key):
+                    return (_bytes(key), self.lpop(key))
+            return None
+
+    def lpop(self, key):
+        with self.lock:
+            items = self._list(key)
+            return items.pop(0) if items else None
+
+    def lindex(self, key, index):
+        with self.lock:
+            items = self._value(key, [])
+            return items[index] if -len(items) <= index < len(items) else None
+
+    def llen(self, key):
+        with self.lock:
+            return len(self._value(key, []))
+
+    def ltrim(self, key, start, end):
+        with self.lock:
+            self.data[_bytes(key)] = self.lrange(key, start, end)
+            return True
+
+    def lrange(self, key, start, end):
+        with self.lock:
+            items = self._value(key, [])
+            return items[start:(None if end == -1 else end + 1)]
+
+    def lrem(self, key, _count, value):
+        with self.lock:
+            items = self._list(key)
+            if _bytes(value) in items:
+                items.remove(_bytes(value))
+                return 1
+            return 0
+
+    def lmove(self, first_list, second_list, src="LEFT", dest="RIGHT"):
+        with self.changed:
+            items = self._list(first_list)
+            if not items:
+                return None
+            value = items.pop(0 if src == "LEFT" else -1)
+            if dest == "LEFT":
+                self._list(second_list).insert(0, value)
+            else:
+                self._list(second_list).append(value)
+            self.changed.notify_all()
+            return value
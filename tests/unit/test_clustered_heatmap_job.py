@@ -0,0 +1,90 @@
+"""Tests for building clustered heatmaps as background jobs"""
+import json
+from uuid import uuid4
+from argparse import Namespace
+from unittest import mock
+
+import pytest
+
+from gn3 import jobs
+from scripts.clustered_heatmap import build_heatmap_job
+
+
+def job_args(job_id):
+    """The parsed command-line arguments of a heatmap job."""
+    return Namespace(
+        job_id=job_id, traits_names=["BXDPublish::10001", "BXDPublish::10002"],
+        vertical=False, genotype_files="/genotype", tmpdir="/tmp",
+        reaper_command="qtlreaper", workers=2, ttl=60)
+
+
+def recorded_details(rconn):
+    """The successive updates of the job's details, decoded."""
+    return [
+        {key: json.loads(value) for key, value in call.kwargs["mapping"].items()}
+        for call in rconn.hset.call_args_list]
+
+
+@pytest.mark.unit_test
+def test_heatmap_job_records_progress_and_output():
+    """The progress of each stage is recorded as the heatmap is built, and the
+    figure is saved as the job's output."""
+    job_id = uuid4()
+    rconn = mock.MagicMock()
+
+    def __build_heatmap__(*_args, progress, **_kwargs):
+        progress("fetch", 0, 2)
+        progress("map", 1, 2)
+        figure = mock.Mock()
+        figure.to_json.return_value = '{"data": []}'
+        return figure
+
+    with (mock.patch(
+            "scripts.clustered_heatmap.build_heatmap",
+            side_effect=__build_heatmap__),
+          mock.patch("scripts.clustered_heatmap.database_connection")):
+        build_heatmap_job(rconn, "mysql://", job_args(job_id))
+
+    details = recorded_details(rconn)
+    assert details[0] == {
+        "status": "running", "stage": "fetch",
+        "progress": {"done": 0, "total": 2}}
+    assert details[1]["stage"] == "map"
+    assert details[-1]["status"] == "success"
+    rconn.set.assert_called_with(
+        jobs.job_output_key(job_id), '{"data": []}', ex=60)
+    rconn.expire.assert_called_with(jobs.job_key(job_id), 60)
+
+
+@pytest.mark.unit_test
+def test_heatmap_job_records_errors():
+    """A failure to build the heatmap is recorded in the job's details."""
+    rconn = mock.MagicMock()
+    with (mock.patch(
+            "scripts.clustered_heatmap.build_heatmap",
+            side_effect=ValueError("No such trait")),
+          mock.patch("scripts.clustered_heatmap.database_connection")):
+        build_heatmap_job(rconn, "mysql://", job_args(uuid4()))
+
+    details = recorded_details(rconn)
+    assert details[-1]["status"] == "error"
+    assert "No such trait" in details[-1]["error"]
+    rconn.set.assert_not_called()
+
+
+@pytest.mark.unit_test
+def test_heatmap_job_records_connection_errors():
+    """Failing to connect to the database fails the job, rather than leaving
+    it queued."""
+    job_id = uuid4()
+    rconn = mock.MagicMock()
+    with mock.patch(
+            "scripts.clustered_heatmap.database_connection",
+            side_effect=ConnectionError("Can't connect")):
+        build_heatmap_job(rconn, "mysql://", job_args(job_id))
+    build_heatmap_job(rconn, None, job_args(job_id))
+
+    errors = [details["error"] for details in recorded_details(rconn)]
+    assert "Can't connect" in errors[0]
+    assert "SQL_URI" in errors[1]
+    rconn.expire.assert_called_with(jobs.job_key(job_id), 60)
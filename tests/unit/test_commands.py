@@ -1,15 +1,18 @@
 """Test cases for procedures defined in commands.py"""
 import unittest
 
-from dataclasses import dataclass
+from dataclasses import field, dataclass
 from datetime import datetime
 from typing import Callable
 from unittest import mock
 import pytest
+from flask import Flask
 from gn3.commands import compose_gemma_cmd
+from gn3.commands import compose_pcorrs_command_for_database
 from gn3.commands import compose_rqtl_cmd
 from gn3.commands import queue_cmd
 from gn3.commands import run_cmd
+from gn3.job_queue import user_queue_key
 from gn3.exceptions import RedisConnectionError
 
 
@@ -19,6 +22,11 @@ class MockRedis:
     ping: Callable
     hset: mock.MagicMock
     rpush: mock.MagicMock
+    pipeline: mock.MagicMock = field(default_factory=mock.MagicMock)
+
+    def queued(self):
+        """The `rpush` calls that queued commands."""
+        return self.pipeline.return_value.__enter__.return_value.rpush
 
 
 class TestCommands(unittest.TestCase):
@@ -82,6 +90,24 @@ class TestCommands(unittest.TestCase):
              "--addcovar")
         )
 
+    @pytest.mark.unit_test
+    def test_compose_pcorrs_command_for_database(self):
+        """Test that the partial correlations against a dataset use the
+        configured matrices and Redis"""
+        app = Flask(__name__)
+        app.config.update({
+            "TEXTDIR": "/tmp/text", "DATASET_MATRICES_DIR": "/tmp/matrices",
+            "REDIS_URI": "redis://cache-host:6380/3"})
+        with app.app_context():
+            self.assertEqual(
+                compose_pcorrs_command_for_database(
+                    ("python3", "-m", "scripts.partial_correlations"),
+                    "HC_M2_0606_P", 100),
+                ("python3", "-m", "scripts.partial_correlations",
+                 "against-db", "HC_M2_0606_P", "--criteria", "100",
+                 "--textdir", "/tmp/text", "--matrices-dir", "/tmp/matrices",
+                 "--redis-uri", "redis://cache-host:6380/3"))
+
     @pytest.mark.unit_test
     def test_queue_cmd_exception_raised_when_redis_is_down(self):
         """Test that the correct error is raised when Redis is unavailable"""
@@ -114,8 +140,9 @@ class TestCommands(unittest.TestCase):
             [mock.call(name=actual_unique_id, key="cmd", value='"ls"'),
              mock.call(name=actual_unique_id, key="result", value=""),
              mock.call(name=actual_unique_id, key="status", value="queued")])
-        mock_redis_conn.rpush.assert_has_calls(
-            [mock.call("GN2::job-queue", actual_unique_id)])
+        mock_redis_conn.queued().assert_has_calls([mock.call(
+            user_queue_key("GN2::job-queue", "default", "anonymous"),
+            actual_unique_id)])
 
     @pytest.mark.unit_test
     @mock.patch("gn3.commands.datetime")
@@ -143,8 +170,9 @@ class TestCommands(unittest.TestCase):
              mock.call(name=actual_unique_id, key="status", value="queued"),
              mock.call(name=actual_unique_id, key="email", value="me@me.com")
              ], any_order=True)
-        mock_redis_conn.rpush.assert_has_calls(
-            [mock.call("GN2::job-queue", actual_unique_id)])
+        mock_redis_conn.queued().assert_has_calls([mock.call(
+            user_queue_key("GN2::job-queue", "default", "me@me.com"),
+            actual_unique_id)])
 
     @pytest.mark.unit_test
     def test_run_cmd_correct_input(self):
@@ -0,0 +1,90 @@
+"""Tests for the shared correlation results cache"""
+from unittest import mock
+
+import pytest
+import redis
+
+from gn3 import correlation_cache
+from gn3.correlation_cache import cache_key, cached
+from tests.unit.fake_redis import FakeRedis
+
+
+def mock_redis(*get_values):
+    """Mock a Redis connection whose successive `GET`s return `get_values`."""
+    conn = mock.MagicMock()
+    conn.get.side_effect = get_values
+    conn.hget.return_value = None
+    conn.zrangebyscore.return_value = []
+    pipe = conn.pipeline.return_value.__enter__.return_value
+    return conn, pipe
+
+
+PARTS = ("sample", "pearson", "primary-hash", "dataset-hash", 500)
+
+
+@pytest.mark.unit_test
+def test_cache_key():
+    """Keys depend on everything that determines the results, and on the
+    generation of the cache."""
+    assert cache_key(0, PARTS) == cache_key(0, list(PARTS))
+    assert cache_key(0, PARTS).startswith("GN3::correlation-cache::sample::")
+    assert cache_key(1, PARTS) != cache_key(0, PARTS)
+    assert cache_key(0, PARTS[:-1] + (None,)) != cache_key(0, PARTS)
+    assert cache_key(0, ("sample", "spearman") + PARTS[2:]) != cache_key(
+        0, PARTS)
+
+
+@pytest.mark.unit_test
+def test_cache_hit():
+    """Cached results are returned without computing them, and counted as a
+    hit."""
+    conn, pipe = mock_redis(b"3", b'[{"T1": {"corr_coefficient": 0.5}}]')
+    compute = mock.Mock()
+    assert cached(conn, PARTS, compute, 60, 1000) == [
+        {"T1": {"corr_coefficient": 0.5}}]
+    compute.assert_not_called()
+    conn.get.assert_called_with(cache_key(3, PARTS))
+    pipe.hincrby.assert_called_with(correlation_cache.METRICS_KEY, "hits", 1)
+
+
+@pytest.mark.unit_test
+def test_cache_miss():
+    """Results are computed and stored on a miss, unless they are larger than
+    the whole cache."""
+    conn, pipe = mock_redis(None, None, b"14")
+    assert cached(conn, PARTS, lambda: [{"T1": 0.5}], 60, 1000) == [
+        {"T1": 0.5}]
+    pipe.hincrby.assert_called_with(correlation_cache.METRICS_KEY, "misses", 1)
+    pipe.set.assert_called_with(cache_key(0, PARTS), b'[{"T1": 0.5}]', ex=60)
+
+    conn, pipe = mock_redis(None, None, b"0")
+    assert cached(conn, PARTS, lambda: [{"T1": 0.5}], 60, 10) == [{"T1": 0.5}]
+    pipe.set.assert_not_called()
+
+
+@pytest.mark.unit_test
+def test_redis_unavailable():
+    """The results are computed as if there were no cache when Redis cannot
+    be reached."""
+    conn, _pipe = mock_redis(redis.ConnectionError("refused"))
+    assert cached(conn, PARTS, lambda: [{"T1": 0.5}], 60, 1000) == [
+        {"T1": 0.5}]
+    with mock.patch(
+            "gn3.correlation_cache.Redis.from_url",
+            side_effect=redis.ConnectionError("refused")):
+        correlation_cache.invalidate_correlation_cache()
+
+
+@pytest.mark.unit_test
+def test_dataset_generations():
+    """Edits bump the generation of their own dataset, and those of unknown
+    datasets bump the generation of all of them."""
+    conn = FakeRedis()
+    with mock.patch("gn3.correlation_cache.Redis.from_url", return_value=conn):
+        correlation_cache.invalidate_correlation_cache(datasets=("A", "A"))
+        assert [correlation_cache.dataset_generation(name)
+                for name in ("A", "B")] == [1, 0]
+        correlation_cache.invalidate_correlation_cache()
+        assert [correlation_cache.dataset_generation(name)
+                for name in ("A", "B")] == [2, 1]
+    assert conn.get(correlation_cache.GENERATION_KEY) == b"2"
@@ -0,0 +1,77 @@
+"""Tests for the long-running sample correlations service"""
+import os
+import tempfile
+import threading
+from multiprocessing.connection import Listener
+
+import pytest
+
+from gn3.exceptions import ServiceBusy
+from gn3.commands import request_sample_corrs
+from gn3.computations.correlations import compute_all_sample_correlation
+from sheepdog.correlation_service import CorrelationService, configured_authkey
+
+THIS_TRAIT = {
+    "trait_id": "primary",
+    "trait_sample_data": {
+        f"BXD{idx}": float(val) for idx, val in
+        enumerate((4.1, 5.6, 3.2, 1.1, 4.4, 2.2, 6.3, 5.0, 3.9), start=1)}}
+TARGET_DATASET = [
+    {"trait_id": "T1", "trait_sample_data": {
+        f"BXD{idx}": float(val) for idx, val in
+        enumerate((6.2, 5.7, 3.6, 1.5, 4.2, 2.3, 6.6, 4.1, 3.3), start=1)}},
+    {"trait_id": "T2", "trait_sample_data": {
+        f"BXD{idx}": float(val) for idx, val in
+        enumerate((1.2, 2.7, 8.6, 4.5, 4.2, 7.3, 1.6, 2.1, 3.3), start=1)}}]
+
+
+@pytest.fixture(scope="module")
+def correlation_service():
+    """Run the correlation service on a temporary socket."""
+    service = CorrelationService(workers=1, max_pending=1, admission_timeout=0.1)
+    with tempfile.TemporaryDirectory() as tempdir:
+        socket_path = os.path.join(tempdir, "corrs.sock")
+        with Listener(socket_path, family="AF_UNIX") as listener:
+            thread = threading.Thread(target=service.serve, args=(listener,))
+            thread.start()
+            yield service, socket_path
+            service.stop(listener)
+            thread.join()
+    service.shutdown()
+
+
+@pytest.mark.unit_test
+def test_service_computes_correlations(correlation_service):# pylint: disable=[redefined-outer-name]
+    """The service returns the same results as computing in-process."""
+    _service, socket_path = correlation_service
+    assert request_sample_corrs(
+        socket_path, "pearson", THIS_TRAIT, TARGET_DATASET, top_n=1) == (
+            compute_all_sample_correlation(
+                THIS_TRAIT, TARGET_DATASET, "pearson", top_n=1))
+
+
+@pytest.mark.unit_test
+def test_service_busy(correlation_service):# pylint: disable=[redefined-outer-name]
+    """Requests that cannot be admitted get a 'busy' response."""
+    service, socket_path = correlation_service
+    service.admission.acquire()
+    try:
+        with pytest.raises(ServiceBusy):
+            request_sample_corrs(
+                socket_path, "pearson", THIS_TRAIT, TARGET_DATASET)
+    finally:
+        service.admission.release()
+
+
+@pytest.mark.unit_test
+def test_authkey_is_read_from_the_settings(tmp_path, monkeypatch):
+    """The service's key is the web application's setting, with the secrets
+    file taking precedence."""
+    conf, secrets = tmp_path / "conf.py", tmp_path / "secrets.py"
+    conf.write_text('SAMPLE_CORRELATIONS_AUTHKEY = "from-conf"\n')
+    secrets.write_text('SAMPLE_CORRELATIONS_AUTHKEY = "from-secrets"\n')
+    monkeypatch.delenv("GN3_SECRETS", raising=False)
+    monkeypatch.setenv("GN3_CONF", str(conf))
+    assert configured_authkey() == b"from-conf"
+    monkeypatch.setenv("GN3_SECRETS", str(secrets))
+    assert configured_authkey() == b"from-secrets"
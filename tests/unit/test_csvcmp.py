@@ -3,6 +3,7 @@ import pytest
 
 from gn3.csvcmp import clean_csv_text
 from gn3.csvcmp import csv_diff
+from gn3.csvcmp import csv_diffs
 from gn3.csvcmp import extract_invalid_csv_headers
 from gn3.csvcmp import extract_strain_name
 from gn3.csvcmp import fill_csv
@@ -111,6 +112,63 @@ BXD15,14,x,x
     }
 
 
+@pytest.mark.unit_test
+def test_csv_diff_additions_and_deletions():
+    """Test csv diffing when strains are added, removed, or have all their
+    values set to, or from, missing ('x')"""
+    base_csv = """Strain Name,Value,SE,Count
+BXD1,18,x,0
+BXD12,x,x,x
+BXD14,15,x,x
+BXD15,14,x,x
+"""
+    delta_csv = """Strain Name,Value,SE,Count
+BXD1,18,x,0
+BXD12,16,x,x
+BXD14,x,x,x
+BXD16,12,1,x
+"""
+    assert csv_diff(base_csv=base_csv, delta_csv=delta_csv) == {
+        "Additions": ["BXD16,12,1,x", "BXD12,16,x,x"],
+        "Columns": "Strain Name,Value,SE,Count",
+        "Deletions": ["BXD15,14,x,x", "BXD14,15,x,x"],
+        "Modifications": [],
+    }
+
+
+@pytest.mark.unit_test
+def test_csv_diffs():
+    """The csvs of many traits are diffed in one call, by key"""
+    header = "Strain Name,Value,SE,Count"
+    assert csv_diffs({
+        "BXDPublish:10001": (f"{header}\nBXD1,18,x,0\n",
+                             f"{header}\nBXD1,19,x,0\n"),
+        "BXDPublish:10002": (f"{header}\nBXD1,18,x,0\n",
+                             f"{header}\nBXD1,18,x,0\nBXD2,11,x,x\n"),
+        "BXDPublish:10003": (f"{header}\nBXD1,18,x,0\n",
+                             f"{header}\nBXD1,18,x,0\n")}) == {
+            "BXDPublish:10001": {
+                "Additions": [], "Columns": header, "Deletions": [],
+                "Modifications": [{"Current": "BXD1,19,x,0",
+                                   "Original": "BXD1,18,x,0"}]},
+            "BXDPublish:10002": {
+                "Additions": ["BXD2,11,x,x"], "Columns": header,
+                "Deletions": [], "Modifications": []},
+            "BXDPublish:10003": {
+                "Additions": [], "Deletions": [], "Modifications": []}}
+
+
+@pytest.mark.unit_test
+def test_csv_diff_tmp_dir_is_deprecated():
+    """Passing the unused `tmp_dir` warns, but still diffs."""
+    with pytest.warns(DeprecationWarning, match="tmp_dir"):
+        assert csv_diff("Strain Name,Value,SE,Count\nBXD1,18,x,0",
+                        "Strain Name,Value,SE,Count\nBXD1,18,x,0",
+                        tmp_dir="/tmp") == {
+                            "Additions": [], "Deletions": [],
+                            "Modifications": []}
+
+
 @pytest.mark.unit_test
 def test_extract_strain_name():
     """Test that the strain's name is extracted given a csv header"""
@@ -0,0 +1,101 @@
+"""Tests for the precomputed matrices of target datasets"""
+import os
+import tempfile
+from unittest import mock
+
+import pytest
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from gn3 import phenodb
+from gn3 import dataset_matrices
+from scripts.dataset_matrices import build_matrices
+
+ROWS = (
+    ("1427571_at", "BXD2", 8.5), ("1427571_at", "BXD1", 7.25),
+    ("1415670_at", "BXD1", 9.0), ("1415670_at", "BXD5", 10.5),
+    ("1415670_at", "BXD2", 11.0))
+
+
+@pytest.fixture
+def matrices_dir():
+    """A directory to build the matrices in."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        yield tempdir
+    phenodb.clear_cache()
+
+
+@pytest.mark.unit_test
+def test_arrange_values():
+    """The values are arranged with a row per trait and a column per sample,
+    with NaN for missing values."""
+    traits, samples, matrix = dataset_matrices.arrange_values(ROWS)
+    assert traits == ["1427571_at", "1415670_at"]
+    assert samples == ["BXD1", "BXD2", "BXD5"]
+    assert_array_equal(
+        matrix, np.array([[7.25, 8.5, np.nan], [9.0, 11.0, 10.5]]))
+
+
+@pytest.mark.unit_test
+def test_dataset_matrix_is_built_on_demand(matrices_dir):# pylint: disable=[redefined-outer-name]
+    """The matrix is built the first time it is needed, reused while the data
+    is unchanged, and rebuilt once the data changes."""
+    versions = iter(("2:15", "2:15", "3:16"))
+    with (mock.patch(
+            "gn3.dataset_matrices.fetch_dataset_data_version",
+            side_effect=lambda *_args: next(versions)),
+          mock.patch(
+              "gn3.dataset_matrices.dataset_generation", return_value=4),
+          mock.patch(
+              "gn3.dataset_matrices.fetch_dataset_values",
+              side_effect=lambda *_args: iter(ROWS)) as fetch):
+        pheno = dataset_matrices.dataset_matrix(
+            mock.Mock(), matrices_dir, "HC_M2_0606_P")
+        assert pheno.traits == ["1427571_at", "1415670_at"]
+        assert pheno.metadata["data_version"] == "2:15:4"
+        assert_array_equal(pheno.row("1415670_at"), [9.0, 11.0, 10.5])
+
+        assert dataset_matrices.dataset_matrix(
+            mock.Mock(), matrices_dir, "HC_M2_0606_P") is pheno
+        assert fetch.call_count == 1
+
+        rebuilt = dataset_matrices.dataset_matrix(
+            mock.Mock(), matrices_dir, "HC_M2_0606_P")
+        assert fetch.call_count == 2
+        assert rebuilt.metadata["data_version"] == "3:16:4"
+        assert os.listdir(matrices_dir) == ["HC_M2_0606_P"]
+
+
+@pytest.mark.unit_test
+def test_dataset_matrix_without_version(matrices_dir):# pylint: disable=[redefined-outer-name]
+    """No matrix is built when the version of the data cannot be known."""
+    with (mock.patch(
+            "gn3.dataset_matrices.fetch_dataset_data_version",
+            return_value="2:15"),
+          mock.patch(
+              "gn3.dataset_matrices.dataset_generation", return_value=None)):
+        assert dataset_matrices.dataset_matrix(
+            mock.Mock(), matrices_dir, "HC_M2_0606_P") is None
+    assert dataset_matrices.dataset_matrix(
+        mock.Mock(), "", "HC_M2_0606_P") is None
+    assert os.listdir(matrices_dir) == []
+
+
+@pytest.mark.unit_test
+def test_build_matrices_reports_failures(matrices_dir, caplog):# pylint: disable=[redefined-outer-name]
+    """Datasets whose matrices cannot be written are logged, by name, and
+    counted as failures: the others are still built."""
+    def __build__(_conn, _matrices_dir, dataset_name, *_args):
+        if dataset_name == "BXDPublish":
+            raise OSError("No space left on device")
+        return f"{_matrices_dir}/{dataset_name}"
+
+    with (mock.patch(
+            "gn3.dataset_matrices.data_version", return_value="2:15:4"),
+          mock.patch("gn3.dataset_matrices.build_dataset_matrix",
+                     side_effect=__build__) as build):
+        assert build_matrices(mock.Mock(), mock.Mock(
+            datasets=["BXDPublish", "HC_M2_0606_P"], force=False,
+            matrices_dir=matrices_dir, redis_uri=None)) == 1
+    assert build.call_count == 2
+    assert "BXDPublish: could not write the matrix" in caplog.text
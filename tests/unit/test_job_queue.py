@@ -0,0 +1,213 @@
+"""Tests for the scheduling of queued commands"""
+import json
+from unittest import mock
+
+import pytest
+from flask import Flask
+
+from gn3.commands import queue_cmd
+from gn3.job_queue import (
+    JOB_CLASSES, dequeue, requeue, complete, queue_stats, command_class,
+    command_fingerprint, settle_fingerprint, dedup_key, attached_key,
+    claim_fingerprint)
+from tests.unit.fake_redis import FakeRedis
+
+QUEUE = "GN3::job-queue"
+IN_FLIGHT = f"{QUEUE}::in-flight::worker"
+PCORRS = ("python3", "-m", "scripts.partial_correlations", "1::T1", "1::T2",
+          "pearsons", "mysql://")
+AGAINST_DB = PCORRS + ("against-db", "HC_M2_0606_P", "--criteria", "500")
+GEMMA = "gemma-wrapper --json -- -g /tmp/geno.txt -p /tmp/pheno.txt -gk"
+
+
+def dequeue_all(conn, classes=None) -> list:
+    """Take the commands off the queue, in order, until none can be run."""
+    dequeued: list = []
+    while True:
+        item = dequeue(conn, QUEUE, IN_FLIGHT, classes)
+        if item is None:
+            return dequeued
+        dequeued.append(item)
+
+
+@pytest.mark.unit_test
+def test_command_class():
+    """The class of a command is found from the command itself."""
+    assert command_class(PCORRS + ("against-traits", "1::T3")) == (
+        "partial-correlations")
+    assert command_class(AGAINST_DB) == "partial-correlations-against-db"
+    assert command_class(GEMMA) == "gemma"
+    assert command_class(
+        "Rscript scripts/rqtl_wrapper.R --model normal") == "rqtl"
+    assert command_class("ls") == "default"
+
+
+@pytest.mark.unit_test
+def test_identical_commands_are_queued_in_an_app_context():
+    """Identical commands are only attached to each other when asked to, even
+    if an active app context enables the deduplication: the tests of the queue
+    must not depend on whether an earlier test left one active."""
+    conn = FakeRedis()
+    app = Flask(__name__)
+    app.config["ASYNC_JOB_DEDUP_TTL"] = 3600
+    with app.app_context():
+        against_db = [queue_cmd(conn, QUEUE, AGAINST_DB) for _ in range(2)]
+    assert against_db[0] != against_db[1]
+    assert [cmd_id for cmd_id, _cls in dequeue_all(conn)] == against_db
+
+
+@pytest.mark.unit_test
+def test_commands_are_dequeued_by_priority():
+    """The commands of the classes of higher priority are run first."""
+    conn = FakeRedis()
+    default = queue_cmd(conn, QUEUE, "ls")
+    against_db = queue_cmd(conn, QUEUE, AGAINST_DB)
+    gemma = queue_cmd(conn, QUEUE, GEMMA)
+    assert dequeue_all(conn) == [
+        (gemma, "gemma"),
+        (against_db, "partial-correlations-against-db"),
+        (default, "default")]
+    assert conn.lrange(IN_FLIGHT, 0, -1) == [
+        cmd_id.encode() for cmd_id in (gemma, against_db, default)]
+
+
+@pytest.mark.unit_test
+def test_running_commands_are_limited_per_class():
+    """No more than `max_running` commands of a class run at a time: the next
+    command of the class waits until a running one completes."""
+    conn = FakeRedis()
+    against_db = [queue_cmd(conn, QUEUE, AGAINST_DB) for _ in range(3)]
+    default = queue_cmd(conn, QUEUE, "ls")
+    assert [cmd_id for cmd_id, _cls in dequeue_all(conn)] == [
+        against_db[0], against_db[1], default]
+
+    complete(conn, QUEUE, IN_FLIGHT, against_db[0],
+             "partial-correlations-against-db")
+    assert dequeue_all(conn) == [
+        (against_db[2], "partial-correlations-against-db")]
+
+
+@pytest.mark.unit_test
+def test_users_are_served_in_turn():
+    """A user's many commands do not hold up those of the other users."""
+    conn = FakeRedis()
+    alices = [queue_cmd(conn, QUEUE, GEMMA, user="alice") for _ in range(3)]
+    bobs = queue_cmd(conn, QUEUE, GEMMA, user="bob")
+    assert [cmd_id for cmd_id, _cls in dequeue_all(conn)] == [
+        alices[0], bobs, alices[1], alices[2]]
+
+
+@pytest.mark.unit_test
+def test_requeued_commands_are_run_first():
+    """A command put back on the queue is the next one run for its user."""
+    conn = FakeRedis()
+    first, second = (queue_cmd(conn, QUEUE, "ls") for _ in range(2))
+    assert dequeue(conn, QUEUE, IN_FLIGHT) == (first, "default")
+    assert requeue(conn, QUEUE, IN_FLIGHT, first)
+    assert not requeue(conn, QUEUE, IN_FLIGHT, first)
+    assert dequeue_all(conn) == [(first, "default"), (second, "default")]
+
+
+@pytest.mark.unit_test
+def test_unclassified_commands_are_run_last():
+    """Commands put directly on the queue's list are still run."""
+    conn = FakeRedis()
+    conn.rpush(QUEUE, "cmd::old")
+    gemma = queue_cmd(conn, QUEUE, GEMMA)
+    assert dequeue_all(conn) == [(gemma, "gemma"), ("cmd::old", "default")]
+
+
+@pytest.mark.unit_test
+def test_queue_stats():
+    """The depth of the queue, the running commands and the wait times are
+    reported per class."""
+    conn = FakeRedis()
+    for _ in range(3):
+        queue_cmd(conn, QUEUE, AGAINST_DB)
+    queue_cmd(conn, QUEUE, GEMMA)
+    dequeue_all(conn)
+
+    stats = queue_stats(conn, QUEUE)
+    assert set(stats["classes"]) == set(JOB_CLASSES)
+    against_db = stats["classes"]["partial-correlations-against-db"]
+    assert {key: against_db[key] for key in (
+        "max_running", "running", "queued", "dequeued")} == {
+            "max_running": 2, "running": 2, "queued": 1, "dequeued": 2}
+    assert against_db["mean_wait_seconds"] >= 0
+    assert against_db["longest_wait_seconds"] >= 0
+    assert stats["classes"]["gemma"]["longest_wait_seconds"] is None
+    assert stats["classes"]["gemma"]["running"] == 1
+    assert stats["unclassified"] == 0
+    assert stats["workers"] == 0
+
+
+@pytest.mark.unit_test
+def test_identical_commands_are_attached(tmp_path):
+    """An identical command, with identical input files, is attached to the
+    command already queued rather than queued again."""
+    conn = FakeRedis()
+    pheno = tmp_path / "pheno.txt"
+    pheno.write_text("1\n2\n")
+    cmd = f"gemma-wrapper --json -- -p {pheno} -gk"
+    first = queue_cmd(conn, QUEUE, cmd, dedup_ttl=60)
+    assert queue_cmd(conn, QUEUE, cmd, dedup_ttl=60, user="bob",
+                     email="bob@example.org") == first
+    assert conn.hget(first, "attached") == b"1"
+    assert [json.loads(submitter) for submitter in conn.lrange(
+        attached_key(first), 0, -1)] == [
+            {"user": "bob", "email": "bob@example.org"}]
+    assert dequeue_all(conn) == [(first, "gemma")]
+
+    fingerprint = command_fingerprint(cmd)
+    pheno.write_text("1\n3\n")
+    assert command_fingerprint(cmd) != fingerprint
+    assert queue_cmd(conn, QUEUE, cmd, dedup_ttl=60) != first
+    assert queue_cmd(conn, QUEUE, cmd) != first
+
+
+@pytest.mark.unit_test
+def test_commands_depending_on_other_values_are_not_attached():
+    """Identical commands are only attached to each other if the other values
+    their results depend on, e.g. the correlation cache's generation, match."""
+    conn = FakeRedis()
+    first = queue_cmd(conn, QUEUE, AGAINST_DB, dedup_ttl=60, dedup_extra=(1,))
+    assert queue_cmd(
+        conn, QUEUE, AGAINST_DB, dedup_ttl=60, dedup_extra=(1,)) == first
+    assert queue_cmd(
+        conn, QUEUE, AGAINST_DB, dedup_ttl=60, dedup_extra=(2,)) != first
+
+
+@pytest.mark.unit_test
+def test_failed_commands_are_not_reused():
+    """A command that failed releases its fingerprint; one that succeeded keeps
+    it, and its results are reused."""
+    conn = FakeRedis()
+    failed = queue_cmd(conn, QUEUE, "ls", dedup_ttl=60)
+    conn.hset(failed, "status", "error")
+    settle_fingerprint(conn, QUEUE, failed, success=False)
+    assert not conn.exists(dedup_key(QUEUE, command_fingerprint("ls", (None,))))
+
+    succeeded = queue_cmd(conn, QUEUE, "ls", dedup_ttl=60)
+    assert succeeded != failed
+    conn.hset(succeeded, "status", "success")
+    settle_fingerprint(conn, QUEUE, succeeded, success=True)
+    assert queue_cmd(conn, QUEUE, "ls", dedup_ttl=60) == succeeded
+
+
+@pytest.mark.unit_test
+def test_fingerprint_is_claimed_once_the_command_is_recorded():
+    """The command is recorded as queued before its fingerprint is claimed, so
+    that an identical command submitted meanwhile is attached to it, rather
+    than taking the fingerprint over."""
+    conn = FakeRedis()
+    def __claim__(conn, job_queue, fingerprint, cmd_id, *args):
+        assert conn.hget(cmd_id, "status") == b"queued"
+        return claim_fingerprint(conn, job_queue, fingerprint, cmd_id, *args)
+
+    with mock.patch("gn3.commands.claim_fingerprint", side_effect=__claim__):
+        first = queue_cmd(conn, QUEUE, "ls", dedup_ttl=60)
+        attached = queue_cmd(conn, QUEUE, "ls", dedup_ttl=60)
+    assert attached == first
+    assert conn.get(dedup_key(QUEUE, command_fingerprint("ls"))) == (
+        first.encode())
+    assert dequeue_all(conn) == [(first, "default")]
@@ -0,0 +1,72 @@
+"""Tests for importing genotype files into LMDB"""
+import os
+import tempfile
+
+import pytest
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from gn3 import genodb
+from scripts.lmdb_matrix import (
+    read_genotype_file, import_genotype_file, create_database, genotype_db_get)
+
+GENOTYPE_FILE = """# File name: BXD_Geno-19Jan2017b_forGN.xls
+# Metadata: Please retain this header information
+@name:BXD
+@type:riset
+@mat:B
+@pat:D
+@het:H
+@unk:U
+
+Chr\tLocus\tcM\tMb\tBXD1\tBXD2\tBXD5\tBXD6
+1\trs31443144\t1.50\t3.01\tB\tB\tD\tH
+1\trs6269442\t1.50\t3.49\tD\tU\tD\tB
+1\trs32285189\t1.63\t3.53\tB\tB
+2\trs258367496\t1.63\t3.66\t1\t0\t0.95\tB
+
+"""
+
+
+@pytest.fixture
+def genotype_file():
+    """A small genotype file."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        geno_file = os.path.join(tempdir, "BXD.geno")
+        with open(geno_file, "w", encoding="utf-8") as stream:
+            stream.write(GENOTYPE_FILE)
+        yield geno_file
+
+
+@pytest.mark.unit_test
+def test_read_genotype_file(genotype_file):# pylint: disable=[redefined-outer-name]
+    """Genotype symbols are mapped to their codes, and incomplete marker rows
+    are skipped."""
+    genotype = read_genotype_file(genotype_file)
+    assert_array_equal(
+        genotype.matrix, np.array([[0, 0, 1, 2], [1, 3, 1, 0], [1, 0, 0, 0]]))
+    assert genotype.metadata["name"] == "BXD"
+    assert genotype.metadata["nrows"] == 3
+    assert genotype.metadata["individuals"] == ["BXD1", "BXD2", "BXD5", "BXD6"]
+    assert genotype.metadata["metadata_columns"] == ["Chr", "Locus", "cM", "Mb"]
+    assert genotype.metadata["Locus"] == [
+        "rs31443144", "rs6269442", "rs258367496"]
+    assert genotype.file_info["File name"] == " BXD_Geno-19Jan2017b_forGN.xls"
+
+
+@pytest.mark.unit_test
+def test_import_genotype_file(genotype_file):# pylint: disable=[redefined-outer-name]
+    """The imported matrix can be read with `gn3.genodb`, and re-importing a
+    file does not add a new version."""
+    expected = read_genotype_file(genotype_file).matrix
+    with tempfile.TemporaryDirectory() as lmdb_store:
+        stats = import_genotype_file(genotype_file, lmdb_store)
+        import_genotype_file(genotype_file, lmdb_store)
+        assert stats["rows"] == 3
+        with genodb.open(lmdb_store) as db:
+            matrix = genodb.matrix(db)
+            assert_array_equal(genodb.nparray(matrix), expected)
+            assert_array_equal(genodb.column(matrix, 1), expected[:, 1])
+            assert len(db.txn.get(b"versions")) == db.hash_length
+        with create_database(lmdb_store) as db:
+            assert_array_equal(genotype_db_get(db).matrix, expected)
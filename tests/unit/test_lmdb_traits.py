@@ -0,0 +1,125 @@
+"""Tests for the LMDB phenotype traits endpoints"""
+import io
+import os
+import tempfile
+
+import pytest
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from gn3 import phenodb
+from tests.unit.test_phenodb import VALUES, STRAINS, write_pheno_db
+
+
+@pytest.fixture
+def lmdb_data_path(fxtr_app_config):
+    """Point the application to a directory with a phenotype matrix
+    database."""
+    original = fxtr_app_config["LMDB_DATA_PATH"]
+    with tempfile.TemporaryDirectory() as tempdir:
+        write_pheno_db(os.path.join(tempdir, "BXDPublish"), VALUES, VALUES / 10)
+        write_pheno_db(os.path.join(tempdir, "LXSPublish"), VALUES)
+        fxtr_app_config["LMDB_DATA_PATH"] = tempdir
+        yield tempdir
+        fxtr_app_config["LMDB_DATA_PATH"] = original
+    phenodb.clear_cache()
+
+
+@pytest.mark.unit_test
+@pytest.mark.usefixtures("lmdb_data_path")
+def test_batch_traits_json(client):
+    """Many traits, across datasets, are returned column-wise."""
+    response = client.post("/api/lmdb/v1/data/traits", json={
+        "traits": ["BXDPublish_10002", "LXSPublish_10001", "BXDPublish_00001",
+                   "BXDPublish_10003", "OtherPublish_1"]})
+    assert response.status_code == 200
+    assert response.json["missing"] == ["BXDPublish_00001", "OtherPublish_1"]
+    bxd = response.json["datasets"]["BXDPublish"]
+    assert bxd["traits"] == ["10002", "10003"]
+    assert bxd["strains"] == STRAINS
+    assert bxd["values"] == [[2.0, 2.5, None, 1.0], [9.0, 8.0, 7.0, 6.0]]
+    assert bxd["se"] == [[0.2, 0.25, None, 0.1], [0.9, 0.8, 0.7, 0.6]]
+    lxs = response.json["datasets"]["LXSPublish"]
+    assert lxs["values"] == [[1.5, None, 3.0, 4.25]]
+    assert lxs["se"] is None
+
+
+@pytest.mark.unit_test
+@pytest.mark.usefixtures("lmdb_data_path")
+def test_batch_traits_npz(client):
+    """The traits can be fetched as a NumPy archive."""
+    response = client.post("/api/lmdb/v1/data/traits", json={
+        "traits": ["BXDPublish_10003", "BXDPublish_10001"], "format": "npz"})
+    assert response.status_code == 200
+    with np.load(io.BytesIO(response.data)) as archive:
+        assert list(archive["BXDPublish/traits"]) == ["10003", "10001"]
+        assert_array_equal(archive["BXDPublish/values"], VALUES[[2, 0]])
+        assert_array_equal(archive["BXDPublish/se"], VALUES[[2, 0]] / 10)
+        assert len(archive["missing"]) == 0
+
+
+@pytest.mark.unit_test
+@pytest.mark.parametrize(
+    "request_data",
+    ({}, {"traits": "BXDPublish_10001"}, {"traits": ["BXDPublish"]},
+     {"traits": [10001, None]},
+     {"traits": ["BXDPublish_10001"], "format": "xml"}))
+def test_batch_traits_invalid_request(client, request_data):
+    """Invalid requests are rejected."""
+    response = client.post("/api/lmdb/v1/data/traits", json=request_data)
+    assert response.status_code == 400
+
+
+@pytest.mark.unit_test
+@pytest.mark.usefixtures("lmdb_data_path")
+def test_lmdb_sample_correlation(client):
+    """The primary trait is correlated against a whole dataset's matrix; the
+    test dataset has too few strains for any trait to be kept."""
+    response = client.post("/api/correlation/sample_r/lmdb/pearson", json={
+        "this_trait": {"trait_id": "primary", "trait_sample_data": {
+            "BXD1": 1.0, "BXD2": 2.0, "BXD5": 3.0, "BXD6": 4.0,
+            "BXD9": 5.0}},
+        "target_dataset": "BXDPublish"})
+    assert response.status_code == 200
+    assert response.json == {"corr_results": []}
+
+
+@pytest.mark.unit_test
+@pytest.mark.usefixtures("lmdb_data_path")
+@pytest.mark.parametrize(
+    "corr_method,request_data,status_code",
+    (("bicor", {"this_trait": {"trait_sample_data": {}},
+                "target_dataset": "BXDPublish"}, 400),
+     ("pearson", {"target_dataset": "BXDPublish"}, 400),
+     ("pearson", {"this_trait": {"trait_sample_data": {}},
+                  "target_dataset": "OtherPublish"}, 404)))
+def test_lmdb_sample_correlation_errors(
+        client, corr_method, request_data, status_code):
+    """Invalid requests and unknown datasets are rejected."""
+    response = client.post(
+        f"/api/correlation/sample_r/lmdb/{corr_method}", json=request_data)
+    assert response.status_code == status_code
+
+
+@pytest.mark.unit_test
+@pytest.mark.usefixtures("lmdb_data_path")
+def test_stale_dataset_matrix_is_built_in_a_job(client, fxtr_app_config, mocker):
+    """A dataset's missing or out-of-date matrix is not built in the request:
+    its building is queued instead."""
+    mocker.patch.dict(fxtr_app_config, {"DATASET_MATRICES_DIR": "/tmp/matrices"})
+    mocker.patch("gn3.api.correlation.database_connection")
+    mocker.patch("gn3.api.correlation.redis.Redis.from_url")
+    mocker.patch("gn3.dataset_matrices.data_version", return_value="2:15:4")
+    build = mocker.patch("gn3.dataset_matrices.build_dataset_matrix")
+    run_async_cmd = mocker.patch("gn3.api.correlation.run_async_cmd")
+    response = client.post(
+        "/api/correlation/sample_r/lmdb/pearson",
+        json={"this_trait": {"trait_sample_data": {}},
+              "target_dataset": "HC_M2_0606_P"})
+    assert response.status_code == 404
+    build.assert_not_called()
+    cmd = run_async_cmd.call_args.kwargs["cmd"]
+    assert cmd[1:3] == ("-m", "scripts.dataset_matrices")
+    assert "HC_M2_0606_P" in cmd
+    assert run_async_cmd.call_args.kwargs["options"]["dedup_extra"] == (
+        "2:15:4",)
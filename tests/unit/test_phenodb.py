@@ -0,0 +1,93 @@
+"""Tests for the phenotype matrix database reader"""
+import os
+import json
+import tempfile
+
+import lmdb
+import pytest
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from gn3 import phenodb
+
+STRAINS = ["BXD1", "BXD2", "BXD5", "BXD6"]
+TRAITS = ["10001", "10002", "10003"]
+VALUES = np.array([
+    [1.5, np.nan, 3.0, 4.25],
+    [2.0, 2.5, np.nan, 1.0],
+    [9.0, 8.0, 7.0, 6.0]], dtype="<f8")
+
+
+def write_pheno_db(db_path, values, se_values=None):
+    """Write a phenotype matrix database in the format used by
+    `scripts/lmdb_phenotypes_matrix.py`."""
+    with lmdb.open(db_path, map_size=10 * 1024 * 1024, create=True) as env:
+        with env.begin(write=True) as txn:
+            txn.put(b"pheno_matrix", values.tobytes(order="C"))
+            txn.put(b"pheno_metadata", json.dumps({
+                "rows": values.shape[0], "columns": values.shape[1],
+                "dtype": str(values.dtype), "order": "C",
+                "traits": TRAITS, "strains": STRAINS,
+                "has_se": se_values is not None
+            }).encode("utf-8"))
+            if se_values is not None:
+                txn.put(b"pheno_se_matrix", se_values.tobytes(order="C"))
+
+
+@pytest.fixture
+def pheno_db_path():
+    """A temporary phenotype matrix database."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        db_path = os.path.join(tempdir, "BXDPublish")
+        write_pheno_db(db_path, VALUES, VALUES / 10)
+        yield db_path
+    phenodb.clear_cache()
+
+
+@pytest.mark.unit_test
+def test_read_rows(pheno_db_path):# pylint: disable=[redefined-outer-name]
+    """Rows are fetched by trait name."""
+    pheno = phenodb.reader(pheno_db_path)
+    assert pheno.strains == STRAINS
+    assert_array_equal(pheno.row("10002"), VALUES[1])
+    assert_array_equal(pheno.row("10002", phenodb.SE_KEY), VALUES[1] / 10)
+    assert_array_equal(pheno.rows(("10003", "10001")), VALUES[[2, 0]])
+    with pytest.raises(KeyError):
+        pheno.row("99999")
+
+
+@pytest.mark.unit_test
+def test_reader_is_cached(pheno_db_path):# pylint: disable=[redefined-outer-name]
+    """The same reader is returned until the database changes."""
+    pheno = phenodb.reader(pheno_db_path)
+    assert phenodb.reader(pheno_db_path) is pheno
+
+    os.utime(os.path.join(pheno_db_path, "data.mdb"), ns=(0, 0))
+    updated = phenodb.reader(pheno_db_path)
+    assert updated is not pheno
+    assert phenodb.reader(pheno_db_path) is updated
+
+
+@pytest.mark.unit_test
+def test_stale_reader_closes_after_reads(pheno_db_path):# pylint: disable=[redefined-outer-name]
+    """A replaced database is re-opened without waiting for the ongoing reads
+    of the stale reader, which is closed once they end; one changed in place
+    keeps its reader until the reads end."""
+    # Like the matrices written by `gn3.dataset_matrices`, which are only ever
+    # opened without LMDB's locking
+    os.remove(os.path.join(pheno_db_path, "lock.mdb"))
+    pheno = phenodb.reader(pheno_db_path)
+    with pheno.matrix() as matrix:
+        os.utime(os.path.join(pheno_db_path, "data.mdb"), ns=(0, 0))
+        assert phenodb.reader(pheno_db_path) is pheno
+
+        replacement = f"{pheno_db_path}-new"
+        write_pheno_db(replacement, VALUES[::-1])
+        os.replace(os.path.join(replacement, "data.mdb"),
+                   os.path.join(pheno_db_path, "data.mdb"))
+        updated = phenodb.reader(pheno_db_path)
+        assert updated is not pheno
+        assert_array_equal(matrix[2], VALUES[2])
+        assert_array_equal(updated.row("10003"), VALUES[0])
+    assert pheno.closed and pheno.active_reads == 0
+    assert_array_equal(pheno.row("10001"), VALUES[2])
@@ -0,0 +1,180 @@
+"""Tests for the pool of workers that run the queued commands"""
+import sys
+import threading
+from unittest import mock
+
+import pytest
+
+from gn3.commands import queue_cmd, run_async_cmd
+from gn3.computations.streaming import COMPLETION_MESSAGE
+from gn3.job_queue import (
+    live_workers, heartbeat_key, in_flight_key, user_queue_key, workers_key,
+    running_key)
+from sheepdog.worker import WorkerPool
+from tests.unit.fake_redis import FakeRedis
+
+QUEUE = "GN3::job-queue"
+
+
+def run_pool(pool: WorkerPool) -> threading.Thread:
+    """Run `pool` in the background."""
+    thread = threading.Thread(target=pool.run)
+    thread.start()
+    return thread
+
+
+def status(conn, cmd_id) -> bytes:
+    """The status of the command identified by `cmd_id`."""
+    return conn.hget(cmd_id, "status")
+
+
+@pytest.mark.unit_test
+def test_pool_runs_queued_commands():
+    """The pool runs the commands in its slots, records their results, and
+    unregisters itself once stopped."""
+    conn = FakeRedis()
+    ran = threading.Semaphore(0)
+
+    def __run_cmd__(cmd, **_kwargs):
+        ran.release()
+        return {"code": 0 if "ok" in cmd else 1, "output": cmd}
+
+    with mock.patch("gn3.commands.run_cmd", side_effect=__run_cmd__):
+        pool = WorkerPool(conn, QUEUE, slots=2, heartbeat_interval=0.05,
+                          dequeue_timeout=0.05)
+        thread = run_pool(pool)
+        cmd_ids = [queue_cmd(conn, QUEUE, cmd) for cmd in ("ok", "fails")]
+        assert all(ran.acquire(timeout=5)# pylint: disable=[consider-using-with]
+                   for _ in cmd_ids)
+        assert live_workers(conn, QUEUE) == (pool.worker_id,)
+        pool.stop()
+        thread.join(timeout=5)
+
+    assert [status(conn, cmd_id) for cmd_id in cmd_ids] == [
+        b"success", b"error"]
+    assert conn.hget(cmd_ids[1], "stderr") == b'"fails"'
+    assert live_workers(conn, QUEUE) == tuple()
+    assert not conn.exists(pool.in_flight)
+
+
+@pytest.mark.unit_test
+def test_stopped_pool_drains_running_commands():
+    """Once stopped, the pool completes the commands it is running, but takes
+    no new ones off the queue."""
+    conn = FakeRedis()
+    started, release = threading.Event(), threading.Event()
+
+    def __run_cmd__(cmd, **_kwargs):
+        started.set()
+        release.wait(timeout=5)
+        return {"code": 0, "output": cmd}
+
+    with mock.patch("gn3.commands.run_cmd", side_effect=__run_cmd__):
+        pool = WorkerPool(conn, QUEUE, slots=1, heartbeat_interval=0.05,
+                          dequeue_timeout=0.05)
+        thread = run_pool(pool)
+        running = queue_cmd(conn, QUEUE, "slow")
+        assert started.wait(timeout=5)
+        waiting = queue_cmd(conn, QUEUE, "next")
+        pool.stop()
+        assert conn.lrange(pool.in_flight, 0, -1) == [running.encode()]
+        release.set()
+        thread.join(timeout=5)
+
+    assert status(conn, running) == b"success"
+    assert status(conn, waiting) == b"queued"
+    assert conn.lrange(user_queue_key(QUEUE, "default", "anonymous"), 0, -1
+                       ) == [waiting.encode()]
+
+
+@pytest.mark.unit_test
+def test_one_shot_worker_runs_until_idle():
+    """A worker started in the one-shot mode runs the queued commands, then
+    exits."""
+    conn = FakeRedis()
+    cmd_ids = [queue_cmd(conn, QUEUE, cmd) for cmd in ("ls", "pwd")]
+    with mock.patch("gn3.commands.run_cmd",
+                    return_value={"code": 0, "output": ""}):
+        WorkerPool(conn, QUEUE, slots=1, until_idle=True).run()
+
+    assert [status(conn, cmd_id) for cmd_id in cmd_ids] == [
+        b"success", b"success"]
+    assert live_workers(conn, QUEUE) == tuple()
+
+
+@pytest.mark.unit_test
+def test_pool_recovers_commands_of_dead_workers():
+    """The commands left in-flight by a worker whose heartbeat has expired are
+    put back at the head of their queue; those of live workers are left
+    alone."""
+    conn = FakeRedis()
+    queued = queue_cmd(conn, QUEUE, "ls", user="alice")
+    conn.sadd(workers_key(QUEUE), "dead", "alive")
+    conn.set(heartbeat_key(QUEUE, "alive"), "alive", px=60000)
+    for worker, cmd_ids in (("dead", ("cmd::1", "cmd::2")),
+                            ("alive", ("cmd::3",))):
+        for cmd_id in cmd_ids:
+            conn.hset(cmd_id, mapping={
+                "status": "running", "class": "default", "user": "alice"})
+            conn.rpush(in_flight_key(QUEUE, worker), cmd_id)
+            conn.hincrby(running_key(QUEUE), "default", 1)
+
+    pool = WorkerPool(conn, QUEUE, slots=1)
+    assert pool.recover() == ["cmd::1", "cmd::2"]
+    assert conn.lrange(user_queue_key(QUEUE, "default", "alice"), 0, -1) == [
+        b"cmd::2", b"cmd::1", queued.encode()]
+    assert [status(conn, cmd_id) for cmd_id in ("cmd::1", "cmd::2", "cmd::3")
+            ] == [b"queued", b"queued", b"running"]
+    assert conn.hget(running_key(QUEUE), "default") == b"1"
+    assert conn.smembers(workers_key(QUEUE)) == {b"alive"}
+
+
+@pytest.mark.unit_test
+def test_run_async_cmd_uses_running_pool():
+    """No one-shot worker is started when a worker pool is serving the queue in
+    daemon mode."""
+    conn = FakeRedis()
+    with mock.patch("gn3.commands.subprocess.Popen") as popen:
+        run_async_cmd(conn, QUEUE, "ls")
+        assert popen.call_count == 1
+
+        WorkerPool(conn, QUEUE, slots=1, until_idle=True).beat()
+        run_async_cmd(conn, QUEUE, "ls")
+        assert popen.call_count == 2
+
+        WorkerPool(conn, QUEUE, slots=1).beat()
+        run_async_cmd(conn, QUEUE, "ls")
+        assert popen.call_count == 2
+
+
+@pytest.mark.unit_test
+def test_commands_with_a_log_file_stream_their_output(tmp_path):
+    """The output of a command queued with a log file is appended to the file as
+    the command runs, and the log is marked done once it completes."""
+    conn = FakeRedis()
+    log_file = tmp_path / "run.txt"
+    log_file.write_text("File created for streaming\n")
+    cmd_id = queue_cmd(
+        conn, QUEUE, [sys.executable, "-c", "print('mapping')"],
+        log_file=str(log_file))
+    WorkerPool(conn, QUEUE, slots=1, until_idle=True).run()
+
+    assert status(conn, cmd_id) == b"success"
+    assert log_file.read_text() == (
+        f"File created for streaming\nmapping\n{COMPLETION_MESSAGE}\n")
+
+
+@pytest.mark.unit_test
+def test_commands_that_cannot_run_end_their_log(tmp_path):
+    """A command that cannot be started is recorded as failed, and its log is
+    still marked done."""
+    conn = FakeRedis()
+    log_file = tmp_path / "run.txt"
+    log_file.write_text("File created for streaming\n")
+    cmd_id = queue_cmd(conn, QUEUE, [str(tmp_path / "no-such-command")],
+                       log_file=str(log_file))
+    WorkerPool(conn, QUEUE, slots=1, until_idle=True).run()
+
+    assert status(conn, cmd_id) == b"error"
+    assert b"FileNotFoundError" in conn.hget(cmd_id, "result")
+    assert log_file.read_text().endswith(f"{COMPLETION_MESSAGE}\n")